@@ -0,0 +1,86 @@
+#! python3
+# Micro-benchmark of the reverse lookups of Cin (isHaveKey/getKey/getCharEncode)
+#
+# Looks up random characters of several tables of different sizes with the
+# reverse index of Cin (or of RCin/HCin, the reverse lookup and homophone
+# tables, with --class) and with a full scan of chardefs (the previous
+# implementation). The time per lookup of the index should not depend on the
+# size of the table while the scan grows with it. The one-time cost of
+# building the index is reported separately.
+#
+# usage: python benchmarks/bench_reverse_lookup.py [-n 2000] [--class cin|rcin|hcin] [tables...]
+
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Cin() saves the count file of the table, keep it away from the user data
+os.environ["PIME_DATA_ROOT"] = tempfile.mkdtemp(prefix="pime-bench-")
+
+from cinbase.cin import Cin
+from cinbase.rcin import RCin
+from cinbase.hcin import HCin
+
+JSON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cinbase", "json")
+
+CLASSES = {
+    "cin": lambda fs: Cin(fs, "checj", True),
+    "rcin": lambda fs: RCin(fs, "checj"),
+    "hcin": lambda fs: HCin(fs, "checj"),
+}
+
+
+def scan_is_have_key(cin, val):
+    return True if [key for key, value in cin.chardefs.items() if val in value] else False
+
+
+def scan_get_key(cin, val):
+    return [key for key, value in cin.chardefs.items() if val in value][0]
+
+
+def time_per_call(func, cin, chars):
+    start = time.perf_counter()
+    for char in chars:
+        func(cin, char)
+    return (time.perf_counter() - start) / len(chars)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the reverse lookups of Cin")
+    parser.add_argument("-n", "--count", type=int, default=2000, help="number of lookups with the index")
+    parser.add_argument("--scan-count", type=int, default=20, help="number of lookups with a full scan")
+    parser.add_argument("--class", dest="cls", choices=sorted(CLASSES), default="cin", help="table class to measure")
+    parser.add_argument("tables", nargs="*", default=["simplex.json", "array30.json", "mscj3-ext.json", "checj.json"])
+    args = parser.parse_args()
+
+    random.seed(0)
+    print("%-16s %8s %8s %10s %12s %12s %12s %12s" % ("table", "keys", "chars", "build ms",
+          "isHaveKey us", "getKey us", "encode us", "scan us"))
+    for table in args.tables:
+        with io.open(os.path.join(JSON_DIR, table), encoding="utf-8") as fs:
+            cin = CLASSES[args.cls](fs)
+        start = time.perf_counter()
+        index = cin.getReverseIndex()
+        build = time.perf_counter() - start
+
+        # getCharEncode() needs the key names of all the codes
+        chars = [char for char in index if all(name in cin.keynames for code in cin.getCodes(char) for name in code)]
+        chars = random.choices(chars, k=args.count)
+        have_key = time_per_call(type(cin).isHaveKey, cin, chars)
+        get_key = time_per_call(type(cin).getKey, cin, chars)
+        encode = time_per_call(type(cin).getCharEncode, cin, chars)
+        for char in chars[:args.scan_count]:
+            assert scan_get_key(cin, char) == cin.getKey(char)
+        scan = time_per_call(scan_is_have_key, cin, chars[:args.scan_count])
+        print("%-16s %8d %8d %10.1f %12.2f %12.2f %12.2f %12.0f" % (table, len(cin.chardefs), len(index), build * 1000,
+              have_key * 1e6, get_key * 1e6, encode * 1e6, scan * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#! python3
+# Micro-benchmark of the stdin/stdout I/O path of server.py
+#
+# Feeds synthetic filterKeyDown/onKeyDown requests of several clients through
+# Server.run() and reports the number of requests handled per second.
+# The clients use the base TextService so the result mostly reflects the cost
+# of framing, JSON parsing/serialization and writing the replies.
+#
+# usage: python benchmarks/bench_server_io.py [-n 100000] [-c 8] [--pipe]
+
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server
+from textService import TextService
+
+
+def make_requests(count, num_clients):
+    key_states = [0] * 256
+    lines = []
+    for i in range(count):
+        method = "filterKeyDown" if i % 2 == 0 else "onKeyDown"
+        msg = {
+            "method": method,
+            "seqNum": i,
+            "charCode": 0x61 + (i // 2) % 26,
+            "keyCode": 0x41 + (i // 2) % 26,
+            "repeatCount": 1,
+            "scanCode": 30,
+            "isExtended": False,
+            "keyStates": key_states,
+        }
+        line = "%d|%s\n" % (i // 2 % num_clients, json.dumps(msg))
+        lines.append(line.encode("UTF-8"))
+    return b"".join(lines)
+
+
+def make_server(input, output, num_clients):
+    srv = server.Server(input, output)
+    for i in range(num_clients):
+        client = server.Client(srv)
+        client.service = TextService(client)
+        srv.clients[str(i)] = client
+    return srv
+
+
+def run_in_memory(data, num_clients):
+    output = io.BytesIO()
+    srv = make_server(io.BytesIO(data), output, num_clients)
+    start = time.perf_counter()
+    srv.run()
+    elapsed = time.perf_counter() - start
+    return elapsed, output.getvalue().count(b"PIME_MSG|")
+
+
+def run_with_pipes(data, num_clients):
+    in_r, in_w = os.pipe()
+    out_r, out_w = os.pipe()
+    counter = {"replies": 0}  # all the output lines are replies since sys.stdout is redirected
+
+    def writer():
+        with os.fdopen(in_w, "wb") as f:
+            f.write(data)
+
+    def reader():
+        with os.fdopen(out_r, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                counter["replies"] += chunk.count(b"\n")
+
+    threads = [threading.Thread(target=writer), threading.Thread(target=reader)]
+    with os.fdopen(in_r, "rb") as input, os.fdopen(out_w, "wb") as output:
+        srv = make_server(input, output, num_clients)
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        srv.run()
+        elapsed = time.perf_counter() - start
+    for t in threads:
+        t.join()
+    return elapsed, counter["replies"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the I/O path of server.py")
+    parser.add_argument("-n", "--requests", type=int, default=100000)
+    parser.add_argument("-c", "--clients", type=int, default=8)
+    parser.add_argument("--pipe", action="store_true", help="use OS pipes instead of in-memory streams")
+    args = parser.parse_args()
+
+    data = make_requests(args.requests, args.clients)
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()  # discard "new client" and other messages
+    try:
+        if args.pipe:
+            elapsed, replies = run_with_pipes(data, args.clients)
+        else:
+            elapsed, replies = run_in_memory(data, args.clients)
+    finally:
+        sys.stdout = stdout
+    print("%d requests, %d replies in %.3f s: %.0f requests/s" % (args.requests, replies, elapsed, args.requests / elapsed))
+
+
+if __name__ == "__main__":
+    main()
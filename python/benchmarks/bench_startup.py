@@ -0,0 +1,59 @@
+#! python3
+# Startup time of the python server
+#
+# Measures the wall time of importing serviceManager and server in fresh
+# python processes, with a cold manifest cache (removed before each run) and
+# with a warm one. The time of an empty python process is subtracted.
+#
+# usage: python benchmarks/bench_startup.py [-n 10]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(code, env):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=PYTHON_DIR, env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def measure(code, env, count, cache_file=None):
+    times = []
+    for i in range(count):
+        if cache_file and os.path.exists(cache_file):
+            os.remove(cache_file)
+        times.append(run_python(code, env))
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the startup time of the python server")
+    parser.add_argument("-n", "--count", type=int, default=10, help="number of runs of each case")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_file = os.path.join(temp_dir, "services.json")
+        env = dict(os.environ)
+        env["PIME_MANIFEST_CACHE"] = cache_file
+        env.pop("PIME_WARM_SERVICES", None)
+
+        baseline = measure("pass", env, args.count)
+        print("empty python process: %.1f ms" % (baseline * 1000))
+        for module in ("serviceManager", "server"):
+            code = "import %s" % module
+            run_python(code, env)  # compile the .pyc files first
+            cold = measure(code, env, args.count, cache_file) - baseline
+            warm = measure(code, env, args.count) - baseline
+            print("import %-16s cold manifest: %6.1f ms, warm manifest: %6.1f ms" % (module, cold * 1000, warm * 1000))
+
+
+if __name__ == "__main__":
+    main()
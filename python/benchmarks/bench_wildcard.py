@@ -0,0 +1,121 @@
+#! python3
+# Micro-benchmark of Cin.getWildcardCharDefs()
+#
+# Runs wildcard queries made from random keys of several tables with the
+# wildcard index of Cin and with the previous implementation (sorting all the
+# keys and matching each of them with a regex), and checks that both return
+# the same candidates. The one-time cost of building the index is reported
+# separately. Queries with the multi-character wildcard have no previous
+# implementation and are only timed.
+#
+# usage: python benchmarks/bench_wildcard.py [-n 200] [-m 50] [tables...]
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Cin() saves the count file of the table, keep it away from the user data
+os.environ["PIME_DATA_ROOT"] = tempfile.mkdtemp(prefix="pime-bench-")
+
+from cinbase.cin import Cin
+from cinbase.cintable import loadTable
+
+JSON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cinbase", "json")
+
+
+# the previous implementation of Cin.getWildcardCharDefs()
+def scan_wildcard(cin, CompositionChar, WildcardChar, candMaxItems):
+    wildcardchardefs = []
+    lowFrequencyChardefs = {}
+    highFrequencyCharSetList = ["bopomofo", "bopomofoTone", "cjk", "big5F", "big5LF", "big5S"]
+    lowFrequencyCharSetList = ["cjkExtA", "cjkExtB", "cjkExtC", "cjkExtD", "cjkExtE", "cjkExtF", "cjkCIibm", "pua", "cjkOther"]
+    for i in range(len(lowFrequencyCharSetList)):
+        lowFrequencyChardefs[i] = []
+
+    matchstring = CompositionChar
+    for char in ['\\', '.', '*', '?', '+', '[', '{', '|', '(', ')', '^', '$']:
+        if char in matchstring and not char == WildcardChar:
+            matchstring = matchstring.replace(char, '\\' + char)
+    matchstring = matchstring.replace(WildcardChar, '(.)')
+    sortedchardefs = sorted(cin.chardefs.keys())
+    matchchardefs = [cin.chardefs[key] for key in sortedchardefs
+                     if re.match('^' + matchstring + '$', key) and len(key) == len(CompositionChar)]
+
+    for chardef in matchchardefs:
+        for matchstr in chardef:
+            charSet = cin.getCharSet(matchstr[0])
+            if charSet in highFrequencyCharSetList:
+                wildcardchardefs.append(matchstr)
+                if len(wildcardchardefs) >= candMaxItems:
+                    return wildcardchardefs
+            else:
+                i = lowFrequencyCharSetList.index(charSet)
+                if not matchstr in lowFrequencyChardefs[i]:
+                    lowFrequencyChardefs[i].append(matchstr)
+    for key in lowFrequencyChardefs:
+        for char in lowFrequencyChardefs[key]:
+            if not char in wildcardchardefs:
+                wildcardchardefs.append(char)
+            if len(wildcardchardefs) >= candMaxItems:
+                return wildcardchardefs
+    return wildcardchardefs
+
+
+def make_patterns(keys, count, wildcard):
+    patterns = []
+    for key in random.sample(keys, count):
+        chars = list(key)
+        for pos in random.sample(range(len(chars)), random.randint(1, len(chars))):
+            chars[pos] = wildcard
+        patterns.append("".join(chars))
+    return patterns
+
+
+def time_per_call(func, patterns):
+    start = time.perf_counter()
+    for pattern in patterns:
+        func(pattern)
+    return (time.perf_counter() - start) / len(patterns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the wildcard queries of Cin")
+    parser.add_argument("-n", "--count", type=int, default=200, help="number of queries with the index")
+    parser.add_argument("--scan-count", type=int, default=20, help="number of queries with the previous implementation")
+    parser.add_argument("-m", "--cand-max-items", type=int, default=50)
+    parser.add_argument("tables", nargs="*", default=["simplex.json", "array30.json", "mscj3-ext.json", "checj.json"])
+    args = parser.parse_args()
+
+    random.seed(0)
+    cacheDir = tempfile.mkdtemp(prefix="pime-bench-")
+    print("%-16s %8s %10s %12s %12s %12s" % ("table", "keys", "build ms", "index us", "multi us", "scan us"))
+    for table in args.tables:
+        cin = Cin(loadTable(os.path.join(JSON_DIR, table), cacheDir), "checj", True)
+        keys = [key for key in cin.chardefs if not "*" in key]
+        patterns = make_patterns(keys, args.count, "*")
+        multiPatterns = [pattern.replace("**", "?") for pattern in patterns]
+
+        start = time.perf_counter()
+        cin.getWildcardIndex()
+        for length in cin.wildcardIndex.lengths:
+            cin.wildcardIndex.getPostings(length)
+        build = time.perf_counter() - start
+
+        maxItems = args.cand_max_items
+        for pattern in patterns[:args.scan_count]:
+            assert cin.getWildcardCharDefs(pattern, "*", maxItems) == scan_wildcard(cin, pattern, "*", maxItems), pattern
+        index = time_per_call(lambda pattern: cin.getWildcardCharDefs(pattern, "*", maxItems), patterns)
+        multi = time_per_call(lambda pattern: cin.getWildcardCharDefs(pattern, "*", maxItems, "?"), multiPatterns)
+        scan = time_per_call(lambda pattern: scan_wildcard(cin, pattern, "*", maxItems), patterns[:args.scan_count])
+        print("%-16s %8d %10.1f %12.1f %12.1f %12.0f" % (table, len(cin.chardefs), build * 1000,
+              index * 1e6, multi * 1e6, scan * 1e6))
+
+
+if __name__ == "__main__":
+    main()
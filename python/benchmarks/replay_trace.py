@@ -0,0 +1,148 @@
+#! python3
+# Replay a trace recorded with PIME_TRACE_FILE through Server/Client
+#
+# The requests are handled by real text services, as fast as possible by
+# default or at the recorded pace with --realtime. The latency of each
+# request is reported per method and the replies are compared with the
+# recorded ones of the same client.
+# With --realtime, the latency is measured from the recorded arrival time
+# of the request so the time spent waiting for the previous requests is
+# included, just like what the user feels.
+#
+# usage: python benchmarks/replay_trace.py trace.log [--realtime] [-r 1] [--show-diffs 5]
+
+import argparse
+import collections
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.pop("PIME_TRACE_FILE", None)  # do not record the replay itself
+
+import server
+from perfStats import LatencyHistogram
+
+
+# returns the requests [(timestamp, line)] and the replies {client_id: [json]}
+def load_trace(filename):
+    requests = []
+    replies = collections.defaultdict(list)
+    with open(filename, "rb") as f:
+        for record in f:
+            record = record.rstrip(b"\r\n")
+            if not record:
+                continue
+            kind, timestamp, line = record.split(b" ", 2)
+            if kind == b"Q":
+                requests.append((int(timestamp), line))
+            elif kind == b"R":
+                client_id, reply = line.split(b"|", 1)
+                replies[client_id.decode("UTF-8")].append(reply)
+    return requests, replies
+
+
+def parse_request(line):
+    client_id, msg = line.split(b"|", 1)
+    try:
+        msg = json.loads(msg)
+    except ValueError:
+        msg = None
+    if isinstance(msg, list):
+        method = "batch"
+    elif isinstance(msg, dict):
+        method = msg.get("method", "")
+    else:
+        method = "invalid"
+    return client_id.decode("UTF-8").strip(), method
+
+
+def replay(requests, realtime):
+    output = io.BytesIO()
+    srv = server.Server(io.BytesIO(), output)
+    histograms = collections.defaultdict(LatencyHistogram)
+    start = time.perf_counter_ns()
+    first = requests[0][0] if requests else 0
+    for timestamp, line in requests:
+        method = parse_request(line)[1]
+        scheduled = start + timestamp - first
+        if realtime:
+            delay = scheduled - time.perf_counter_ns()
+            if delay > 0:
+                time.sleep(delay / 1e9)
+        begin = time.perf_counter_ns()
+        try:
+            srv.handle_line(line)
+        except Exception as e:
+            # same as Server.run() except that we never exit
+            srv.handle_error(e, line)
+        end = time.perf_counter_ns()
+        elapsed = max(end - (scheduled if realtime else begin), 0) // 1000
+        histograms[method].record(elapsed)
+        histograms["*"].record(elapsed)
+    total = time.perf_counter_ns() - start
+    return total, histograms, output.getvalue()
+
+
+# compare the replies of each client with the recorded ones
+def compare_replies(data, expected, show_diffs):
+    actual = collections.defaultdict(list)
+    for line in data.split(b"\n"):
+        if line.startswith(b"PIME_MSG|"):
+            client_id, reply = line[9:].split(b"|", 1)
+            actual[client_id.decode("UTF-8")].append(reply)
+    compared = mismatched = 0
+    for client_id in sorted(set(expected) | set(actual)):
+        a = actual.get(client_id, [])
+        e = expected.get(client_id, [])
+        if len(a) != len(e):
+            mismatched += 1
+            if mismatched <= show_diffs:
+                print("client %s: %d replies, %d recorded" % (client_id, len(a), len(e)))
+        for i, (reply, recorded) in enumerate(zip(a, e)):
+            reply = json.loads(reply)
+            recorded = json.loads(recorded)
+            if isinstance(recorded, dict) and "stats" in recorded:
+                continue  # statistics differ in every run
+            compared += 1
+            if reply != recorded:
+                mismatched += 1
+                if mismatched <= show_diffs:
+                    print("client %s, reply #%d differs:" % (client_id, i))
+                    print("  recorded:", json.dumps(recorded, ensure_ascii=False))
+                    print("  replayed:", json.dumps(reply, ensure_ascii=False))
+    return compared, mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a PIME_TRACE_FILE trace")
+    parser.add_argument("trace", help="trace file recorded with PIME_TRACE_FILE")
+    parser.add_argument("--realtime", action="store_true", help="replay the requests at the recorded pace")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="number of replays")
+    parser.add_argument("--show-diffs", type=int, default=5, help="number of mismatched replies to print")
+    args = parser.parse_args()
+
+    requests, expected = load_trace(args.trace)
+    print("%d requests, %d clients" % (len(requests), len(expected)))
+    stdout = sys.stdout
+    for i in range(args.repeat):
+        sys.stdout = io.StringIO()  # hide the messages printed by the text services
+        try:
+            total, histograms, data = replay(requests, args.realtime)
+        finally:
+            sys.stdout = stdout
+        print("replay #%d: %.3f s" % (i + 1, total / 1e9))
+        print("  %-28s %8s %8s %8s %8s %8s %8s" % ("method", "count", "mean", "p50", "p90", "p99", "max"))
+        for method in sorted(histograms, key=lambda m: (m != "*", m)):
+            s = histograms[method].toJson()
+            print("  %-28s %8d %8.1f %8d %8d %8d %8d" % (method, s["count"], s["mean_us"],
+                s["p50_us"], s["p90_us"], s["p99_us"], s["max_us"]))
+        compared, mismatched = compare_replies(data, expected, args.show_diffs)
+        print("  replies: %d compared, %d mismatched" % (compared, mismatched))
+
+
+if __name__ == "__main__":
+    main()
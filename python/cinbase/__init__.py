@@ -22,11 +22,11 @@ import io
 import sys
 import math
 import copy
-import ctypes
-import winsound
 import threading
-from ctypes import windll
+from concurrent.futures import Future
+import platformShim
 from .cin import Cin
+from .cintable import loadTable
 from .rcin import RCin
 from .hcin import HCin
 from .swkb import swkb
@@ -42,6 +42,7 @@ from .extendtable import extendtable
 from .config import SWITCH_LANG_WITH_BOTH_SHIFT, SWITCH_LANG_WITH_LEFT_SHIFT, SWITCH_LANG_WITH_RIGHT_SHIFT
 
 from .debug import Debug
+from perfStats import perfStats
 
 CHINESE_MODE = 1
 ENGLISH_MODE = 0
@@ -68,6 +69,38 @@ ID_LITTLEDICT = 11
 ID_PROVERBDICT = 12
 ID_OUTPUT_SIMP_CHINESE = 13
 
+# 直接複製到 TextService 的設定值
+CONFIG_ATTRS = (
+    "candPerPage",                  # 每頁顯示幾個候選字
+    "outputSmallLetterWithShift",   # 押住 Shift 輸出英文時預設小寫?
+    "switchPageWithSpace",          # 使用空白鍵作為候選清單換頁鍵?
+    "enableSwitchTCSC",             # 使用 Ctrl+F12 切換繁體/簡體?
+    "fullShapeSymbols",             # Shift 輸入全形標點?
+    "directOutFSymbols",            # 直接輸出全形標點首個候選符號?
+    "easySymbolsWithShift",         # Shift 快速輸入符號?
+    "messageDurationTime",          # 提示訊息顯示時間?
+    "hidePromptMessages",           # 隱藏提示訊息?
+    "showPhrase",                   # 輸出字串後顯示聯想字詞?
+    "sortByPhrase",                 # 優先以聯想字詞排序候選清單?
+    "autoClearCompositionChar",     # 拆錯字碼時自動清除輸入字串?
+    "playSoundWhenNonCand",         # 拆錯字碼時發出警告嗶聲提示?
+    "directShowCand",               # 直接顯示候選字清單 (不須按空白鍵)?
+    "directCommitSymbol",           # 標點符號自動確認輸入?
+    "directOutMSymbols",            # 允許內建符號輸入方式連續輸入?
+    "supportWildcard",              # 支援以萬用字元代替組字字根?
+    "candMaxItems",                 # 最大候選字個數?
+    "compositionBufferMode",        # 啟用組字編輯模式?
+    "autoMoveCursorInBrackets",     # 自動移動組字游標至括號中間?
+    "imeReverseLookup",             # 反查輸入法字根
+    "selRCinType",
+    "homophoneQuery",               # 同音字查詢
+    "selHCinType",
+    "ignorePrivateUseArea",         # 載入碼表時忽略 Unicode 私用區?
+    "userExtendTable",              # 擴充碼表?
+    "reLoadTable",
+    "priorityExtendTable",
+)
+
 
 class CinBase:
     def __init__(self):
@@ -75,13 +108,23 @@ class CinBase:
         self.icondir = os.path.join(os.path.dirname(__file__), "icons")
         self.candselKeys = "1234567890"
 
-        with io.open(os.path.join(os.path.dirname(__file__), "data", "emoji.json"), 'r', encoding='utf8') as fs:
-            self.emoji = emoji(fs)
+        # 表情符號資料在第一次開啟表情符號選單時才載入
+        self._emoji = None
+        self._emojiLock = threading.Lock()
 
         self.emojimenulist = ["表情符號", "圖形符號", "其它符號", "雜錦符號", "交通運輸", "調色盤"]
         self.imeNameList = ["checj", "chephonetic", "chearray", "chedayi", "cheez", "chepinyin", "chesimplex", "cheliu"]
         self.hcinFileList = ["thphonetic.json", "CnsPhonetic.json", "bpmf.json"]
 
+    @property
+    def emoji(self):
+        if self._emoji is None:
+            with self._emojiLock:
+                if self._emoji is None:
+                    with io.open(os.path.join(os.path.dirname(__file__), "data", "emoji.json"), 'r', encoding='utf8') as fs:
+                        self._emoji = emoji(fs)
+        return self._emoji
+
     # 初始化輸入行為設定
     def initTextService(self, cbTS, TextService):
         cbTS.TextService = TextService
@@ -188,7 +231,6 @@ class CinBase:
         cbTS.showMessageOnKeyUp = False
         cbTS.hideMessageOnKeyUp = False
         cbTS.onKeyUpMessage = ""
-        cbTS.reLoadCinTable = False
         cbTS.RCinFileNotExist = False
         cbTS.capsStates = True if self.getKeyState(VK_CAPITAL) else False
 
@@ -209,6 +251,26 @@ class CinBase:
             cbTS.debugLog = cbTS.debug.loadDebugLog()
 
 
+    # 使用共享的輸入法碼表，碼表正在載入時不等待，載入完成後才設定 cbTS.cin
+    def attachCinTable(self, cbTS, CinTable):
+        def onLoaded(future):
+            if future.exception() is None:
+                cbTS.cin = CinTable.cin
+
+        with tableLock:
+            if CinTable.loading:
+                CinTable.callbacks.append(onLoaded)
+                return
+        cbTS.cin = CinTable.cin
+
+
+    # 碼表載入失敗的原因，沒有失敗時傳回 None
+    def getCinTableError(self, CinTable):
+        if CinTable.future is not None and CinTable.future.done():
+            return CinTable.future.exception()
+        return None
+
+
     # 輸入法被使用者啟用
     def onActivate(self, cbTS):
         cfg = cbTS.cfg
@@ -311,8 +373,11 @@ class CinBase:
         if cbTS.lastKeyDownTime == 0.0:
             cbTS.lastKeyDownTime = time.time()
 
-        if CinTable.loading:
-            return True
+        # 重新載入碼表時繼續使用舊的碼表，只有第一次載入碼表時不能輸入
+        if getattr(cbTS, 'cin', None) is None:
+            if CinTable.cin is None:
+                return CinTable.loading # 載入失敗時按鍵交給應用程式處理
+            cbTS.cin = CinTable.cin
 
         # 使用者開始輸入，還沒送出前的編輯區內容稱 composition string
         # isComposing() 是 False，表示目前編輯區是空的
@@ -425,12 +490,22 @@ class CinBase:
         charStr = chr(charCode)
         charStrLow = charStr.lower()
 
-        if CinTable.loading:
-            if not cbTS.client.isUiLess:
-                messagestr = '正在載入輸入法碼表，請稍候...'
-                cbTS.isShowMessage = True
-                cbTS.showMessage(messagestr, cbTS.messageDurationTime)
-            return True
+        # 重新載入碼表時繼續使用舊的碼表，只有第一次載入碼表時不能輸入
+        if getattr(cbTS, 'cin', None) is None:
+            if CinTable.cin is None:
+                if CinTable.loading:
+                    if not cbTS.client.isUiLess:
+                        messagestr = '正在載入輸入法碼表，請稍候...'
+                        cbTS.isShowMessage = True
+                        cbTS.showMessage(messagestr, cbTS.messageDurationTime)
+                    return True
+
+                if not cbTS.client.isUiLess and self.getCinTableError(CinTable) is not None:
+                    messagestr = '輸入法碼表載入失敗：' + str(self.getCinTableError(CinTable))
+                    cbTS.isShowMessage = True
+                    cbTS.showMessage(messagestr, cbTS.messageDurationTime)
+                return False
+            cbTS.cin = CinTable.cin
 
         # NumPad 某些狀況允許輸入法處理
         if keyEvent.isKeyToggled(VK_NUMLOCK): # NumLock is on
@@ -1768,6 +1843,7 @@ class CinBase:
                                     # 如果使用打繁出簡，就轉成簡體中文
                                     if cbTS.outputSimpChinese:
                                         commitStr = cbTS.opencc.convert(commitStr)
+                                        perfStats.increment("openccConversions")
 
                                     if cbTS.compositionBufferMode:
                                         RemoveStringLength = 0
@@ -2022,7 +2098,7 @@ class CinBase:
                                     self.removeCompositionBufferString(cbTS, RemoveStringLength, True)
                                 self.resetComposition(cbTS)
                             if cbTS.playSoundWhenNonCand:
-                                winsound.PlaySound('alert', winsound.SND_ASYNC)
+                                platformShim.playSound('alert')
                 elif cbTS.useEndKey and charStr in cbTS.endKeyList:
                     if len(candidates) == 0:
                         if not len(cbTS.compositionChar) == 1 and not cbTS.compositionChar == charStrLow:
@@ -2037,7 +2113,7 @@ class CinBase:
                                     self.removeCompositionBufferString(cbTS, RemoveStringLength, True)
                                 self.resetComposition(cbTS)
                             if cbTS.playSoundWhenNonCand:
-                                winsound.PlaySound('alert', winsound.SND_ASYNC)
+                                platformShim.playSound('alert')
 
                 cbTS.setShowCandidates(False)
                 cbTS.isShowCandidates = False
@@ -2405,25 +2481,25 @@ class CinBase:
             python_exe = sys.executable  # 找到 python 執行檔
             # 使用我們自帶的 python runtime exe 執行 config tool
             # 此處也可以用 subprocess，不過使用 windows API 比較方便
-            r = windll.shell32.ShellExecuteW(None, "open", python_exe, config_tool, self.cinbasecurdir, 0)  # SW_HIDE = 0 (hide the window)
+            r = platformShim.shellExecute(python_exe, config_tool, self.cinbasecurdir)
         elif commandId == ID_MODE_ICON: # windows 8 mode icon
             self.toggleLanguageMode(cbTS)  # 切換中英文模式
         elif commandId == ID_WEBSITE: # visit chewing website
-            os.startfile("https://github.com/EasyIME/PIME")
+            platformShim.startFile("https://github.com/EasyIME/PIME")
         elif commandId == ID_BUGREPORT: # visit bug tracker page
-            os.startfile("https://github.com/EasyIME/PIME/issues")
+            platformShim.startFile("https://github.com/EasyIME/PIME/issues")
         elif commandId == ID_FORUM:
-            os.startfile("https://github.com/EasyIME/forum")
+            platformShim.startFile("https://github.com/EasyIME/forum")
         elif commandId == ID_MOEDICT: # a very awesome online Chinese dictionary
-            os.startfile("https://www.moedict.tw/")
+            platformShim.startFile("https://www.moedict.tw/")
         elif commandId == ID_DICT: # online Chinese dictonary
-            os.startfile("http://dict.revised.moe.edu.tw/cbdic/")
+            platformShim.startFile("http://dict.revised.moe.edu.tw/cbdic/")
         elif commandId == ID_SIMPDICT: # a simplified version of the online dictonary
-            os.startfile("http://dict.concised.moe.edu.tw/jbdic/")
+            platformShim.startFile("http://dict.concised.moe.edu.tw/jbdic/")
         elif commandId == ID_LITTLEDICT: # a simplified dictionary for little children
-            os.startfile("http://dict.mini.moe.edu.tw/cgi-bin/gdic/gsweb.cgi?o=ddictionary")
+            platformShim.startFile("http://dict.mini.moe.edu.tw/cgi-bin/gdic/gsweb.cgi?o=ddictionary")
         elif commandId == ID_PROVERBDICT: # a dictionary for proverbs (seems to be broken at the moment?)
-            os.startfile("http://dict.idioms.moe.edu.tw/cydic/")
+            platformShim.startFile("http://dict.idioms.moe.edu.tw/cydic/")
         elif commandId == ID_OUTPUT_SIMP_CHINESE:  # 切換簡體中文輸出
             self.setOutputSimplifiedChinese(cbTS, not cbTS.outputSimpChinese)
 
@@ -2584,7 +2660,7 @@ class CinBase:
                 python_exe = sys.executable  # 找到 python 執行檔
                 # 使用我們自帶的 python runtime exe 執行 config tool
                 # 此處也可以用 subprocess，不過使用 windows API 比較方便
-                r = windll.shell32.ShellExecuteW(None, "open", python_exe, config_tool, self.cinbasecurdir, 0)  # SW_HIDE = 0 (hide the window)
+                r = platformShim.shellExecute(python_exe, config_tool, self.cinbasecurdir)
             elif commandId == 1:
                 self.setOutputSimplifiedChinese(cbTS, not cbTS.outputSimpChinese)
         elif commandType == 1: # 功能開關
@@ -2797,12 +2873,13 @@ class CinBase:
             yield l[i:i+n]
 
     def getKeyState(self, keyCode):
-        return ctypes.WinDLL("User32.dll").GetKeyState(keyCode)
+        return platformShim.getKeyState(keyCode)
 
     # https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getasynckeystate
     # 當 keyCode 對應的按鍵、曾被按下觸發過，GetAsyncKeyState() 的回傳值會 >= 1
+    # 無視窗環境 (headless) 下則依據按鍵事件的 keyStates 判斷
     def isPressed(self, keyCode):
-        return windll.user32.GetAsyncKeyState(keyCode) >= 1
+        return platformShim.isPressed(keyCode)
 
     def setCompositionBufferString(self, cbTS, compositionString, removeStringLength):
         compPos1 = cbTS.compositionBufferCursor - removeStringLength
@@ -2885,6 +2962,7 @@ class CinBase:
         # 如果使用打繁出簡，就轉成簡體中文
         if cbTS.outputSimpChinese:
             commitStr = cbTS.opencc.convert(commitStr)
+            perfStats.increment("openccConversions")
 
         if not cbTS.compositionBufferMode:
             cbTS.setCommitString(commitStr)
@@ -2991,6 +3069,41 @@ class CinBase:
             self.resetComposition(cbTS)
 
 
+    # 保存輸入狀態快照 (伺服器回收閒置的 TextService 時使用)
+    # 只保留中英/全半形模式和組字狀態，碼表和符號表等資料會在重建時重新載入
+    def getSnapshot(self, cbTS, TextService):
+        snapshot = TextService.getSnapshot(cbTS)
+        snapshot.update({
+            "langMode": cbTS.langMode,
+            "shapeMode": cbTS.shapeMode,
+            "outputSimpChinese": cbTS.outputSimpChinese,
+            "compositionChar": cbTS.compositionChar,
+            "compositionBufferString": cbTS.compositionBufferString,
+            "compositionBufferCursor": cbTS.compositionBufferCursor,
+            "compositionBufferType": cbTS.compositionBufferType,
+            "compositionBufferChar": dict(cbTS.compositionBufferChar),
+            "lastCommitString": cbTS.lastCommitString,
+        })
+        return snapshot
+
+
+    # 從快照還原輸入狀態
+    def restoreSnapshot(self, cbTS, TextService, snapshot):
+        TextService.restoreSnapshot(cbTS, snapshot)
+        cbTS.langMode = snapshot.get("langMode", cbTS.langMode)
+        cbTS.shapeMode = snapshot.get("shapeMode", cbTS.shapeMode)
+        if snapshot.get("outputSimpChinese", False) != cbTS.outputSimpChinese:
+            self.setOutputSimplifiedChinese(cbTS, snapshot["outputSimpChinese"])
+        cbTS.compositionChar = snapshot.get("compositionChar", "")
+        cbTS.compositionBufferString = snapshot.get("compositionBufferString", "")
+        cbTS.compositionBufferCursor = snapshot.get("compositionBufferCursor", 0)
+        cbTS.compositionBufferType = snapshot.get("compositionBufferType", "default")
+        cbTS.compositionBufferChar = dict(snapshot.get("compositionBufferChar", {}))
+        cbTS.lastCommitString = snapshot.get("lastCommitString", "")
+        cbTS.initCinBaseState = True
+        self.updateLangButtons(cbTS)
+
+
     ################################################################
     # config 相關
     ################################################################
@@ -3070,123 +3183,67 @@ class CinBase:
         cbTS.initCinBaseState = True
 
 
+    # 預先建立的 TextService 交給 client 使用
+    # 建立時套用的設定是以暫用的 client 為準 (非 UiLess 模式)，改用新的 client 重新套用
+    def attachClient(self, cbTS, TextService, client):
+        TextService.attachClient(cbTS, client)
+        cbTS.appliedConfig = None
+        self.applyConfig(cbTS)
+
+
     def applyConfig(self, cbTS):
-        cfg = cbTS.cfg # 所有 TextService 共享一份設定物件
+        cfg = cbTS.cfg # 同一輸入法的所有 TextService 共享一份設定快照
         cbTS.configVersion = cfg.getVersion()
 
-        # 每列顯示幾個候選字
-        cbTS.candPerRow = cfg.candPerRow
+        # 只套用和上次套用的設定快照不同的設定值
+        lastCfg = getattr(cbTS, "appliedConfig", None)
+        if lastCfg is cfg:
+            return
+        changed = lambda name: lastCfg is None or getattr(lastCfg, name) != getattr(cfg, name)
+
+        for name in CONFIG_ATTRS:
+            if changed(name):
+                setattr(cbTS, name, getattr(cfg, name))
 
-        # 如果程式為 UiLess 模式就取代設定
-        if cbTS.client.isUiLess:
-            cbTS.candPerRow = 1
+        # 每列顯示幾個候選字
+        if changed("candPerRow"):
+            cbTS.candPerRow = cfg.candPerRow
 
-        # 每頁顯示幾個候選字
-        cbTS.candPerPage = cfg.candPerPage
+            # 如果程式為 UiLess 模式就取代設定
+            if cbTS.client.isUiLess:
+                cbTS.candPerRow = 1
 
         # 設定 UI 外觀
-        cbTS.customizeUI(candFontSize = cfg.fontSize,
-                        candFontName = 'MingLiu',
-                        candPerRow = cfg.candPerRow,
-                        candUseCursor = cfg.cursorCandList)
+        if changed("fontSize") or changed("candPerRow") or changed("cursorCandList"):
+            cbTS.customizeUI(candFontSize = cfg.fontSize,
+                            candFontName = 'MingLiu',
+                            candPerRow = cfg.candPerRow,
+                            candUseCursor = cfg.cursorCandList)
 
         # 設定選字按鍵 (123456..., asdf.... 等)
         # if cbTS.cin.getSelection():
         #     cbTS.setSelKeys(cbTS.cin.getSelection())
 
-        # 押住 Shift 輸出英文時預設小寫?
-        cbTS.outputSmallLetterWithShift = cfg.outputSmallLetterWithShift
-
-        # 使用空白鍵作為候選清單換頁鍵?
-        cbTS.switchPageWithSpace = cfg.switchPageWithSpace
-
         # 轉換輸出成簡體中文?
-        self.setOutputSimplifiedChinese(cbTS, cfg.outputSimpChinese)
-
-        # 使用 Ctrl+F12 切換繁體/簡體?
-        cbTS.enableSwitchTCSC = cfg.enableSwitchTCSC
-
-        # Shift 輸入全形標點?
-        cbTS.fullShapeSymbols = cfg.fullShapeSymbols
-
-        # 直接輸出全形標點首個候選符號?
-        cbTS.directOutFSymbols = cfg.directOutFSymbols
-
-        # Shift 快速輸入符號?
-        cbTS.easySymbolsWithShift = cfg.easySymbolsWithShift
-
-        # 提示訊息顯示時間?
-        cbTS.messageDurationTime = cfg.messageDurationTime
-
-        # 隱藏提示訊息?
-        cbTS.hidePromptMessages = cfg.hidePromptMessages
-
-        # 輸出字串後顯示聯想字詞?
-        cbTS.showPhrase = cfg.showPhrase
-
-        # 優先以聯想字詞排序候選清單?
-        cbTS.sortByPhrase = cfg.sortByPhrase
-
-        # 拆錯字碼時自動清除輸入字串?
-        cbTS.autoClearCompositionChar = cfg.autoClearCompositionChar
-
-        # 拆錯字碼時發出警告嗶聲提示?
-        cbTS.playSoundWhenNonCand  = cfg.playSoundWhenNonCand 
-
-        # 直接顯示候選字清單 (不須按空白鍵)?
-        cbTS.directShowCand = cfg.directShowCand
-
-        # 標點符號自動確認輸入?
-        cbTS.directCommitSymbol = cfg.directCommitSymbol
-
-        # 允許內建符號輸入方式連續輸入?
-        cbTS.directOutMSymbols = cfg.directOutMSymbols
-
-        # 支援以萬用字元代替組字字根?
-        cbTS.supportWildcard = cfg.supportWildcard
+        if changed("outputSimpChinese"):
+            self.setOutputSimplifiedChinese(cbTS, cfg.outputSimpChinese)
 
         # 使用的萬用字元?
-        if cfg.selWildcardType == 0:
-            cbTS.selWildcardChar = 'z'
-        elif cfg.selWildcardType == 1:
-            cbTS.selWildcardChar = '*'
-
-        # 最大候選字個數?
-        cbTS.candMaxItems = cfg.candMaxItems
-
-        # 啟用組字編輯模式?
-        cbTS.compositionBufferMode = cfg.compositionBufferMode
-
-        # 自動移動組字游標至括號中間?
-        cbTS.autoMoveCursorInBrackets = cfg.autoMoveCursorInBrackets
-
-        # 反查輸入法字根
-        cbTS.imeReverseLookup = cfg.imeReverseLookup
-        cbTS.selRCinType = cfg.selRCinType
+        if changed("selWildcardType"):
+            if cfg.selWildcardType == 0:
+                cbTS.selWildcardChar = 'z'
+            elif cfg.selWildcardType == 1:
+                cbTS.selWildcardChar = '*'
 
-        # 同音字查詢
-        cbTS.homophoneQuery = cfg.homophoneQuery
-        cbTS.selHCinType = cfg.selHCinType
-
-        # 載入碼表時忽略 Unicode 私用區?
-        cbTS.ignorePrivateUseArea = cfg.ignorePrivateUseArea
-
-        # 擴充碼表?
-        cbTS.userExtendTable = cfg.userExtendTable
-        cbTS.reLoadTable = cfg.reLoadTable
-        cbTS.priorityExtendTable = cfg.priorityExtendTable
-
-        # 訊息顯示時間?
-        cbTS.messageDurationTime = cfg.messageDurationTime
-
-        if cbTS.imeDirName == "chedayi":
+        if cbTS.imeDirName == "chedayi" and changed("selDayiSymbolCharType"):
             cbTS.selDayiSymbolCharType = cfg.selDayiSymbolCharType
 
+        cbTS.appliedConfig = cfg
+
 
     # 檢查設定檔是否有被更改，是否需要套用新設定
     def checkConfigChange(self, cbTS, CinTable, RCinTable, HCinTable):
-        cfg = cbTS.cfg # 所有 TextService 共享一份設定物件
-        cfg.update() # 更新設定檔狀態
+        cfg = cbTS.cfg = cbTS.sharedConfig.get() # 換成最新的設定快照
         reLoadCinTable = False
         updateExtendTable = False
 
@@ -3196,38 +3253,40 @@ class CinBase:
                     cbTS.cin.saveCountFile()
 
         # 如果有更換輸入法碼表，就重新載入碼表資料
+        # 碼表載入失敗時，除非使用者要求重新載入，否則在更換碼表前不再重新載入
         if not CinTable.loading:
-            if not CinTable.curCinType == cfg.selCinType:
+            loadFailed = CinTable.failedCinType == cfg.selCinType
+
+            if not CinTable.curCinType == cfg.selCinType and not loadFailed:
                 reLoadCinTable = True
 
-            if not CinTable.ignorePrivateUseArea == cfg.ignorePrivateUseArea:
+            if not CinTable.ignorePrivateUseArea == cfg.ignorePrivateUseArea and not loadFailed:
                 reLoadCinTable = True
 
             if cfg.reLoadTable:
                 updateExtendTable = True
                 reLoadCinTable = True
-                cfg.reLoadTable = False
-                cfg.save()
+                cfg = cbTS.cfg = cbTS.sharedConfig.modify(save=True, reLoadTable=False)
 
-            if not CinTable.userExtendTable == cfg.userExtendTable:
+            if not CinTable.userExtendTable == cfg.userExtendTable and not loadFailed:
                 updateExtendTable = True
                 reLoadCinTable = True
 
-            if not CinTable.priorityExtendTable == cfg.priorityExtendTable:
+            if not CinTable.priorityExtendTable == cfg.priorityExtendTable and not loadFailed:
                 if cfg.userExtendTable:
                     reLoadCinTable = True
 
         if cfg.imeReverseLookup or cbTS.imeReverseLookup:
             # 載入反查輸入法碼表
             if not RCinTable.loading and not CinTable.loading:
-                if not RCinTable.curCinType == cfg.selRCinType or RCinTable.cin is None:
+                if (not RCinTable.curCinType == cfg.selRCinType or RCinTable.cin is None) and not RCinTable.failedCinType == cfg.selRCinType:
                     loadRCinFile = LoadRCinTable(cbTS, RCinTable)
                     loadRCinFile.start()
 
         if cfg.homophoneQuery or cbTS.homophoneQuery:
             # 載入同音字碼表
             if not HCinTable.loading and not CinTable.loading:
-                if not HCinTable.curCinType == cfg.selHCinType or HCinTable.cin is None:
+                if (not HCinTable.curCinType == cfg.selHCinType or HCinTable.cin is None) and not HCinTable.failedCinType == cfg.selHCinType:
                     loadHCinFile = LoadHCinTable(cbTS, HCinTable)
                     loadHCinFile.start()
 
@@ -3247,12 +3306,10 @@ class CinBase:
                 extendtablePath = cfg.findFile(datadirs, "extendtable.dat")
                 with io.open(extendtablePath, encoding='utf-8') as fs:
                     cbTS.extendtable = extendtable(fs)
-            if reLoadCinTable:
-                cbTS.reLoadCinTable = True
             loadCinFile = LoadCinTable(cbTS, CinTable)
             loadCinFile.start()
         else:
-            if not cbTS.cin == CinTable.cin:
+            if not getattr(cbTS, 'cin', None) == CinTable.cin:
                 cbTS.cin = CinTable.cin
 
         if DEBUG_MODE:
@@ -3276,54 +3333,102 @@ class LoadPhraseData(threading.Thread):
         self.cbTS = cbTS
         self.PhraseData = PhraseData
 
+    # 同時只啟動一個載入執行緒，已經在載入時傳回 False
+    def start(self):
+        with tableLock:
+            if self.PhraseData.loading:
+                return False
+            self.PhraseData.loading = True
+        threading.Thread.start(self)
+        return True
+
     def run(self):
-        self.PhraseData.loading = True
-        cfg = self.cbTS.cfg
-        datadirs = (cfg.getConfigDir(), cfg.getDataDir())
+        try:
+            cfg = self.cbTS.cfg
+            datadirs = (cfg.getConfigDir(), cfg.getDataDir())
 
-        if hasattr(self.PhraseData.phrase, '__del__'):
-            self.PhraseData.phrase.__del__()
+            if hasattr(self.PhraseData.phrase, '__del__'):
+                self.PhraseData.phrase.__del__()
 
-        self.PhraseData.phrase = None
+            self.PhraseData.phrase = None
 
-        phrasePath = cfg.findFile(datadirs, "phrase.json")
-        with io.open(phrasePath, 'r', encoding='utf8') as fs:
-            self.PhraseData.phrase = phrase(fs)
-        self.PhraseData.loading = False
+            phrasePath = cfg.findFile(datadirs, "phrase.json")
+            with io.open(phrasePath, 'r', encoding='utf8') as fs:
+                self.PhraseData.phrase = phrase(fs)
+        finally:
+            self.PhraseData.loading = False
 
 
-class LoadCinTable(threading.Thread):
-    def __init__(self, cbTS, CinTable):
+# 在背景執行緒載入碼表
+# 開始載入時 table.future 換成新的 concurrent.futures.Future，載入完成 (或失敗)
+# 時設定結果 (或例外)，等待中的 TextService 的 callback 在載入完成後執行一次。
+# tableLock 保護碼表的載入狀態和等待中的 callback，處理要求的執行緒和預先建立
+# TextService 的執行緒同時要載入碼表時，只有一個會啟動載入執行緒。
+tableLock = threading.Lock()
+
+
+class LoadTableThread(threading.Thread):
+    def __init__(self, cbTS, table):
         threading.Thread.__init__(self)
         self.cbTS = cbTS
-        self.CinTable = CinTable
+        self.table = table
+
+    # 在呼叫端設定載入狀態，同時只啟動一個載入執行緒，已經在載入時傳回 False
+    def start(self):
+        with tableLock:
+            if self.table.loading:
+                return False
+            self.table.loading = True
+            self.table.future = Future()
+            self.table.callbacks = []
+        threading.Thread.start(self)
+        return True
 
     def run(self):
+        future = self.table.future
+        try:
+            self.load()
+        except Exception as e:
+            # 記錄載入失敗的碼表，避免每次按鍵都重新載入
+            self.table.failedCinType = self.getCinType()
+            future.set_exception(e)
+        else:
+            self.table.failedCinType = None
+            future.set_result(self.table.cin)
+        finally:
+            # callback 只執行一次，執行後不再保留等待中的 TextService
+            with tableLock:
+                callbacks = self.table.callbacks
+                self.table.callbacks = []
+                self.table.loading = False
+            for callback in callbacks:
+                callback(future)
+
+    def getCinType(self):
+        return None
+
+    def load(self):
+        pass
+
+
+class LoadCinTable(LoadTableThread):
+    def __init__(self, cbTS, CinTable):
+        LoadTableThread.__init__(self, cbTS, CinTable)
+        self.CinTable = CinTable
+
+    def getCinType(self):
+        return self.cbTS.cfg.selCinType
+
+    def load(self):
         if DEBUG_MODE:
             self.cbTS.debug.setStartTimer("LoadCinTable")
 
-        self.CinTable.loading = True
+        perfStats.increment("cinTableLoads")
         if self.cbTS.cfg.selCinType >= len(self.cbTS.cinFileList):
-            self.cbTS.cfg.selCinType = 0
+            self.cbTS.cfg = self.cbTS.sharedConfig.modify(selCinType=0)
         selCinFile = self.cbTS.cinFileList[self.cbTS.cfg.selCinType]
         jsonPath = os.path.join(self.cbTS.jsondir, selCinFile)
 
-        if self.cbTS.reLoadCinTable or not hasattr(self.cbTS, 'cin'):
-            self.cbTS.reLoadCinTable = False
-
-            if hasattr(self.cbTS, 'cin'):
-                self.cbTS.cin.__del__()
-            if hasattr(self.CinTable.cin, '__del__'):
-                self.CinTable.cin.__del__()
-
-            self.cbTS.cin = None
-            self.CinTable.cin = None
-
-            with io.open(jsonPath, 'r', encoding='utf8') as fs:
-                self.cbTS.cin = Cin(fs, self.cbTS.imeDirName, self.cbTS.ignorePrivateUseArea)
-            self.CinTable.cin = self.cbTS.cin
-            self.CinTable.curCinType = self.cbTS.cfg.selCinType
-
         if not hasattr(self.cbTS, 'extendtable'):
             if self.cbTS.cfg.userExtendTable:
                 datadirs = (self.cbTS.cfg.getConfigDir(), self.cbTS.cfg.getDataDir())
@@ -3332,21 +3437,28 @@ class LoadCinTable(threading.Thread):
                     self.cbTS.extendtable = extendtable(fs)
             else:
                 self.cbTS.extendtable = {}
-        self.cbTS.cin.updateCinTable(self.cbTS.cfg.userExtendTable, self.cbTS.cfg.priorityExtendTable, self.cbTS.extendtable, self.cbTS.cfg.ignorePrivateUseArea)
+
+        # 在背景建立完整的新碼表，建立期間所有 TextService 繼續使用舊的碼表
+        # 使用編譯過的碼表 (第一次載入時編譯到快取目錄)
+        cin = Cin(loadTable(jsonPath, platformShim.getDataDir("cache")), self.cbTS.imeDirName, self.cbTS.ignorePrivateUseArea)
+        cin.updateCinTable(self.cbTS.cfg.userExtendTable, self.cbTS.cfg.priorityExtendTable, self.cbTS.extendtable, self.cbTS.cfg.ignorePrivateUseArea)
+
+        # 換成新的碼表，其他 TextService 在下次按鍵時換成新的碼表
+        self.CinTable.cin = cin
+        self.cbTS.cin = cin
+        self.CinTable.curCinType = self.cbTS.cfg.selCinType
         self.CinTable.userExtendTable = self.cbTS.cfg.userExtendTable
         self.CinTable.priorityExtendTable = self.cbTS.cfg.priorityExtendTable
         self.CinTable.ignorePrivateUseArea = self.cbTS.cfg.ignorePrivateUseArea
-        self.CinTable.loading = False
 
         if DEBUG_MODE:
             self.cbTS.debug.setEndTimer("LoadCinTable")
             self.cbTS.debugLog[time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()) + " [C]"] = self.cbTS.debug.info['brand'] + ":「" + self.cbTS.debug.jsonNameDict[selCinFile] + "」碼表載入時間約為 " + self.cbTS.debug.getDurationTime("LoadCinTable") + " 秒"
 
 
-class LoadRCinTable(threading.Thread):
+class LoadRCinTable(LoadTableThread):
     def __init__(self, cbTS, RCinTable):
-        threading.Thread.__init__(self)
-        self.cbTS = cbTS
+        LoadTableThread.__init__(self, cbTS, RCinTable)
         self.RCinTable = RCinTable
         self.rcinFileList = ([
                                 "checj.json", "mscj3.json", "mscj3-ext.json", "cj-ext.json", "cnscj.json", "thcj.json", "newcj3.json", "cj5.json", "newcj.json", "scj6.json", "cj-fast.json",
@@ -3359,57 +3471,53 @@ class LoadRCinTable(threading.Thread):
                                 "liu.json"
                             ])
 
-    def run(self):
+    def getCinType(self):
+        return self.cbTS.cfg.selRCinType
+
+    def load(self):
         if DEBUG_MODE:
             self.cbTS.debug.setStartTimer("LoadRCinTable")
 
-        self.RCinTable.loading = True
+        perfStats.increment("rcinTableLoads")
         selCinFile = self.rcinFileList[self.cbTS.cfg.selRCinType]
         jsonPath = os.path.join(self.cbTS.jsondir, selCinFile)
 
-        if self.RCinTable.cin is not None and hasattr(self.RCinTable.cin, '__del__'):
-            self.RCinTable.cin.__del__()
-
-        self.RCinTable.cin = None
-
+        # 建立新碼表期間繼續使用舊的碼表
         if os.path.exists(jsonPath):
             self.cbTS.RCinFileNotExist = False
             with io.open(jsonPath, 'r', encoding='utf8') as fs:
                 self.RCinTable.cin = RCin(fs, self.cbTS.imeDirName)
         else:
             self.cbTS.RCinFileNotExist = True
-            
+            self.RCinTable.cin = None
+
         self.RCinTable.curCinType = self.cbTS.cfg.selRCinType
-        self.RCinTable.loading = False
 
         if DEBUG_MODE:
             self.cbTS.debug.setEndTimer("LoadRCinTable")
             self.cbTS.debugLog[time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()) + " [R]"] = self.cbTS.debug.info['brand'] + ":「" + self.cbTS.debug.jsonNameDict[selCinFile] + "」反查碼表載入時間約為 " + self.cbTS.debug.getDurationTime("LoadRCinTable") + " 秒"
 
 
-class LoadHCinTable(threading.Thread):
+class LoadHCinTable(LoadTableThread):
     def __init__(self, cbTS, HCinTable):
-        threading.Thread.__init__(self)
-        self.cbTS = cbTS
+        LoadTableThread.__init__(self, cbTS, HCinTable)
         self.HCinTable = HCinTable
 
-    def run(self):
+    def getCinType(self):
+        return self.cbTS.cfg.selHCinType
+
+    def load(self):
         if DEBUG_MODE:
             self.cbTS.debug.setStartTimer("LoadHCinTable")
 
-        self.HCinTable.loading = True
+        perfStats.increment("hcinTableLoads")
         selCinFile = CinBase.hcinFileList[self.cbTS.cfg.selHCinType]
         jsonPath = os.path.join(self.cbTS.jsondir, selCinFile)
 
-        if self.HCinTable.cin is not None and hasattr(self.HCinTable.cin, '__del__'):
-            self.HCinTable.cin.__del__()
-
-        self.HCinTable.cin = None
-
+        # 建立新碼表期間繼續使用舊的碼表
         with io.open(jsonPath, 'r', encoding='utf8') as fs:
             self.HCinTable.cin = HCin(fs, self.cbTS.imeDirName)
         self.HCinTable.curCinType = self.cbTS.cfg.selHCinType
-        self.HCinTable.loading = False
 
         if DEBUG_MODE:
             self.cbTS.debug.setEndTimer("LoadHCinTable")
@@ -0,0 +1,119 @@
+#! python3
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# 字元所屬的字元集
+#
+# 載入碼表時 (Cin 建立時，在載入碼表的執行緒中) 以 initTable() 建立 U+0000 ~ U+2FFFF
+# 的對照表 (每個字元一個 byte 的字元集編號)，按鍵時查詢字元集只需要一次索引，
+# 不必再比對範圍或轉換成 Big5。
+# 碼表執行時 (cin.py) 和產生碼表時 (tools/cintojson.py) 共用這裡的分類。
+
+CHARSETS = (
+    "cjkOther",  # CJK 其它漢字或其它字集字元
+    "bopomofo",  # 注音符號
+    "cjk",  # CJK Unified Ideographs 漢字 (不在 Big5 中)
+    "big5F",  # Big5 常用字
+    "big5LF",  # Big5 次常用字
+    "big5S",  # Big5 符號
+    "big5Other",  # Big5 其它漢字
+    "cjkExtA",  # CJK 擴展 A 區
+    "cjkExtB",  # CJK 擴展 B 區
+    "cjkExtC",  # CJK 擴展 C 區
+    "cjkExtD",  # CJK 擴展 D 區
+    "cjkExtE",  # CJK 擴展 E 區
+    "cjkExtF",  # CJK 擴展 F 區
+    "cjkCIibm",  # CJK 相容字集區 12 特殊字
+    "pua",  # Unicode 私用區
+    "cjkCI",  # CJK 相容字集區
+    "cjkCIS",  # CJK 相容字集補充區
+)
+CHARSET_IDS = {name: i for i, name in enumerate(CHARSETS)}
+
+# Cin.getCharSet() 和 cintojson.py 的 getCharSet() 傳回的名稱 (沿用原本的名稱：
+# Big5 符號傳回 big5LF，相容字集區和相容字集補充區傳回 pua)
+CHARSET_NAMES = tuple({"big5S": "big5LF", "cjkCI": "pua", "cjkCIS": "pua"}.get(name, name) for name in CHARSETS)
+
+TABLE_SIZE = 0x30000  # 對照表以後的字元只有私用區需要分類
+
+_table = None
+
+
+def buildTable():
+    table = bytearray(TABLE_SIZE)  # 0 是 cjkOther
+
+    def fill(name, start, end):
+        table[start:end] = bytes([CHARSET_IDS[name]]) * (end - start)
+
+    def fillList(name, codes):
+        for code in codes:
+            table[code] = CHARSET_IDS[name]
+
+    fill("bopomofo", 0x3100, 0x3130)
+    fillList("bopomofo", [0x02D9, 0x02CA, 0x02C7, 0x02CB])
+    fill("cjkExtA", 0x3400, 0x4DB6)
+    for code in range(0x4E00, 0x9FEB):
+        try:
+            big5code = int.from_bytes(chr(code).encode("big5"), "big")
+        except UnicodeEncodeError:
+            table[code] = CHARSET_IDS["cjk"]
+            continue
+        if 0xA440 <= big5code < 0xC67F:
+            table[code] = CHARSET_IDS["big5F"]
+        elif 0xC940 <= big5code < 0xF9D6:
+            table[code] = CHARSET_IDS["big5LF"]
+        elif 0xA140 <= big5code < 0xA3C0:
+            table[code] = CHARSET_IDS["big5S"]
+        else:
+            table[code] = CHARSET_IDS["big5Other"]
+
+    fill("cjkExtB", 0x20000, 0x2A6D7)
+    fill("cjkExtC", 0x2A700, 0x2B735)
+    fill("cjkExtD", 0x2B740, 0x2B81E)
+    fill("cjkExtE", 0x2B820, 0x2CEA2)
+    fill("cjkExtF", 0x2CEB0, 0x2EBE1)
+    fill("pua", 0xE000, 0xF900)
+    fill("cjkCI", 0xF900, 0xFA0E)
+    fill("cjkCI", 0xFA2E, 0xFB00)
+    fillList("cjkCI", [0xFA10, 0xFA12, 0xFA15, 0xFA16, 0xFA17, 0xFA18, 0xFA19, 0xFA1A, 0xFA1B, 0xFA1C,
+                       0xFA1D, 0xFA1E, 0xFA20, 0xFA22, 0xFA25, 0xFA26, 0xFA2A, 0xFA2B, 0xFA2C, 0xFA2D])
+    fillList("cjkCIibm", [0xFA0E, 0xFA0F, 0xFA11, 0xFA13, 0xFA14, 0xFA1F, 0xFA21, 0xFA23, 0xFA24, 0xFA27, 0xFA28, 0xFA29])
+    fill("cjkCIS", 0x2F800, 0x2FA20)
+    return bytes(table)
+
+
+# 建立對照表，已經建立過時不再重建 (兩個執行緒同時建立時結果相同，只會保留其中一個)
+def initTable():
+    global _table
+    if _table is None:
+        _table = buildTable()
+
+
+# 字元的字元集編號 (CHARSETS 的索引)，呼叫前必須先以 initTable() 建立對照表
+def getCharSetId(char):
+    code = ord(char)
+    if code < TABLE_SIZE:
+        return _table[code]
+    if 0xF0000 <= code < 0xFFFFE or 0x100000 <= code < 0x10FFFE:  # 私用區 A、B
+        return CHARSET_IDS["pua"]
+    return CHARSET_IDS["cjkOther"]
+
+
+# 字元所屬的字元集 (CHARSETS 的名稱)，供產生碼表時使用
+def getCharSet(char):
+    initTable()
+    return CHARSETS[getCharSetId(char)]
+
+
+__all__ = ["CHARSETS", "CHARSET_IDS", "CHARSET_NAMES", "initTable", "getCharSetId", "getCharSet"]
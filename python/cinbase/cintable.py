@@ -0,0 +1,256 @@
+#! python3
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# 編譯過的二進位碼表 (.cintable)
+#
+# JSON 碼表的 chardefs 編譯成排序過的字根索引和 UTF-8 候選字資料，以 mmap
+# 開啟後不需要解析就能以二分搜尋查詢，多個程序開啟同一個檔案時也共用相同的記憶體分頁。
+# 檔案格式 (little-endian):
+#   header     HEADER
+#   meta       chardefs 以外的碼表資料 (ename, cname, keynames, cincount...) 的 JSON
+#   keyOffsets uint32[keyCount + 1]，字根在 keyBlob 中的位置
+#   valOffsets uint32[keyCount + 1]，候選字在 valBlob 中的位置
+#   keyBlob    依 UTF-8 位元組排序的字根，每個字根後面接著 "\1"
+#   valBlob    每個字根的候選字以 "\0" 分隔，後面接著 "\1"
+# 每個字根和候選字都以 "\1" 結束，走訪整個碼表時可以一次解碼再切開。
+# 碼表由 tools/cintojson.py 產生在 JSON 碼表旁邊，或在第一次載入時編譯到快取目錄。
+
+import bisect
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+MAGIC = b"PIMECIN\0"
+VERSION = 1
+# magic, version, keyCount, source size, source mtime_ns, meta offset, meta size,
+# keyOffsets offset, valOffsets offset, keyBlob offset, valBlob offset, file size
+HEADER = struct.Struct("<8sIIQQIIIIIII")
+SEPARATOR = "\0"  # between the candidates of a key
+TERMINATOR = "\1"  # after each key and each list of candidates
+SPARSE_STEP = 32
+
+
+def align(offset):
+    return (offset + 3) & ~3
+
+
+# 將碼表資料 (JSON 碼表的內容) 寫入 .cintable 檔，source 是 JSON 碼表的 os.stat() 結果
+def compileTable(data, path, source):
+    chardefs = data["chardefs"]
+    meta = json.dumps({key: value for key, value in data.items() if key != "chardefs"}, ensure_ascii=False).encode("utf-8")
+    keys = sorted(chardefs, key=lambda key: key.encode("utf-8"))
+
+    keyOffsets = [0]
+    valOffsets = [0]
+    keyBlob = io.BytesIO()
+    valBlob = io.BytesIO()
+    for key in keys:
+        values = SEPARATOR.join(chardefs[key])
+        if SEPARATOR in key or TERMINATOR in key or TERMINATOR in values or any(SEPARATOR in value for value in chardefs[key]):
+            raise ValueError("invalid character in the table")
+        keyOffsets.append(keyOffsets[-1] + keyBlob.write((key + TERMINATOR).encode("utf-8")))
+        valOffsets.append(valOffsets[-1] + valBlob.write((values + TERMINATOR).encode("utf-8")))
+
+    count = len(keys)
+    metaOffset = HEADER.size
+    keyOffsetsOffset = align(metaOffset + len(meta))
+    valOffsetsOffset = keyOffsetsOffset + 4 * (count + 1)
+    keyBlobOffset = valOffsetsOffset + 4 * (count + 1)
+    valBlobOffset = keyBlobOffset + keyOffsets[-1]
+    fileSize = valBlobOffset + valOffsets[-1]
+
+    header = HEADER.pack(MAGIC, VERSION, count, source.st_size, source.st_mtime_ns,
+                         metaOffset, len(meta), keyOffsetsOffset, valOffsetsOffset, keyBlobOffset, valBlobOffset, fileSize)
+    fd, tempPath = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(meta)
+            f.write(b"\0" * (keyOffsetsOffset - metaOffset - len(meta)))
+            f.write(struct.pack("<%dI" % (count + 1), *keyOffsets))
+            f.write(struct.pack("<%dI" % (count + 1), *valOffsets))
+            f.write(keyBlob.getvalue())
+            f.write(valBlob.getvalue())
+        os.replace(tempPath, path)
+    except Exception:
+        os.remove(tempPath)
+        raise
+
+
+# 以 mmap 開啟 .cintable 檔，檔案不存在、格式不符或和 JSON 碼表 (source) 不一致時傳回 None
+def openTable(path, source):
+    if sys.byteorder != "little":
+        return None
+    try:
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    if len(buf) < HEADER.size:
+        return None
+    (magic, version, count, sourceSize, sourceMtime, metaOffset, metaSize,
+     keyOffsetsOffset, valOffsetsOffset, keyBlobOffset, valBlobOffset, fileSize) = HEADER.unpack_from(buf)
+    if magic != MAGIC or version != VERSION or fileSize != len(buf):
+        return None
+    if sourceSize != source.st_size or sourceMtime != source.st_mtime_ns:
+        return None
+
+    data = json.loads(buf[metaOffset:metaOffset + metaSize].decode("utf-8"))
+    data["chardefs"] = MappedCharDefs(buf, count, keyOffsetsOffset, valOffsetsOffset, keyBlobOffset, valBlobOffset)
+    return data
+
+
+# 載入 JSON 碼表，優先使用編譯過的碼表 (JSON 碼表旁邊的 .cintable 檔或快取目錄中的檔案)
+# 沒有編譯過的碼表時，載入 JSON 碼表並編譯到 cacheDir。
+def loadTable(jsonPath, cacheDir=None):
+    source = os.stat(jsonPath)
+    name = os.path.splitext(os.path.basename(jsonPath))[0] + ".cintable"
+    paths = [os.path.join(os.path.dirname(jsonPath), name)]
+    if cacheDir:
+        paths.append(os.path.join(cacheDir, name))
+    for path in paths:
+        data = openTable(path, source)
+        if data is not None:
+            return data
+
+    with io.open(jsonPath, 'r', encoding='utf8') as fs:
+        data = json.load(fs)
+    if cacheDir:
+        try:
+            compileTable(data, paths[-1], source)
+        except (OSError, ValueError):
+            return data
+        mapped = openTable(paths[-1], source)
+        if mapped is not None:
+            return mapped
+    return data
+
+
+# 字根索引，讓 bisect 能直接在 mmap 上做二分搜尋
+class MappedKeys(object):
+    def __init__(self, buf, count, keyOffsets, keyBlobOffset):
+        self.buf = buf
+        self.count = count
+        self.keyOffsets = keyOffsets
+        self.keyBlobOffset = keyBlobOffset
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        base = self.keyBlobOffset
+        return self.buf[base + self.keyOffsets[i]:base + self.keyOffsets[i + 1] - 1]
+
+
+# 以 mmap 開啟的 chardefs，用法和 {字根: [候選字...]} 的 dict 相同
+# 修改 (擴充碼表、忽略私用區的字) 的結果存在 overlay 中，不會更動碼表檔。
+class MappedCharDefs(object):
+    def __init__(self, buf, count, keyOffsetsOffset, valOffsetsOffset, keyBlobOffset, valBlobOffset):
+        self.buf = buf
+        self.count = count
+        view = memoryview(buf)
+        self.keyOffsets = view[keyOffsetsOffset:keyOffsetsOffset + 4 * (count + 1)].cast("I")
+        self.valOffsets = view[valOffsetsOffset:valOffsetsOffset + 4 * (count + 1)].cast("I")
+        self.keyBlobOffset = keyBlobOffset
+        self.valBlobOffset = valBlobOffset
+        self.keyIndex = MappedKeys(buf, count, self.keyOffsets, keyBlobOffset)
+        # 每 SPARSE_STEP 個字根取一個放在 list 中，先在 list 中找出區段再搜尋 mmap，減少讀取 mmap 的次數
+        self.sparseKeys = [self.keyIndex[i] for i in range(0, count, SPARSE_STEP)]
+        self.overlay = {}
+        self.extraKeys = []  # keys only in the overlay, in insertion order
+
+    # 字根在碼表檔中的位置，找不到時傳回 -1
+    def find(self, key):
+        k = key.encode("utf-8")
+        block = bisect.bisect_right(self.sparseKeys, k) - 1
+        if block < 0:
+            return -1
+        lo = block * SPARSE_STEP
+        i = bisect.bisect_left(self.keyIndex, k, lo, min(lo + SPARSE_STEP, self.count))
+        if i < self.count and self.keyIndex[i] == k:
+            return i
+        return -1
+
+    def getValues(self, i):
+        start = self.valOffsets[i]
+        end = self.valOffsets[i + 1] - 1
+        if start == end:
+            return []
+        base = self.valBlobOffset
+        return self.buf[base + start:base + end].decode("utf-8").split(SEPARATOR)
+
+    def getKey(self, i):
+        return self.keyIndex[i].decode("utf-8")
+
+    def __getitem__(self, key):
+        value = self.overlay.get(key)
+        if value is not None:
+            return value
+        i = self.find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self.getValues(i)
+
+    def __setitem__(self, key, value):
+        if key not in self.overlay and self.find(key) < 0:
+            self.extraKeys.append(key)
+        self.overlay[key] = value
+
+    def __contains__(self, key):
+        return key in self.overlay or self.find(key) >= 0
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __len__(self):
+        return self.count + len(self.extraKeys)
+
+    # 一次解碼所有的字根
+    def getAllKeys(self):
+        start = self.keyBlobOffset
+        return self.buf[start:start + self.keyOffsets[self.count]].decode("utf-8").split(TERMINATOR)[:-1]
+
+    def __iter__(self):
+        for key in self.getAllKeys():
+            yield key
+        for key in self.extraKeys:
+            yield key
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        for key, value in self.items():
+            yield value
+
+    def items(self):
+        overlay = self.overlay
+        start = self.valBlobOffset
+        valueLists = self.buf[start:start + self.valOffsets[self.count]].decode("utf-8").split(TERMINATOR)
+        for key, values in zip(self.getAllKeys(), valueLists):
+            value = overlay.get(key)
+            if value is None:
+                value = values.split(SEPARATOR) if values else []
+            yield key, value
+        for key in self.extraKeys:
+            yield key, overlay[key]
@@ -19,7 +19,13 @@ import json
 import os
 import io
 import time
+import copy
 import shutil
+import threading
+import platformShim
+from perfStats import perfStats
+from configWatcher import configWatcher
+from persistence import jsonWriter
 
 DEF_FONT_SIZE = 12
 
@@ -78,7 +84,7 @@ class CinBaseConfig:
         self.keyboardType = 0
         self.selDayiSymbolCharType = 0
 
-        self.ignoreSaveList = ["ignoreSaveList", "curdir", "cinFileList", "selCinFile", "imeDirName", "_version", "_lastUpdateTime"]
+        self.ignoreSaveList = ["ignoreSaveList", "curdir", "cinFileList", "selCinFile", "imeDirName", "_version", "_lastUpdateTime", "_watchGeneration"]
         self.curdir = os.path.abspath(os.path.dirname(__file__))
         self.cinFileList = []
         self.selCinFile = ""
@@ -87,11 +93,10 @@ class CinBaseConfig:
         # version: last modified time of (config.json, symbols.dat, swkb.dat, fsymbols.dat, flangs.dat, userphrase.dat)
         self._version = (0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
         self._lastUpdateTime = 0.0
+        self._watchGeneration = -1  # generation of configWatcher when _version was updated
 
     def getConfigDir(self):
-        config_dir = os.path.join(os.path.expandvars("%APPDATA%"), "PIME", self.imeDirName)
-        os.makedirs(config_dir, mode=0o700, exist_ok=True)
-        return config_dir
+        return platformShim.getDataDir(self.imeDirName)
 
     def getConfigFile(self, name="config.json"):
         return os.path.join(self.getConfigDir(), name)
@@ -120,20 +125,16 @@ class CinBaseConfig:
                 self.__dict__.update(json.load(f))
         except Exception:
             self.save()
+        perfStats.increment("configReloads")
         self.update()
 
     def toJson(self):
         return {key: value for key, value in self.__dict__.items() if not key.startswith("_") and not key in self.ignoreSaveList}
 
+    # 設定檔由 jsonWriter 在背景寫入
     def save(self):
-        filename = self.getConfigFile()
-        try:
-            with open(filename, "w") as f:
-                jsondata = {key: value for key, value in self.__dict__.items() if not key in self.ignoreSaveList}
-                js = json.dump(jsondata, f, sort_keys=True, indent=4)
-            self.update()
-        except Exception:
-            pass # FIXME: handle I/O errors?
+        jsondata = {key: value for key, value in self.__dict__.items() if not key in self.ignoreSaveList}
+        jsonWriter.write(self.getConfigFile(), jsondata)
 
     def getDataDir(self):
         return os.path.join(os.path.dirname(__file__), "data")
@@ -163,71 +164,42 @@ class CinBaseConfig:
             else:
                 shutil.copy2(s, d)
 
+    # files which affect the version, in the order of self._version
+    # (a data file in the config dir overrides the one in the data dir)
+    def getWatchedFiles(self):
+        datadirs = (self.getConfigDir(), self.getDataDir())
+        names = ("symbols.dat", "swkb.dat", "fsymbols.dat", "flangs.dat", "userphrase.dat")
+        return [[self.getConfigFile()]] + [[os.path.join(dirname, name) for dirname in datadirs] for name in names]
+
     # check if the config files are changed and relaod as needed
+    # The files are checked by configWatcher in the background, here we only
+    # compare its generation number so this is cheap enough for every request.
     def update(self):
-        # avoid checking mtime of files too frequently
-        if (time.time() - self._lastUpdateTime) < 3.0:
+        generation, mtimes = configWatcher.getState()
+        if generation == self._watchGeneration:
             return
 
-        try:
-            configTime = os.path.getmtime(self.getConfigFile())
-        except Exception:
-            configTime = 0.0
-
-        datadirs = (self.getConfigDir(), self.getDataDir())
-        symbolsTime = 0.0
-        symbolsFile = self.findFile(datadirs, "symbols.dat")
-        if symbolsFile:
-            try:
-                symbolsTime = os.path.getmtime(symbolsFile)
-            except Exception:
-                pass
-
-        ezSymbolsTime = 0.0
-        ezSymbolsFile = self.findFile(datadirs, "swkb.dat")
-        if ezSymbolsFile:
-            try:
-                ezSymbolsTime = os.path.getmtime(ezSymbolsFile)
-            except Exception:
-                pass
-
-        fsymbolsTime = 0.0
-        fsymbolsFile = self.findFile(datadirs, "fsymbols.dat")
-        if fsymbolsFile:
-            try:
-                fsymbolsTime = os.path.getmtime(fsymbolsFile)
-            except Exception:
-                pass
-
-        flangsTime = 0.0
-        flangsFile = self.findFile(datadirs, "flangs.dat")
-        if flangsFile:
-            try:
-                flangsTime = os.path.getmtime(flangsFile)
-            except Exception:
-                pass
-
-        userphraseTime = 0.0
-        userphraseFile = self.findFile(datadirs, "userphrase.dat")
-        if userphraseFile:
-            try:
-                userphraseTime = os.path.getmtime(userphraseFile)
-            except Exception:
-                pass
-
-        extendtableTime = 0.0
-        extendtableFile = self.findFile(datadirs, "extendtable.dat")
-        if extendtableFile:
-            try:
-                extendtableTime = os.path.getmtime(extendtableFile)
-            except Exception:
-                pass
+        watchedFiles = self.getWatchedFiles()
+        paths = [path for candidates in watchedFiles for path in candidates]
+        if not configWatcher.isWatching(paths):
+            configWatcher.watch(paths)
+            generation, mtimes = configWatcher.getState()
+        self._watchGeneration = generation
+
+        version = []
+        for candidates in watchedFiles:
+            mtime = 0.0
+            for path in candidates:
+                if path in mtimes:
+                    mtime = mtimes[path]
+                    break
+            version.append(mtime)
 
         lastConfigTime = self._version[0]
-        self._version = (configTime, symbolsTime, ezSymbolsTime, fsymbolsTime, flangsTime, userphraseTime)
+        self._version = tuple(version)
 
         # the main config file is changed, reload it
-        if lastConfigTime != configTime:
+        if lastConfigTime != self._version[0]:
             if not hasattr(self, "_in_update"): # avoid recursion
                 self._in_update = True  # avoid recursion since update() will be called by load
                 self.load()
@@ -238,6 +210,12 @@ class CinBaseConfig:
     def getVersion(self):
         return self._version
 
+    # 傳回修改過的複本，原本的設定物件不會被更改
+    def replace(self, **changes):
+        cfg = copy.copy(self)
+        cfg.__dict__.update(changes)
+        return cfg
+
     def isConfigChanged(self, currentVersion):
         return currentVersion[0] != self._version[0]
 
@@ -249,6 +227,61 @@ class CinBaseConfig:
         return currentVersion[1:] != self._version[1:]
 
 
+# 同一輸入法 (imeDirName) 的所有 TextService 共享一份唯讀的設定快照。
+# 設定檔只在第一次使用及檔案改變時讀取，改變時建立新的快照取代舊的 (copy-on-write)，
+# 正在使用舊快照的 TextService 會在下次檢查設定時換成新的快照。
+class SharedConfig:
+
+    def __init__(self, imeDirName, cinFileList):
+        self.imeDirName = imeDirName
+        self.cinFileList = cinFileList
+        self.snapshot = None
+        self.generation = -1  # generation of configWatcher when the snapshot was checked
+        self.lock = threading.Lock()
+
+    # 取得最新的設定快照
+    def get(self):
+        snapshot = self.snapshot
+        if snapshot is not None and self.generation == configWatcher.getState()[0]:
+            return snapshot
+        with self.lock:
+            snapshot = self.snapshot
+            if snapshot is None:
+                cfg = CinBaseConfig.__class__()
+                cfg.imeDirName = self.imeDirName
+                cfg.cinFileList = self.cinFileList
+                cfg.load()
+            else:
+                cfg = copy.copy(snapshot)
+                cfg.update()
+                if cfg.getVersion() == snapshot.getVersion():
+                    self.generation = cfg._watchGeneration
+                    return snapshot  # 檔案沒有改變，繼續使用原本的快照
+            self.generation = cfg._watchGeneration
+            self.snapshot = cfg
+            return cfg
+
+    # 修改設定並建立新的快照 (save=True 時同時寫入設定檔)
+    def modify(self, save=False, **changes):
+        with self.lock:
+            cfg = self.snapshot.replace(**changes)
+            if save:
+                cfg.save()
+            self.snapshot = cfg
+            return cfg
+
+
+_sharedConfigs = {}  # imeDirName => SharedConfig
+_sharedConfigsLock = threading.Lock()
+
+def getSharedConfig(imeDirName, cinFileList):
+    with _sharedConfigsLock:
+        sharedConfig = _sharedConfigs.get(imeDirName)
+        if sharedConfig is None:
+            sharedConfig = _sharedConfigs[imeDirName] = SharedConfig(imeDirName, cinFileList)
+        return sharedConfig
+
+
 # globally shared config object
 # load configurations from a user-specific config file
 CinBaseConfig = CinBaseConfig()
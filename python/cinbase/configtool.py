@@ -25,8 +25,10 @@ import random
 import json
 import threading
 
+# config.py imports the shared modules in the parent dir (perfStats, ...)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from config import CinBaseConfig
-from cin import Cin
 from ctypes import c_uint, byref, create_string_buffer
 
 cfg = CinBaseConfig
@@ -2,10 +2,11 @@ import os
 import copy
 import time
 import json
-from cinbase.tools import cpuinfo
+import platformShim
 
 class Debug:
     def __init__(self, imeDirName):
+        from cinbase.tools import cpuinfo  # slow to import, only needed in debug mode
         self.info = cpuinfo.get_cpu_info()
         self.debugLog = {}
         self.startTime = {}
@@ -20,9 +21,7 @@ class Debug:
                         "liu.json": "嘸蝦米"})
 
     def getConfigDir(self):
-        config_dir = os.path.join(os.path.expandvars("%APPDATA%"), "PIME", self.imeDirName)
-        os.makedirs(config_dir, mode=0o700, exist_ok=True)
-        return config_dir
+        return platformShim.getDataDir(self.imeDirName)
 
     def getConfigFile(self, name="debug.json"):
         return os.path.join(self.getConfigDir(), name)
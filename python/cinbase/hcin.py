@@ -3,9 +3,10 @@ from __future__ import unicode_literals
 import os
 import re
 import json
+from .reverseindex import ReverseLookup
 
 
-class HCin(object):
+class HCin(ReverseLookup):
 
     # TODO check the possiblility if the encoding is not utf-8
     encoding = 'utf-8'
@@ -19,6 +20,7 @@ class HCin(object):
         self.selkey = ""
         self.keynames = {}
         self.chardefs = {}
+        self.reverseIndex = None  # 字 => 字根，第一次查詢時才建立
 
         self.__dict__.update(json.load(fs))
 
@@ -28,6 +30,7 @@ class HCin(object):
         del self.chardefs
         self.keynames = {}
         self.chardefs = {}
+        self.reverseIndex = None
 
     def getEname(self):
         return self.ename
@@ -44,14 +47,8 @@ class HCin(object):
     def getKeyName(self, key):
         return self.keynames[key]
 
-    def isHaveKey(self, val):
-        return True if [key for key, value in self.chardefs.items() if val in value] else False
-
-    def getKey(self, val):
-        return [key for key, value in self.chardefs.items() if val in value][0]
-
     def getKeyList(self, val):
-        return [key for key, value in sorted(self.chardefs.items()) if val in value]
+        return sorted(set(self.getCodes(val)))
 
     def getKeyNameList(self, keyList):
         result = []
@@ -84,14 +81,12 @@ class HCin(object):
         nunbers = ['①', '②', '③', '④', '⑤', '⑥', '⑦', '⑧', '⑨', '⑩']
         i = 0
         result = root + ':'
-        for chardef in self.chardefs:
-            for char in self.chardefs[chardef]:
-                if char == root:
-                    result += '　' + nunbers[i]
-                    if i < 9:
-                        i = i + 1
-                    for str in chardef:
-                        result += self.getKeyName(str)
+        for chardef in self.getCodes(root):
+            result += '　' + nunbers[i]
+            if i < 9:
+                i = i + 1
+            for str in chardef:
+                result += self.getKeyName(str)
 
         if result == root + ':':
             result = ''
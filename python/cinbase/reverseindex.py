@@ -0,0 +1,61 @@
+#! python3
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# 字 => 字根的反查
+#
+# Cin、RCin 和 HCin 共用。索引在第一次反查時才從 chardefs 建立，
+# chardefs 改變時 (釋放碼表或加入擴充字根) 要把 reverseIndex 設為 None。
+
+
+class ReverseLookup(object):
+    reverseIndex = None
+
+
+    # 建立字 => 字根的反查索引，字根依 chardefs 的順序排列
+    # 大部分的字只有一個字根，直接存字根字串，有多個字根時才存成 tuple
+    def getReverseIndex(self):
+        index = self.reverseIndex
+        if index is None:
+            index = {}
+            for key, chars in self.chardefs.items():
+                for char in chars:
+                    codes = index.get(char)
+                    if codes is None:
+                        index[char] = key
+                    elif isinstance(codes, tuple):
+                        index[char] = codes + (key,)
+                    else:
+                        index[char] = (codes, key)
+            self.reverseIndex = index
+        return index
+
+
+    # 傳回字的所有字根
+    def getCodes(self, val):
+        codes = self.getReverseIndex().get(val)
+        if codes is None:
+            return ()
+        return codes if isinstance(codes, tuple) else (codes,)
+
+
+    def isHaveKey(self, val):
+        return val in self.getReverseIndex()
+
+
+    def getKey(self, val):
+        return self.getCodes(val)[0]
+
+
+__all__ = ["ReverseLookup"]
@@ -0,0 +1,101 @@
+#! python3
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# 萬用字元查詢的索引
+#
+# 字根依長度分組並排序，每個長度再依「位置 + 字元」建立字根編號的列表 (第一次查詢該長度時才建立)。
+# 查詢時從固定字元中列表最短的一個開始，逐一檢查其他位置的字元，依字根順序產生符合的字根，
+# 呼叫端取得足夠的候選字後就可以停止，不需要排序或比對整個碼表。
+# 單字元萬用字元符合一個字元，多字元萬用字元符合零到多個字元，兩者可以在同一個字串中出現多次。
+
+import heapq
+import re
+
+
+class WildcardIndex(object):
+    def __init__(self, keys):
+        self.buckets = {}  # 長度 => 排序過的字根
+        for key in keys:
+            self.buckets.setdefault(len(key), []).append(key)
+        for bucket in self.buckets.values():
+            bucket.sort()
+        self.lengths = sorted(self.buckets)
+        self.postings = {}  # 長度 => 每個位置的 {字元: [字根編號...]}
+
+
+    def getPostings(self, length):
+        postings = self.postings.get(length)
+        if postings is None:
+            postings = [{} for pos in range(length)]
+            for i, key in enumerate(self.buckets[length]):
+                for pos, char in enumerate(key):
+                    postings[pos].setdefault(char, []).append(i)
+            self.postings[length] = postings
+        return postings
+
+
+    # 依字根順序產生長度為 length，且 fixed 中的位置都是指定字元的字根，regex 用來檢查其他條件
+    def matchLength(self, length, fixed, regex=None):
+        bucket = self.buckets.get(length)
+        if not bucket:
+            return
+        if fixed:
+            postings = self.getPostings(length)
+            lists = [postings[pos].get(char) for pos, char in fixed]
+            if not all(lists):
+                return
+            first = min(range(len(lists)), key=lambda i: len(lists[i]))
+            others = fixed[:first] + fixed[first + 1:]
+            for i in lists[first]:
+                key = bucket[i]
+                if all(key[pos] == char for pos, char in others) and (regex is None or regex.match(key)):
+                    yield key
+        else:
+            for key in bucket:
+                if regex is None or regex.match(key):
+                    yield key
+
+
+    # 依字根順序產生符合 pattern 的字根
+    # wildcardChar 符合一個字元，multiWildcardChar 符合零到多個字元
+    def match(self, pattern, wildcardChar, multiWildcardChar=None):
+        if not multiWildcardChar or not multiWildcardChar in pattern:
+            fixed = [(pos, char) for pos, char in enumerate(pattern) if char != wildcardChar]
+            return self.matchLength(len(pattern), fixed)
+
+        first = pattern.index(multiWildcardChar)
+        last = pattern.rindex(multiWildcardChar)
+        prefix = pattern[:first]
+        suffix = pattern[last + 1:]
+        middle = pattern[first:last + 1]
+        minLength = len(pattern) - pattern.count(multiWildcardChar)
+
+        # 前後的固定字元可以用索引過濾，中間有固定字元時再以 regex 檢查
+        regex = None
+        if any(char != wildcardChar and char != multiWildcardChar for char in middle):
+            regex = re.compile("".join("." if char == wildcardChar else ".*" if char == multiWildcardChar else re.escape(char)
+                                       for char in pattern) + r"\Z")
+
+        fixedPrefix = [(pos, char) for pos, char in enumerate(prefix) if char != wildcardChar]
+        fixedSuffix = [(pos - len(suffix), char) for pos, char in enumerate(suffix) if char != wildcardChar]
+        matches = []
+        for length in self.lengths:
+            if length >= minLength:
+                fixed = fixedPrefix + [(length + pos, char) for pos, char in fixedSuffix]
+                matches.append(self.matchLength(length, fixed, regex))
+        return heapq.merge(*matches)
+
+
+__all__ = ["WildcardIndex"]
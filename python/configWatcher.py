@@ -0,0 +1,158 @@
+#! python3
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Background watcher of the config and data files shared by all configs.
+# The modification times of the watched files are published with a
+# generation number in a single (generation, mtimes) tuple which is
+# replaced as a whole, so the configs only need to compare the generation
+# on each request and never stat the files themselves.
+# Changes are detected with inotify on Linux. Other files (or all files on
+# other platforms) are checked every PIME_CONFIG_POLL_INTERVAL seconds.
+
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_CLOEXEC = 0x00080000
+INOTIFY_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class Inotify:
+    def __init__(self):
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1() failed")
+        self.dirs = {}  # watch descriptor => directory
+
+    def addWatch(self, dirname):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirname), INOTIFY_MASK)
+        if wd < 0:
+            return False
+        self.dirs[wd] = dirname
+        return True
+
+    # returns the paths of the changed files
+    def readEvents(self):
+        data = os.read(self.fd, 65536)
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            dirname = self.dirs.get(wd)
+            if dirname is not None and name:
+                paths.append(os.path.join(dirname, os.fsdecode(name)))
+        return paths
+
+
+class ConfigWatcher:
+    def __init__(self):
+        self.state = (0, {})  # (generation, {path: mtime of the existing watched files})
+        self.paths = set()
+        self.polledPaths = set()  # paths not covered by inotify
+        self.watchedDirs = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.interval = float(os.environ.get("PIME_CONFIG_POLL_INTERVAL", "3.0"))
+        self.inotify = None
+        if sys.platform.startswith("linux"):
+            try:
+                self.inotify = Inotify()
+            except Exception:
+                self.inotify = None
+
+    # returns (generation, {path: mtime}), the generation is increased when any watched file is changed
+    def getState(self):
+        return self.state
+
+    def isWatching(self, paths):
+        return all(path in self.paths for path in paths)
+
+    # start watching the files, which may not exist yet
+    def watch(self, paths):
+        with self.lock:
+            paths = [path for path in paths if path not in self.paths]
+            if not paths:
+                return
+            self.paths.update(paths)
+            for path in paths:
+                dirname = os.path.dirname(path)
+                if self.inotify is not None and (dirname in self.watchedDirs or self.inotify.addWatch(dirname)):
+                    self.watchedDirs.add(dirname)
+                else:
+                    self.polledPaths.add(path)
+            self.__refresh(paths)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    # check the files and publish a new state if any of them is changed
+    def refresh(self, paths=None):
+        with self.lock:
+            self.__refresh(self.paths if paths is None else [path for path in paths if path in self.paths])
+
+    def __refresh(self, paths):
+        generation, mtimes = self.state
+        newMtimes = None
+        for path in paths:
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                mtime = None
+            if mtimes.get(path) != mtime:
+                if newMtimes is None:
+                    newMtimes = dict(mtimes)
+                if mtime is None:
+                    del newMtimes[path]
+                else:
+                    newMtimes[path] = mtime
+        if newMtimes is not None:
+            self.state = (generation + 1, newMtimes)
+
+    def run(self):
+        inotify = self.inotify
+        lastPollTime = time.monotonic()
+        while True:
+            timeout = max(lastPollTime + self.interval - time.monotonic(), 0)
+            if inotify is not None:
+                ready, _, _ = select.select([inotify.fd], [], [], timeout)
+                if ready:
+                    self.refresh(inotify.readEvents())
+            else:
+                time.sleep(timeout)
+            if time.monotonic() - lastPollTime >= self.interval:
+                lastPollTime = time.monotonic()
+                with self.lock:
+                    if self.polledPaths:
+                        self.__refresh(self.polledPaths)
+
+
+# globally shared watcher
+configWatcher = ConfigWatcher()
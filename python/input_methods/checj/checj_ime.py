@@ -17,13 +17,13 @@ from keycodes import *  # for VK_XXX constants
 from textService import *
 import io
 import os.path
-import copy
 
 from cinbase import CinBase
 from cinbase import LoadCinTable
 from cinbase import LoadRCinTable
 from cinbase import LoadHCinTable
 from cinbase.config import CinBaseConfig
+from cinbase.config import getSharedConfig
 
 
 class CheCJTextService(TextService):
@@ -45,25 +45,17 @@ class CheCJTextService(TextService):
         self.cinbase.initTextService(self, TextService)
 
         # 載入用戶設定值
-        CinBaseConfig.__init__()
         self.configVersion = CinBaseConfig.getVersion()
-        self.cfg = copy.deepcopy(CinBaseConfig)
-        self.cfg.imeDirName = self.imeDirName
-        self.cfg.cinFileList = self.cinFileList
-        self.cfg.load()
+        self.sharedConfig = getSharedConfig(self.imeDirName, self.cinFileList)
+        self.cfg = self.sharedConfig.get()
         self.jsondir = self.cfg.getJsonDir()
         self.cindir = self.cfg.getCinDir()
         self.ignorePrivateUseArea = self.cfg.ignorePrivateUseArea
         self.cinbase.initCinBaseContext(self)
 
-        # 載入輸入法碼表
-        if not CinTable.curCinType == self.cfg.selCinType and not CinTable.loading:
-            loadCinFile = LoadCinTable(self, CinTable)
-            loadCinFile.start()
-        else:
-            while CinTable.loading:
-                continue
-            self.cin = CinTable.cin
+        # 載入輸入法碼表 (不等待其他 TextService 正在載入的碼表)
+        if CinTable.curCinType == self.cfg.selCinType or not LoadCinTable(self, CinTable).start():
+            self.cinbase.attachCinTable(self, CinTable)
 
 
     # 檢查設定檔是否有被更改，是否需要套用新設定
@@ -137,6 +129,21 @@ class CheCJTextService(TextService):
         self.cinbase.onCompositionTerminated(self, forced)
 
 
+    # 預先建立的 TextService 交給 client 使用
+    def attachClient(self, client):
+        self.cinbase.attachClient(self, TextService, client)
+
+
+    # 保存輸入狀態快照
+    def getSnapshot(self):
+        return self.cinbase.getSnapshot(self, TextService)
+
+
+    # 從快照還原輸入狀態
+    def restoreSnapshot(self, snapshot):
+        self.cinbase.restoreSnapshot(self, TextService, snapshot)
+
+
     # 設定候選字頁數
     def setCandidatePage(self, page):
         self.currentCandPage = page
@@ -144,6 +151,8 @@ class CheCJTextService(TextService):
 
 class CinTable:
     loading = False
+    future = None
+    failedCinType = None
     def __init__(self):
         self.cin = None
         self.curCinType = None
@@ -155,6 +164,8 @@ CinTable = CinTable()
 
 class RCinTable:
     loading = False
+    future = None
+    failedCinType = None
     def __init__(self):
         self.cin = None
         self.curCinType = None
@@ -163,6 +174,8 @@ RCinTable = RCinTable()
 
 class HCinTable:
     loading = False
+    future = None
+    failedCinType = None
     def __init__(self):
         self.cin = None
         self.curCinType = None
@@ -19,6 +19,8 @@ import json
 import os
 import time
 import shutil
+from perfStats import perfStats
+from configWatcher import configWatcher
 
 DEF_FONT_SIZE = 16
 
@@ -75,6 +77,7 @@ class ChewingConfig:
         # version: last modified time of (config.json, symbols.dat, swkb.dat)
         self._version = (0.0, 0.0, 0.0)
         self._lastUpdateTime = 0.0
+        self._watchGeneration = -1  # generation of configWatcher when _version was updated
         self.load()  # try to load from the config file
 
     def getConfigDir(self):
@@ -115,6 +118,7 @@ class ChewingConfig:
 
         except Exception:
             self.save()
+        perfStats.increment("configReloads")
         self.update()
 
     def toJson(self):
@@ -149,39 +153,41 @@ class ChewingConfig:
             else:
                 shutil.copy2(s, d)
 
+    # files which affect the version, in the order of self._version
+    # (a data file in the config dir overrides the one in the data dir)
+    def getWatchedFiles(self):
+        datadirs = (self.getConfigDir(), self.getDataDir())
+        return [[self.getConfigFile()]] + [[os.path.join(dirname, name) for dirname in datadirs] for name in ("symbols.dat", "swkb.dat")]
+
     # check if the config files are changed and relaod as needed
+    # The files are checked by configWatcher in the background, here we only
+    # compare its generation number so this is cheap enough for every request.
     def update(self):
-        # avoid checking mtime of files too frequently
-        if (time.time() - self._lastUpdateTime) < 3.0:
+        generation, mtimes = configWatcher.getState()
+        if generation == self._watchGeneration:
             return
 
-        try:
-            configTime = os.path.getmtime(self.getConfigFile())
-        except Exception:
-            configTime = 0.0
-
-        datadirs = (self.getConfigDir(), self.getDataDir())
-        symbolsTime = 0.0
-        symbolsFile = self.findFile(datadirs, "symbols.dat")
-        if symbolsFile:
-            try:
-                symbolsTime = os.path.getmtime(symbolsFile)
-            except Exception:
-                pass
-
-        ezSymbolsTime = 0.0
-        ezSymbolsFile = self.findFile(datadirs, "swkb.dat")
-        if ezSymbolsFile:
-            try:
-                ezSymbolsTime = os.path.getmtime(ezSymbolsFile)
-            except Exception:
-                pass
+        watchedFiles = self.getWatchedFiles()
+        paths = [path for candidates in watchedFiles for path in candidates]
+        if not configWatcher.isWatching(paths):
+            configWatcher.watch(paths)
+            generation, mtimes = configWatcher.getState()
+        self._watchGeneration = generation
+
+        version = []
+        for candidates in watchedFiles:
+            mtime = 0.0
+            for path in candidates:
+                if path in mtimes:
+                    mtime = mtimes[path]
+                    break
+            version.append(mtime)
 
         lastConfigTime = self._version[0]
-        self._version = (configTime, symbolsTime, ezSymbolsTime)
+        self._version = tuple(version)
 
         # the main config file is changed, reload it
-        if lastConfigTime != configTime:
+        if lastConfigTime != self._version[0]:
             if not hasattr(self, "_in_update"):  # avoid recursion
                 self._in_update = True  # avoid recursion since update() will be called by load
                 self.load()
@@ -28,6 +28,7 @@ from ctypes import windll  # for ShellExecuteW() and GetAsyncKeyState()
 
 from .chewing_config import chewingConfig, SWITCH_LANG_WITH_BOTH_SHIFT, SWITCH_LANG_WITH_LEFT_SHIFT, SWITCH_LANG_WITH_RIGHT_SHIFT
 import sqlite3
+from perfStats import perfStats
 
 
 # 按鍵內碼和名稱的對應
@@ -655,6 +656,7 @@ class ChewingTextService(TextService):
                 # 如果使用打繁出簡，就轉成簡體中文
                 if self.outputSimpChinese:
                     commitStr = self.opencc.convert(commitStr)
+                    perfStats.increment("openccConversions")
 
                 self.setCommitString(commitStr)  # 設定要輸出的 commit string
 
@@ -22,14 +22,24 @@ OPENCC_DEFAULT_CONFIG_SIMP_TO_TRAD = "s2t.json"
 OPENCC_DEFAULT_CONFIG_TRAD_TO_SIMP = "t2s.json"
 
 _opencc_dir = os.path.dirname(__file__)
-if sys.platform == "win32": # Windows
-    _libopencc = CDLL(os.path.join(_opencc_dir, "opencc.dll"))
-else: # UNIX-like systems
-    _libopencc = CDLL("libopencc.so")
-_libopencc.opencc_error.restype = c_char_p
+_libopencc = None
+
+# The shared library is loaded on first use, so this module can be imported
+# on systems without libopencc (OSError is raised when OpenCC is created).
+def _load_library():
+    global _libopencc
+    if _libopencc is None:
+        if sys.platform == "win32": # Windows
+            lib = CDLL(os.path.join(_opencc_dir, "opencc.dll"))
+        else: # UNIX-like systems
+            lib = CDLL("libopencc.so")
+        lib.opencc_error.restype = c_char_p
+        _libopencc = lib
+    return _libopencc
 
 class OpenCC:
     def __init__(self, configName):
+        _load_library()
         if not os.path.isabs(configName):
             configName = os.path.join(_opencc_dir, configName)
         self.opencc = _libopencc.opencc_open(bytes(configName, "ascii"))
@@ -49,4 +59,5 @@ class OpenCC:
         return _libopencc.opencc_error()
 
     def __del__(self):
-        _libopencc.opencc_close(self.opencc)
+        if hasattr(self, "opencc"):
+            _libopencc.opencc_close(self.opencc)
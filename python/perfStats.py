@@ -0,0 +1,204 @@
+#! python3
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Runtime performance statistics of the python server.
+# The latency of each request is recorded in a histogram per method and
+# per input method GUID. Other events (table loads, config reloads, ...)
+# are simple counters. The statistics are returned by the reserved "stats"
+# request and can be written to the file given by PIME_STATS_FILE on exit.
+# With PIME_IMPORT_PROFILE=1, the time spent importing each module imported
+# after this one is recorded as well.
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+# Values are recorded in microseconds with 2^SUB_BUCKET_BITS buckets per
+# power of two, like HdrHistogram. This keeps the relative error below 1/16
+# and the index of a value is computed with a few integer operations.
+SUB_BUCKET_BITS = 4
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+
+class LatencyHistogram:
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = {}  # bucket index => number of values
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def record(self, us):
+        if us < SUB_BUCKET_COUNT:
+            index = us
+        else:
+            exp = us.bit_length() - SUB_BUCKET_BITS
+            index = (exp << SUB_BUCKET_BITS) + (us >> (exp - 1)) - SUB_BUCKET_COUNT
+        counts = self.counts
+        counts[index] = counts.get(index, 0) + 1
+        if self.count == 0 or us < self.min:
+            self.min = us
+        if us > self.max:
+            self.max = us
+        self.count += 1
+        self.total += us
+
+    # the lowest value of the bucket
+    @staticmethod
+    def bucketValue(index):
+        if index < SUB_BUCKET_COUNT:
+            return index
+        exp = index >> SUB_BUCKET_BITS
+        return ((index & (SUB_BUCKET_COUNT - 1)) + SUB_BUCKET_COUNT) << (exp - 1)
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0
+        threshold = self.count * percent / 100.0
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= threshold:
+                return max(min(self.bucketValue(index), self.max), self.min)
+        return self.max
+
+    def toJson(self):
+        return {
+            "count": self.count,
+            "min_us": self.min,
+            "max_us": self.max,
+            "mean_us": round(self.total / self.count, 1) if self.count else 0,
+            "p50_us": self.percentile(50),
+            "p90_us": self.percentile(90),
+            "p99_us": self.percentile(99),
+            "p999_us": self.percentile(99.9),
+        }
+
+
+class PerfStats:
+    def __init__(self):
+        self.methods = {}  # method => LatencyHistogram
+        self.services = {}  # guid => {method => LatencyHistogram}
+        self.counters = {}  # event name => count
+        self.imports = {}  # module name => [total import time, self import time] in microseconds
+        self.__lock = threading.Lock()  # counters may be updated by the table loading threads
+
+    def recordRequest(self, guid, method, elapsedNs):
+        us = elapsedNs // 1000
+        hist = self.methods.get(method)
+        if hist is None:
+            hist = self.methods[method] = LatencyHistogram()
+        hist.record(us)
+        serviceMethods = self.services.get(guid)
+        if serviceMethods is None:
+            serviceMethods = self.services[guid] = {}
+        hist = serviceMethods.get(method)
+        if hist is None:
+            hist = serviceMethods[method] = LatencyHistogram()
+        hist.record(us)
+
+    def increment(self, name, count=1):
+        with self.__lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def toJson(self):
+        data = {
+            "methods": {method: hist.toJson() for method, hist in self.methods.items()},
+            "services": {guid: {method: hist.toJson() for method, hist in methods.items()}
+                         for guid, methods in self.services.items()},
+            "counters": dict(self.counters),
+        }
+        if self.imports:
+            data["imports"] = {name: {"total_us": total, "self_us": own}
+                               for name, (total, own) in self.imports.items()}
+        return data
+
+    def dump(self, filename):
+        try:
+            with open(filename, "w", encoding="UTF-8") as f:
+                json.dump(self.toJson(), f, indent=4, sort_keys=True)
+        except Exception:
+            pass  # FIXME: handle I/O errors?
+
+
+# Meta path finder timing the execution of the modules found by the other finders.
+# The time of a module includes its nested imports ("total") or not ("self").
+class ImportProfiler:
+    def __init__(self, stats):
+        self.stats = stats
+        self.local = threading.local()
+
+    def find_spec(self, name, path, target=None):
+        local = self.local
+        if getattr(local, "finding", False):
+            return None
+        local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                        spec.loader = TimedLoader(self, spec.loader)
+                    return spec
+            return None
+        finally:
+            local.finding = False
+
+    def execModule(self, loader, module):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        stack.append(0)  # time of the nested imports
+        start = time.perf_counter_ns()
+        try:
+            loader.exec_module(module)
+        finally:
+            total = (time.perf_counter_ns() - start) // 1000
+            nested = stack.pop()
+            if stack:
+                stack[-1] += total
+            self.stats.imports[module.__name__] = [total, total - nested]
+
+
+class TimedLoader:
+    def __init__(self, profiler, loader):
+        self._profiler = profiler
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler.execModule(self._loader, module)
+
+    def __getattr__(self, name):  # get_data(), get_resource_reader(), ...
+        return getattr(self._loader, name)
+
+
+# globally shared statistics
+perfStats = PerfStats()
+
+if os.environ.get("PIME_IMPORT_PROFILE", "0") not in ("", "0"):
+    sys.meta_path.insert(0, ImportProfiler(perfStats))
+
+if os.environ.get("PIME_STATS_FILE"):
+    atexit.register(perfStats.dump, os.environ["PIME_STATS_FILE"])
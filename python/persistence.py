@@ -0,0 +1,105 @@
+#! python3
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Write-behind persistence of the JSON files (configs, statistics, ...).
+# Writes are queued and done by a background thread WRITE_DELAY seconds
+# later, so the request thread never waits for the disk and several writes
+# of the same file are coalesced into the last one. The content is written
+# to a temporary file which then replaces the old one with os.replace(), so
+# a crash never leaves a truncated file. Writes which would not change the
+# content of the file are skipped.
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from perfStats import perfStats
+
+WRITE_DELAY = 0.5  # seconds
+
+
+class JsonWriter:
+    def __init__(self, delay=WRITE_DELAY):
+        self.delay = delay
+        self.pending = {}  # path => data to write
+        self.cond = threading.Condition()
+        self.writeLock = threading.Lock()  # keep the writes of the same file in order
+        self.thread = None
+
+    # queue the data to be written, it must not be modified afterwards
+    def write(self, path, data):
+        with self.cond:
+            self.pending[path] = data
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    # write all the queued files now
+    def flush(self):
+        with self.writeLock:
+            with self.cond:
+                pending = self.pending
+                self.pending = {}
+            for path, data in pending.items():
+                # a file which cannot be written (data not serializable, ...) must
+                # not stop the writes of the other files or kill the writer thread
+                try:
+                    self.writeFile(path, data)
+                except Exception:
+                    perfStats.increment("persistenceErrors")
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+            # wait for more writes to coalesce
+            time.sleep(self.delay)
+            self.flush()
+
+    def writeFile(self, path, data):
+        content = json.dumps(data, sort_keys=True, indent=4).encode("utf-8")
+        # the file may be changed by others (the config tool), so always compare with the file
+        try:
+            with open(path, "rb") as f:
+                unchanged = (f.read() == content)
+        except OSError:
+            unchanged = False
+        if unchanged:
+            perfStats.increment("persistenceSkips")
+            return
+
+        try:
+            fd, tempPath = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(content)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tempPath, path)
+            except Exception:
+                os.remove(tempPath)
+                raise
+            perfStats.increment("persistenceWrites")
+        except Exception:
+            perfStats.increment("persistenceErrors")  # FIXME: handle I/O errors?
+
+
+# globally shared writer
+jsonWriter = JsonWriter()
+atexit.register(jsonWriter.flush)
@@ -0,0 +1,148 @@
+#! python3
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Platform dependent functions used by the input methods.
+# On Windows, the Win32 API is used as before. In headless mode (the default
+# on other platforms, or forced with PIME_HEADLESS=1), key states come from
+# the keyStates array sent with each key event, sounds and external tools
+# are disabled, and the user data is stored under PIME_DATA_ROOT so the
+# input methods can run and be benchmarked anywhere.
+
+import os
+import sys
+
+if "PIME_HEADLESS" in os.environ:
+    HEADLESS = os.environ["PIME_HEADLESS"] not in ("", "0")
+else:
+    HEADLESS = (sys.platform != "win32")
+
+if not HEADLESS:
+    from ctypes import windll
+
+
+# In-memory model of the keyboard state, updated with the keyStates array
+# (the result of GetKeyboardState() in PIMELauncher) of each key event.
+class KeyStateModel:
+    def __init__(self):
+        self.keyStates = bytes(256)
+
+    # keyStates is any sequence of 256 states (the list decoded from JSON, ...)
+    # which is not modified afterwards, it is kept as is without copying
+    def update(self, keyStates):
+        # keep the previous states if the launcher did not send them
+        if keyStates:
+            self.keyStates = keyStates  # replaced as a whole
+
+    # same bits as the SHORT returned by GetKeyState()
+    def getKeyState(self, keyCode):
+        state = self.keyStates[keyCode]
+        return (-0x8000 if state & 0x80 else 0) | (state & 1)
+
+    def isPressed(self, keyCode):
+        return (self.keyStates[keyCode] & 0x80) != 0
+
+
+keyStateModel = KeyStateModel()
+
+
+def updateKeyStates(keyEvent):
+    if HEADLESS:
+        # the unpacked states, KeyEvent.keyStates would pack them into bytes for every key event
+        keyStateModel.update(keyEvent._states)
+
+
+def getKeyState(keyCode):
+    if HEADLESS:
+        return keyStateModel.getKeyState(keyCode)
+    return windll.user32.GetKeyState(keyCode)
+
+
+# https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getasynckeystate
+def isPressed(keyCode):
+    if HEADLESS:
+        return keyStateModel.isPressed(keyCode)
+    return windll.user32.GetAsyncKeyState(keyCode) >= 1
+
+
+def playSound(name):
+    if not HEADLESS:
+        import winsound  # only imported when a sound is played
+        winsound.PlaySound(name, winsound.SND_ASYNC)
+
+
+# run a program with ShellExecuteW(), returns > 32 on success
+def shellExecute(program, params, workingDir):
+    if HEADLESS:
+        return 0
+    return windll.shell32.ShellExecuteW(None, "open", program, params, workingDir, 0)  # SW_HIDE = 0 (hide the window)
+
+
+def startFile(path):
+    if not HEADLESS:
+        os.startfile(path)
+
+
+# root directory of the user data (configs, user phrases, statistics, ...)
+# %APPDATA% on Windows and can be changed with PIME_DATA_ROOT.
+def getDataRoot():
+    dataRoot = os.environ.get("PIME_DATA_ROOT")
+    if dataRoot:
+        return dataRoot
+    if sys.platform == "win32":
+        return os.path.expandvars("%APPDATA%")
+    return os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+
+
+# directory of the user data of an input method, created if needed
+def getDataDir(name):
+    dataDir = os.path.join(getDataRoot(), "PIME", name)
+    os.makedirs(dataDir, mode=0o700, exist_ok=True)
+    return dataDir
+
+
+# resident memory (working set) of a process in bytes, 0 if unknown
+def getProcessMemory(pid):
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return 0
+        try:
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            if kernel32.K32GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+            return 0
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        with open("/proc/%d/status" % pid) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
@@ -17,8 +17,14 @@
 
 import json
 import sys
+import time
 import traceback
 import os
+import asyncio
+import threading
+import collections
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 if __name__ == "__main__":
     sys.path.append('python3')
@@ -26,29 +32,75 @@ if __name__ == "__main__":
 sys.path.append(os.path.dirname(__file__))    
 
 
+from perfStats import perfStats  # imported first to profile the other imports with PIME_IMPORT_PROFILE
 from serviceManager import textServiceMgr
+import platformShim
+
+
+# Optional protocol extensions supported by this server.
+# A launcher may list the extensions it wants in the "protocolExtensions"
+# field of the "init" request, and the accepted ones are returned in the
+# "protocolExtensions" field of the reply. Old launchers never ask for any
+# extension so they always get the original protocol.
+#  "batch": a request line may contain a JSON array of messages of the same
+#           client, they are handled in order and a JSON array of replies
+#           is returned in a single reply line.
+#  "deltaReply": the composition string and the candidate list are only sent
+#           when they are changed (see TextService.encodeReplyDelta()).
+#  "modifierMask": key events may contain a "modifiers" bitmask (see the
+#           MODIFIER_XXX flags in textService.py) instead of the 256 entries
+#           "keyStates" array.
+PROTOCOL_EXTENSIONS = ("batch", "deltaReply", "modifierMask")
+
+
+# Parse the JSON part of a request line. A request is a message object or,
+# with the "batch" extension, an array of message objects.
+def parse_request(data):
+    msg = json.loads(data)  # json accepts UTF-8 encoded bytes directly
+    if isinstance(msg, list):
+        if all(isinstance(m, dict) for m in msg):
+            return msg
+    elif isinstance(msg, dict):
+        return msg
+    raise ValueError("invalid request")
+
+
+def get_seq_num(msg):
+    return msg.get("seqNum", 0) if isinstance(msg, dict) else 0
 
 
 class Client(object):
     def __init__(self, server):
         self.server = server
         self.service = None
+        self.initMsg = None
+        self.protocolExtensions = set()
+        self.snapshot = None  # state of the text service if it was dropped
+        self.lastActiveTime = time.monotonic()
+        self.busy = False  # a request is being handled (only used by AsyncServer)
 
     def init(self, msg):
+        self.initMsg = msg
         self.guid = msg["id"]
         self.isWindows8Above = msg["isWindows8Above"]
         self.isMetroApp = msg["isMetroApp"]
         self.isUiLess = msg["isUiLess"]
         self.isUiLess = msg["isConsole"]
+        self.protocolExtensions = {ext for ext in msg.get("protocolExtensions", ()) if ext in PROTOCOL_EXTENSIONS}
         # create the text service
         self.service = textServiceMgr.createService(self, self.guid)
         return (self.service is not None)
 
     def handleRequest(self, msg): # msg is a json object
+        startTime = time.perf_counter_ns()
+        textServiceMgr.markActive()
         method = msg.get("method")
         seqNum = msg.get("seqNum", 0)
         # print("handle message: ", str(id(self)), method, seqNum)
         service = self.service
+        if not service and self.initMsg is not None and method != "init":
+            # the text service was dropped after an error, create a new one
+            service = self.rebuildService()
         if service:
             # let the text service handle the message
             reply = service.handleRequest(msg)
@@ -57,66 +109,726 @@ class Client(object):
             success = False
             if method == "init": # initialize the text service
                 success = self.init(msg)
+                if "protocolExtensions" in msg:
+                    reply["protocolExtensions"] = sorted(self.protocolExtensions)
             reply["success"] = success
         # print(reply)
+        perfStats.recordRequest(getattr(self, "guid", ""), method, time.perf_counter_ns() - startTime)
         return reply
 
+    # Drop the text service after an unhandled error since its state may be broken.
+    # A new one is created for the next request of this client.
+    def resetService(self):
+        service = self.service
+        self.service = None
+        if service is not None:
+            # The client still thinks the text service is activated and will not
+            # send onActivate again, so rebuildService() activates the new one.
+            self.snapshot = {"isActivated": service.isActivated, "keyboardOpen": service.keyboardOpen}
+
+    # Drop the text service of an idle client but keep a snapshot of its state.
+    # A new one is created from the snapshot for the next request of this client.
+    def evictService(self):
+        service = self.service
+        if service is not None:
+            self.snapshot = service.getSnapshot()
+            self.service = None
+
+    # Keep only the activation state in the snapshot of an evicted client,
+    # which is enough to rebuild a working text service.
+    def trimSnapshot(self):
+        snapshot = self.snapshot
+        if snapshot is not None:
+            self.snapshot = {"isActivated": snapshot.get("isActivated", False),
+                             "keyboardOpen": snapshot.get("keyboardOpen", False)}
+
+    def rebuildService(self):
+        self.service = service = textServiceMgr.createService(self, self.guid)
+        if service and self.snapshot is not None:
+            service.restoreSnapshot(self.snapshot)
+            self.snapshot = None
+            if service.isActivated:
+                # The client activated the old text service and will not send
+                # onActivate again, but text services may only set up their
+                # input context in onActivate(). The client still has the
+                # buttons and preserved keys of the old one, so the reply of
+                # this activation is dropped.
+                reply = service.currentReply
+                service.currentReply = {}
+                service.onActivate()
+                service.currentReply = reply
+        return service
+
+    def handleBatch(self, msgs): # msgs is a json array of requests
+        if "batch" not in self.protocolExtensions:
+            # the launcher did not negotiate batched requests during init
+            return [{"seqNum": msg.get("seqNum", 0), "success": False} for msg in msgs]
+        replies = []
+        for msg in msgs:
+            if msg.get("method") in ("init", "close"):
+                # these change the client itself and should be sent alone
+                replies.append({"seqNum": msg.get("seqNum", 0), "success": False})
+            else:
+                replies.append(self.handleRequest(msg))
+        return replies
+
 
 class Server(object):
-    def __init__(self):
-        self.clients = {}
+    # size of each read from stdin, a batch contains all requests in a chunk
+    READ_CHUNK_SIZE = 65536
+
+    def __init__(self, input=None, output=None):
+        # Errors of a text service only reset the text service of that client.
+        # If more than crash_budget errors happen within crash_window seconds,
+        # the server process exits and gets restarted by PIMELauncher.
+        self.crash_budget = int(os.environ.get("PIME_CRASH_BUDGET", "5"))
+        self.crash_window = float(os.environ.get("PIME_CRASH_WINDOW", "60"))
+        self.crash_times = collections.deque()
+        # Text services of the least recently used clients are dropped when
+        # there are more than max_clients clients or they are idle for
+        # idle_timeout seconds. Their Client objects are kept in
+        # evicted_clients, at most max_evicted_clients of them. Older ones are
+        # moved to trimmed_clients with only their init request and activation
+        # state, so they can still be rebuilt until they are closed.
+        self.max_clients = int(os.environ.get("PIME_MAX_CLIENTS", "50"))
+        self.idle_timeout = float(os.environ.get("PIME_CLIENT_IDLE_TIMEOUT", "900"))
+        self.max_evicted_clients = int(os.environ.get("PIME_MAX_EVICTED_CLIENTS", "1000"))
+        self.clients = collections.OrderedDict()  # ordered from least to most recently used
+        self.evicted_clients = collections.OrderedDict()
+        self.trimmed_clients = {}
+        # requests and replies are UTF-8 encoded JSON, so we use binary streams
+        # directly and skip the text layer of sys.stdin and sys.stdout.
+        self.input = input if input is not None else sys.stdin.buffer
+        self.output = output if output is not None else sys.stdout.buffer
+        # Record the raw requests and replies with their monotonic timestamps
+        # to PIME_TRACE_FILE, so a session can be replayed offline with
+        # benchmarks/replay_trace.py. Each record is a line in the format
+        # "<Q|R> <nanoseconds since the first record> <raw line>", where
+        # Q is a request "<client_id>|<json>" and R is a reply "<client_id>|<json>".
+        self.trace = None
+        trace_file = os.environ.get("PIME_TRACE_FILE")
+        if trace_file:
+            self.trace = open(trace_file, "ab")
+            self.trace_start = time.monotonic_ns()
 
     def run(self):
+        for batch in self.read_batches():
+            for line in batch:
+                try:
+                    self.handle_line(line)
+                except Exception as e:
+                    self.handle_error(e, line)
+                    if self.record_crash():
+                        self.flush()
+                        # Terminate the python server process if too many errors happen.
+                        # The python server will be restarted later by PIMELauncher.
+                        sys.exit(1)
+            # send all replies of the batch at once
+            self.flush()
+
+    # Read stdin in large chunks and yield the complete lines in each chunk.
+    # The remaining partial line is kept until the next chunk arrives.
+    def read_batches(self):
+        read = getattr(self.input, "read1", self.input.read)
+        pending = b""
         while True:
-            line = ""
-            client_id = ""
-            try:
-                line = input().strip()
-                if not line:
-                    continue
-                # parse PIME requests (one request per line):
-                # request format: "<client_id>|<JSON string>\n"
-                # response format: "PIME_MSG|<client_id>|<JSON string>\n"
-                client_id, msg_text = line.split('|', maxsplit=1)
-                msg = json.loads(msg_text)
-                client = self.clients.get(client_id)
-                if not client:
-                    # create a Client instance for the client
-                    client = Client(self)
-                    self.clients[client_id] = client
-                    print("new client:", client_id)
-                if msg.get("method") == "close":  # special handling for closing a client
-                    self.remove_client(client_id)
-                else:
-                    ret = client.handleRequest(msg)
-                    # Send the response to the client via stdout
-                    # one response per line in the format "PIME_MSG|<client_id>|<json reply>"
-                    reply_line = '|'.join(["PIME_MSG", client_id, json.dumps(ret, ensure_ascii=False)])
-                    print(reply_line)
-            except EOFError:
-                # stop the server
+            chunk = read(self.READ_CHUNK_SIZE)
+            if not chunk:  # EOF, stop the server
+                if pending.strip():
+                    yield [pending]
+                break
+            if pending:
+                chunk = pending + chunk
+            end = chunk.rfind(b"\n")
+            if end < 0:
+                pending = chunk
+                continue
+            pending = chunk[end + 1:]
+            yield chunk[:end].split(b"\n")
+
+    # parse PIME requests (one request per line):
+    # request format: "<client_id>|<JSON string>\n"
+    # response format: "PIME_MSG|<client_id>|<JSON string>\n"
+    def handle_line(self, line):
+        if self.trace and line.strip():
+            self.record_trace(b"Q", line)
+        sep = line.find(b"|")
+        if sep < 0:
+            if line.strip():
+                raise ValueError("invalid request")
+            return
+        client_id = line[:sep].strip().decode("UTF-8")
+        msg = parse_request(line[sep + 1:])
+        reply = self.handle_message(client_id, msg)
+        if reply is not None:
+            self.write_reply(client_id, reply)
+
+    def handle_message(self, client_id, msg):
+        if isinstance(msg, dict):
+            method = msg.get("method")
+            if method == "close":  # special handling for closing a client
+                self.remove_client(client_id)
+                return None
+            elif method == "stats":  # reserved method returning the performance statistics
+                return self.get_stats(msg)
+        client = self.get_client(client_id)
+        ret = self.dispatch(client, msg)
+        self.evict_clients()
+        return ret
+
+    def dispatch(self, client, msg):
+        try:
+            if isinstance(msg, list):  # batched requests
+                return client.handleBatch(msg)
+            return client.handleRequest(msg)
+        except Exception as e:
+            if self.record_crash():
+                raise  # too many errors, restart the whole server
+            return self.handle_client_error(client, msg, e)
+
+    # Record an error and return True if the crash budget is exceeded.
+    def record_crash(self):
+        now = time.monotonic()
+        crash_times = self.crash_times
+        crash_times.append(now)
+        while crash_times and now - crash_times[0] > self.crash_window:
+            crash_times.popleft()
+        return len(crash_times) > self.crash_budget
+
+    def handle_client_error(self, client, msg, e):
+        print("ERROR:", e, json.dumps(msg, ensure_ascii=False))
+        # print the exception traceback for ease of debugging
+        traceback.print_exc()
+        client.resetService()
+        error = {"type": type(e).__name__, "message": str(e)}
+        if isinstance(msg, list):
+            return [{"seqNum": get_seq_num(m), "success": False, "error": error} for m in msg]
+        return {"seqNum": get_seq_num(msg), "success": False, "error": error}
+
+    def get_client(self, client_id):
+        client = self.clients.get(client_id)
+        if client:
+            self.clients.move_to_end(client_id)
+        else:
+            client = self.evicted_clients.pop(client_id, None) or self.trimmed_clients.pop(client_id, None)
+            if not client:
+                # create a Client instance for the client
+                client = Client(self)
+                print("new client:", client_id)
+            self.clients[client_id] = client
+        client.lastActiveTime = time.monotonic()
+        return client
+
+    def evict_clients(self):
+        clients = self.clients
+        now = time.monotonic()
+        while clients:
+            client_id, client = next(iter(clients.items()))  # the least recently used one
+            if len(clients) <= self.max_clients and now - client.lastActiveTime < self.idle_timeout:
+                break
+            if client.busy:
                 break
-            except Exception as e:
-                print("ERROR:", e, line)
-                # print the exception traceback for ease of debugging
-                traceback.print_exc()
-                # generate an empty output containing {success: False} to prevent the client from being blocked
-                reply_line = '|'.join(["PIME_MSG", client_id, '{"success":false}'])
-                print(reply_line)
-                # Just terminate the python server process if any unknown error happens.
-                # The python server will be restarted later by PIMELauncher.
-                sys.exit(1)
+            del clients[client_id]
+            client.evictService()
+            self.evicted_clients[client_id] = client
+            if len(self.evicted_clients) > self.max_evicted_clients:
+                client_id, client = self.evicted_clients.popitem(last=False)
+                client.trimSnapshot()
+                self.trimmed_clients[client_id] = client
+
+    def format_reply(self, client_id, ret):
+        # one response per line in the format "PIME_MSG|<client_id>|<json reply>"
+        return b"".join((b"PIME_MSG|", client_id.encode("UTF-8"), b"|",
+            json.dumps(ret, ensure_ascii=False).encode("UTF-8"), b"\n"))
+
+    def write_reply(self, client_id, ret):
+        # replies are buffered and sent to PIMELauncher in flush()
+        reply = self.format_reply(client_id, ret)
+        self.output.write(reply)
+        if self.trace:
+            self.record_trace(b"R", reply[9:-1])  # strip "PIME_MSG|" and the newline
+
+    def record_trace(self, kind, line):
+        timestamp = str(time.monotonic_ns() - self.trace_start).encode("ascii")
+        self.trace.write(b"".join((kind, b" ", timestamp, b" ", line.rstrip(b"\r\n"), b"\n")))
+
+    def flush(self):
+        if self.trace:
+            self.trace.flush()
+        if self.output is getattr(sys.stdout, "buffer", None):
+            sys.stdout.flush()  # also send the text printed by the text services
+        else:
+            self.output.flush()
+
+    def handle_error(self, e, line, client_id=None):
+        if isinstance(line, bytes):
+            line = line.decode("UTF-8", "replace")
+        if client_id is None:
+            client_id = line.split("|", maxsplit=1)[0].strip() if "|" in line else ""
+        print("ERROR:", e, line)
+        # print the exception traceback for ease of debugging
+        traceback.print_exc()
+        # generate an empty output containing {success: False} to prevent the client from being blocked
+        reply = b"".join((client_id.encode("UTF-8"), b'|{"success":false}'))
+        self.output.write(b"".join((b"PIME_MSG|", reply, b"\n")))
+        if self.trace:
+            self.record_trace(b"R", reply)
+
+    def get_stats(self, msg):
+        return {"seqNum": msg.get("seqNum", 0), "success": True, "stats": perfStats.toJson()}
 
     def remove_client(self, client_id):
         print("client disconnected:", client_id)
+        self.clients.pop(client_id, None)
+        self.evicted_clients.pop(client_id, None)
+        self.trimmed_clients.pop(client_id, None)
+
+
+# Optional asyncio based server (enabled with --async or PIME_ASYNC_SERVER=1).
+# The line protocol is exactly the same as Server.run(), but reading the
+# requests and sending the replies is done by the event loop while the
+# requests are handled, and each client has its own queue of requests.
+# The requests are handled one at a time on a single dispatch thread since
+# the text services and the state they share (the key states, the shared
+# cin tables and configs, ...) are not thread-safe. Slow work like loading
+# tables is done in the background threads of the text services.
+class AsyncServer(Server):
+    def __init__(self, input=None, output=None):
+        Server.__init__(self, input, output)
+        self.executor = ThreadPoolExecutor(max_workers=1)  # the dispatch thread
+        self.queues = {}  # client_id => asyncio.Queue of pending requests
+        self.workers = {}  # client_id => asyncio.Task handling the queue
+        self.flush_scheduled = False
+        self.pending = b""  # partial line read from the input
+        self.exit_code = 0
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        finally:
+            self.executor.shutdown(wait=False)
+        if self.exit_code:
+            sys.exit(self.exit_code)
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        reader = await self.open_input()
+        read_task = asyncio.ensure_future(self.read_requests(reader))
+        stop_task = asyncio.ensure_future(self.stopped.wait())
+        await asyncio.wait([read_task, stop_task], return_when=asyncio.FIRST_COMPLETED)
+        if not self.stopped.is_set():
+            # EOF: let the clients finish their pending requests
+            for client_id in list(self.queues):
+                self.queues[client_id].put_nowait(None)
+            if self.workers:
+                await asyncio.wait(list(self.workers.values()))
+        for task in (read_task, stop_task):
+            task.cancel()
+        self.flush()
+
+    async def open_input(self):
+        reader = asyncio.StreamReader(limit=2 ** 20)
+        try:
+            self.input.fileno()  # in-memory streams cannot be read by the event loop
+            protocol = asyncio.StreamReaderProtocol(reader)
+            await self.loop.connect_read_pipe(lambda: protocol, self.input)
+        except (ValueError, OSError, NotImplementedError, AttributeError):
+            # the input is not a pipe (a regular file, for example) or the event loop
+            # does not support pipes. Read it in a daemon thread instead.
+            reader = asyncio.Queue()
+            thread = threading.Thread(target=self.read_input_thread, args=(reader,), daemon=True)
+            thread.start()
+        return reader
+
+    def read_input_thread(self, queue):
+        for batch in self.read_batches():
+            self.loop.call_soon_threadsafe(queue.put_nowait, batch)
+        self.loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    async def read_batch(self, reader):
+        if isinstance(reader, asyncio.Queue):
+            return await reader.get()
+        # same framing as Server.read_batches()
+        while True:
+            chunk = await reader.read(self.READ_CHUNK_SIZE)
+            if not chunk:  # EOF
+                pending, self.pending = self.pending, b""
+                return [pending] if pending.strip() else None
+            if self.pending:
+                chunk = self.pending + chunk
+            end = chunk.rfind(b"\n")
+            if end < 0:
+                self.pending = chunk
+                continue
+            self.pending = chunk[end + 1:]
+            return chunk[:end].split(b"\n")
+
+    async def read_requests(self, reader):
+        while True:
+            batch = await self.read_batch(reader)
+            if batch is None:  # EOF
+                break
+            for line in batch:
+                if self.trace and line.strip():
+                    self.record_trace(b"Q", line)
+                try:
+                    sep = line.find(b"|")
+                    if sep < 0:
+                        if line.strip():
+                            raise ValueError("invalid request")
+                        continue
+                    client_id = line[:sep].strip().decode("UTF-8")
+                    msg = parse_request(line[sep + 1:])
+                    queue = self.queues.get(client_id)
+                    if queue is None:
+                        queue = self.queues[client_id] = asyncio.Queue()
+                        self.workers[client_id] = asyncio.ensure_future(self.client_worker(client_id, queue))
+                    queue.put_nowait((line, msg))
+                except Exception as e:
+                    if not self.record_crash():
+                        self.handle_error(e, line)  # invalid request
+                        continue
+                    self.fail(e, line)
+                    return
+
+    async def client_worker(self, client_id, queue):
+        while True:
+            item = await queue.get()
+            if item is None:  # stop the server
+                break
+            line, msg = item
+            if isinstance(msg, dict) and msg.get("method") == "stats":
+                self.write_reply(client_id, self.get_stats(msg))
+                continue
+            if isinstance(msg, dict) and msg.get("method") == "close":  # special handling for closing a client
+                self.remove_client(client_id)
+                if queue.empty():
+                    # nothing left for this client, the reader creates a new worker if needed
+                    del self.queues[client_id]
+                    del self.workers[client_id]
+                    break
+                continue
+            client = self.get_client(client_id)
+            client.busy = True
+            try:
+                ret = await self.loop.run_in_executor(self.executor, self.dispatch, client, msg)
+            except Exception as e:  # the crash budget is exceeded
+                self.fail(e, line, client_id)
+                break
+            finally:
+                client.busy = False
+            self.write_reply(client_id, ret)
+            self.evict_clients()
+
+    def write_reply(self, client_id, ret):
+        Server.write_reply(self, client_id, ret)
+        # flush once after all the replies ready in this iteration of the event loop
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.loop.call_soon(self.scheduled_flush)
+
+    def scheduled_flush(self):
+        self.flush_scheduled = False
+        self.flush()
+
+    def fail(self, e, line, client_id=None):
+        self.handle_error(e, line, client_id)
+        self.flush()
+        # Same policy as Server.run(): terminate the process when the crash
+        # budget is exceeded and let PIMELauncher restart us.
+        self.exit_code = 1
+        self.stopped.set()
+
+
+# A worker process of SupervisorServer, running a normal server.py
+class Worker(object):
+    def __init__(self, supervisor, key):
+        self.supervisor = supervisor
+        self.key = key  # GUID of the text service
+        self.process = None  # None if the worker is not running
+        self.reader = None
+        self.clients = set()  # id of the clients routed to this worker
+        self.pending_replies = {}  # client_id => number of requests waiting for replies
+        self.skipped_replies = {}  # client_id => number of replies of replayed init requests
+        self.pending_stats = {}  # client_id => number of stats requests waiting for replies
+        self.restarts = 0
+
+    # start the worker process, called with supervisor.lock held
+    def start(self, replay_lines):
+        env = dict(os.environ)
+        env["PIME_SUPERVISOR"] = "0"
+        # only the supervisor records the trace and the statistics of the whole session
+        env.pop("PIME_TRACE_FILE", None)
+        env.pop("PIME_STATS_FILE", None)
+        # each worker only keeps the warm pool of its own text service
+        env["PIME_WARM_SERVICES"] = self.key if self.key in textServiceMgr.warmGuids else ""
+        args = [sys.executable, os.path.abspath(__file__)]
+        if "--async" in sys.argv[1:]:
+            args.append("--async")
+        creationflags = getattr(subprocess, "CREATE_NO_WINDOW", 0)  # no console window on Windows
+        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   env=env, creationflags=creationflags)
+        self.process = process
+        self.pending_replies = {}
+        self.skipped_replies = {}
+        self.pending_stats = {}
+        # recreate the text services of the existing clients, their replies are not sent to the launcher
+        replay = []
+        for client_id, line in replay_lines:
+            self.skipped_replies[client_id] = self.skipped_replies.get(client_id, 0) + 1
+            replay.append(line + b"\n")
+        if replay:
+            self.write(b"".join(replay))
+        self.reader = threading.Thread(target=self.read_replies, args=(process,), daemon=True)
+        self.reader.start()
+
+    def write(self, data):
+        try:
+            self.process.stdin.write(data)
+        except (OSError, ValueError):
+            pass  # the worker is dead, handled by read_replies()
+
+    def flush(self):
         try:
-            del self.clients[client_id]
-        except KeyError:
+            self.process.stdin.flush()
+        except (OSError, ValueError):
             pass
 
+    def read_replies(self, process):
+        supervisor = self.supervisor
+        read = process.stdout.read1
+        pending = b""
+        while True:
+            chunk = read(Server.READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            if pending:
+                chunk = pending + chunk
+            end = chunk.rfind(b"\n")
+            if end < 0:
+                pending = chunk
+                continue
+            pending = chunk[end + 1:]
+            supervisor.forward_replies(self, chunk[:end].split(b"\n"))
+        process.wait()
+        supervisor.worker_exited(self, process)
+
+    def stop(self):
+        process = self.process
+        if process is not None:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+            self.reader.join()
+
+    def get_stats(self):
+        process = self.process
+        return {
+            "pid": process.pid if process else 0,
+            "memory": platformShim.getProcessMemory(process.pid) if process else 0,
+            "clients": len(self.clients),
+            "restarts": self.restarts,
+        }
+
+
+# Optional supervisor mode (enabled with --supervisor or PIME_SUPERVISOR=1).
+# The clients are routed to worker processes by the GUID of their text
+# service, so slow requests of one input method (loading tables, ...) no
+# longer hold the GIL needed by the other ones. PIMELauncher still talks to
+# a single process with the same stdin/stdout protocol. If a worker dies,
+# the pending requests of its clients get {success: false} and the worker
+# is restarted on the next request. The restarted worker gets the init
+# request of each client, followed by its last activation and keyboard
+# status requests, so the text services are activated again as the
+# launcher expects.
+class SupervisorServer(Server):
+    # requests replayed to a restarted worker, in this order
+    REPLAY_METHODS = ("init", "onActivate", "onKeyboardStatusChanged")
+
+    def __init__(self, input=None, output=None):
+        Server.__init__(self, input, output)
+        # protects the workers, the output and the states below
+        # since the replies are forwarded by the reader threads of the workers
+        self.lock = threading.Lock()
+        self.workers = {}  # GUID => Worker
+        self.client_workers = {}  # client_id => Worker
+        self.replay_lines = {}  # client_id => {method in REPLAY_METHODS: raw request}
+
+    def run(self):
+        # start the workers of the warm text services in advance
+        with self.lock:
+            for guid in textServiceMgr.warmGuids:
+                self.get_worker(guid).start([])
+        try:
+            for batch in self.read_batches():
+                written = set()
+                for line in batch:
+                    try:
+                        worker = self.handle_line(line)
+                        if worker is not None:
+                            written.add(worker)
+                    except Exception as e:
+                        with self.lock:
+                            self.handle_error(e, line)
+                            self.flush()
+                # send all requests of the batch at once
+                for worker in written:
+                    worker.flush()
+        finally:
+            for worker in list(self.workers.values()):
+                worker.stop()
+
+    def handle_line(self, line):
+        sep = line.find(b"|")
+        if sep < 0:
+            if line.strip():
+                raise ValueError("invalid request")
+            return None
+        client_id = line[:sep].strip().decode("UTF-8")
+        msg = parse_request(line[sep + 1:])
+        method = msg.get("method") if isinstance(msg, dict) else None
+        with self.lock:
+            if self.trace:
+                self.record_trace(b"Q", line)
+            # stats are answered by the worker of the client after its pending requests,
+            # the supervisor adds the figures of the worker processes in forward_replies()
+            worker = self.route_client(client_id, msg, method)
+            if worker.process is None:
+                if worker.reader is not None:
+                    worker.restarts += 1
+                worker.start(self.get_replay_lines(worker, client_id, method))
+            if method != "close":
+                self.record_replay(client_id, line, msg)
+                worker.pending_replies[client_id] = worker.pending_replies.get(client_id, 0) + 1
+            if method == "stats":
+                worker.pending_stats[client_id] = worker.pending_stats.get(client_id, 0) + 1
+        worker.write(line + b"\n")
+        return worker
+
+    def route_client(self, client_id, msg, method):
+        worker = self.client_workers.get(client_id)
+        if method == "init":
+            new_worker = self.get_worker(msg.get("id", "").lower())
+            if worker is not None and worker is not new_worker:
+                worker.clients.discard(client_id)
+            worker = new_worker
+        elif worker is None:
+            # clients without init are handled by the default worker
+            worker = self.get_worker("")
+        if method == "close":
+            worker.clients.discard(client_id)
+            self.client_workers.pop(client_id, None)
+            self.replay_lines.pop(client_id, None)
+        else:
+            worker.clients.add(client_id)
+            self.client_workers[client_id] = worker
+        return worker
+
+    # keep the requests needed to recreate the state of the text service of a client
+    def record_replay(self, client_id, line, msg):
+        if isinstance(msg, list):  # batched requests, record the messages one by one
+            for m in msg:
+                self.record_replay(client_id, b"".join((client_id.encode("UTF-8"), b"|",
+                                   json.dumps(m, ensure_ascii=False).encode("UTF-8"))), m)
+            return
+        method = msg.get("method")
+        if method == "init":
+            self.replay_lines[client_id] = {"init": line}
+            return
+        lines = self.replay_lines.get(client_id)
+        if lines is None:
+            return
+        if method == "onActivate":
+            lines["onActivate"] = line
+            lines.pop("onKeyboardStatusChanged", None)  # included in onActivate
+        elif method == "onDeactivate":
+            lines.pop("onActivate", None)
+            lines.pop("onKeyboardStatusChanged", None)
+        elif method == "onKeyboardStatusChanged":
+            lines["onKeyboardStatusChanged"] = line
+
+    # requests replayed to a restarted worker, the client sending init gets a new text service
+    def get_replay_lines(self, worker, client_id, method):
+        replay = []
+        for cid in worker.clients:
+            lines = self.replay_lines.get(cid)
+            if lines is None or (cid == client_id and method == "init"):
+                continue
+            for replay_method in self.REPLAY_METHODS:
+                if replay_method in lines:
+                    replay.append((cid, lines[replay_method]))
+        return replay
+
+    def get_worker(self, key):
+        worker = self.workers.get(key)
+        if worker is None:
+            worker = self.workers[key] = Worker(self, key)
+        return worker
+
+    # called by the reader thread of a worker
+    def forward_replies(self, worker, lines):
+        with self.lock:
+            for line in lines:
+                if line.startswith(b"PIME_MSG|"):
+                    client_id = line[9:line.find(b"|", 9)].decode("UTF-8")
+                    if worker.skipped_replies.get(client_id):
+                        worker.skipped_replies[client_id] -= 1
+                        continue
+                    if worker.pending_replies.get(client_id):
+                        worker.pending_replies[client_id] -= 1
+                    if worker.pending_stats.get(client_id):
+                        line = self.add_worker_stats(worker, client_id, line)
+                    if self.trace:
+                        self.record_trace(b"R", line[9:])
+                self.output.write(line + b"\n")  # other lines are messages printed by the worker
+            self.flush()
+
+    # called by the reader thread when the worker process exits
+    def worker_exited(self, worker, process):
+        with self.lock:
+            if worker.process is not process:
+                return
+            worker.process = None
+            if process.returncode:
+                print("worker", worker.key, "exited with code", process.returncode)
+            # the launcher is still waiting for the replies of the requests sent to the dead worker
+            for client_id, count in worker.pending_replies.items():
+                reply = b"".join((client_id.encode("UTF-8"), b'|{"success":false}'))
+                for i in range(count):
+                    self.output.write(b"".join((b"PIME_MSG|", reply, b"\n")))
+                    if self.trace:
+                        self.record_trace(b"R", reply)
+            worker.pending_replies = {}
+            self.flush()
+
+    # add the figures of all the worker processes to the stats reply of a worker
+    def add_worker_stats(self, worker, client_id, line):
+        try:
+            reply = json.loads(line[line.find(b"|", 9) + 1:])
+        except ValueError:
+            return line
+        if not isinstance(reply, dict) or "stats" not in reply:
+            return line  # the reply of another request of the client
+        worker.pending_stats[client_id] -= 1
+        reply["stats"]["workers"] = {key: w.get_stats() for key, w in self.workers.items()}
+        return self.format_reply(client_id, reply)[:-1]
+
+    def flush(self):
+        sys.stdout.flush()  # the text printed by the supervisor
+        Server.flush(self)
+
 
 def main():
-    server = Server()
+    if "--supervisor" in sys.argv[1:] or os.environ.get("PIME_SUPERVISOR", "0") not in ("", "0"):
+        server = SupervisorServer()
+    elif "--async" in sys.argv[1:] or os.environ.get("PIME_ASYNC_SERVER", "0") not in ("", "0"):
+        server = AsyncServer()
+        textServiceMgr.startWarmUp()
+    else:
+        server = Server()
+        textServiceMgr.startWarmUp()
     server.run()
 
 
@@ -17,8 +17,14 @@
 
 import os
 import threading
+import time
 import json
 import importlib
+from perfStats import perfStats
+import platformShim
+
+# version of the format of the manifest cache
+MANIFEST_VERSION = 1
 
 class TextServiceInfo:
     def __init__(self):
@@ -34,7 +40,7 @@ class TextServiceInfo:
     def loadFromJson(self, jsonFile):
         dirName = os.path.dirname(jsonFile)
         self.dirName = os.path.basename(dirName)
-        self.modulePrefix = os.path.relpath(dirName).replace(os.sep, ".")
+        self.modulePrefix = "input_methods." + self.dirName
         # Read the moduleName(xxx.py) & serviceName(class name) from JSON
         jsonData = None
         with open(jsonFile, encoding = "UTF-8") as dataFile:
@@ -45,11 +51,30 @@ class TextServiceInfo:
             moduleName = jsonData.get("moduleName", "")
             if moduleName:
                 self.moduleName = "%s.%s" % (self.modulePrefix, moduleName)
-                print(self.moduleName)
             self.serviceName = jsonData.get("serviceName", "")
             self.guid = jsonData.get("guid", "").lower()
             self.configTool = jsonData.get("configTool", "")
 
+    # the fields kept in the manifest cache
+    def toJson(self):
+        return {
+            "dirName": self.dirName,
+            "name": self.name,
+            "moduleName": self.moduleName,
+            "serviceName": self.serviceName,
+            "guid": self.guid,
+            "configTool": self.configTool,
+        }
+
+    def loadFromManifest(self, entry):
+        self.dirName = entry.get("dirName", "")
+        self.modulePrefix = "input_methods." + self.dirName
+        self.name = entry.get("name", "")
+        self.moduleName = entry.get("moduleName", "")
+        self.serviceName = entry.get("serviceName", "")
+        self.guid = entry.get("guid", "")
+        self.configTool = entry.get("configTool", "")
+
     def createInstance(self, client):
         if not self.moduleName or not self.serviceName or not self.guid:
             return None
@@ -62,31 +87,177 @@ class TextServiceInfo:
         return self.textServiceClass(client) # create a new instance for this text service
 
 
+# Placeholder client of the text services created in advance by the warm pool.
+# The real client is set with TextService.attachClient() when it is handed out.
+class DormantClient:
+    def __init__(self, guid):
+        self.guid = guid
+        self.isWindows8Above = True
+        self.isMetroApp = False
+        self.isUiLess = False
+        self.isConsole = False
+        self.protocolExtensions = set()
+
+
 class TextServiceManager:
     def __init__(self):
         self.__lock = threading.Lock()
-        self.services = {}
+        self.manifest = {}  # guid => fields of TextServiceInfo
+        self.services = {}  # guid => TextServiceInfo, created on demand from the manifest
+        # Text services of the GUIDs listed in PIME_WARM_SERVICES (separated
+        # by commas) are imported and created in a background thread, so the
+        # first init of these GUIDs does not wait for the module import and
+        # the config and data files loading. After an instance is handed out,
+        # the pool is refilled once the server has been idle (no requests)
+        # for PIME_WARM_IDLE_DELAY seconds, so the refill does not compete
+        # with the requests of the client which just got the instance.
+        self.warmGuids = [guid.strip().lower() for guid in os.environ.get("PIME_WARM_SERVICES", "").split(",") if guid.strip()]
+        self.warmPoolSize = int(os.environ.get("PIME_WARM_POOL_SIZE", "1"))
+        self.warmIdleDelay = float(os.environ.get("PIME_WARM_IDLE_DELAY", "2.0"))
+        self.warmPools = {}  # guid => list of dormant text services
+        self.warmingGuids = set()  # guids being filled by a background thread
+        self.idleWarmUpThread = None  # waits for the server to be idle before refilling the pools
+        self.lastActiveTime = time.monotonic()
+        self.__warmLock = threading.Lock()
         self.enumerateServices()
 
+    # To enumerate currently installed Input Method
+    # The ime.json files are only parsed when the manifest cache is outdated.
+    # The cache is keyed on the modification time of the input_methods
+    # directory and all the ime.json files, so adding, removing or editing
+    # an input method is detected without reading the files.
     def enumerateServices(self):
-        # To enumerate currently installed Input Method
         currentDir = os.path.dirname(os.path.abspath(__file__))
         input_methods_dir = os.path.join(currentDir, "input_methods")
-        for subdir in os.listdir(input_methods_dir):
-            filename = os.path.join(input_methods_dir, subdir, "ime.json")
-            if os.path.exists(filename):
-                info = TextServiceInfo()
-                info.loadFromJson(filename)
-                print(info.guid)
-                if info.guid:
-                    self.services[info.guid] = info
+        signature = self.getManifestSignature(input_methods_dir)
+        cacheFile = self.getManifestCacheFile()
+        try:
+            with open(cacheFile, encoding="UTF-8") as f:
+                cache = json.load(f)
+            if cache.get("version") == MANIFEST_VERSION and cache.get("signature") == signature:
+                self.manifest = cache["services"]
+                return
+        except Exception:
+            pass  # no valid cache
+
+        manifest = {}
+        for subdir, mtime in signature["files"]:
+            info = TextServiceInfo()
+            try:
+                info.loadFromJson(os.path.join(input_methods_dir, subdir, "ime.json"))
+            except Exception as e:
+                print("ERROR: failed to load", subdir, e)
+                continue
+            if info.guid:
+                manifest[info.guid] = info.toJson()
+                self.services[info.guid] = info
+        self.manifest = manifest
+        try:
+            tempFile = cacheFile + ".tmp"
+            with open(tempFile, "w", encoding="UTF-8") as f:
+                json.dump({"version": MANIFEST_VERSION, "signature": signature, "services": manifest}, f, indent=1)
+            os.replace(tempFile, cacheFile)
+        except Exception:
+            pass  # FIXME: handle I/O errors?
+
+    def getManifestSignature(self, input_methods_dir):
+        files = []
+        for entry in os.scandir(input_methods_dir):
+            if entry.is_dir():
+                try:
+                    mtime = os.stat(os.path.join(entry.path, "ime.json")).st_mtime_ns
+                except OSError:
+                    continue
+                files.append([entry.name, mtime])
+        files.sort()
+        return {"dir": input_methods_dir, "mtime": os.stat(input_methods_dir).st_mtime_ns, "files": files}
+
+    def getManifestCacheFile(self):
+        return os.environ.get("PIME_MANIFEST_CACHE") or os.path.join(platformShim.getDataDir("cache"), "services.json")
+
+    # returns the information of the installed text services without importing them
+    def listServices(self):
+        return [dict(entry) for guid, entry in sorted(self.manifest.items())]
+
+    def getServiceInfo(self, guid):
+        info = self.services.get(guid)
+        if info is None:
+            entry = self.manifest.get(guid)
+            if entry is None:
+                return None
+            info = TextServiceInfo()
+            info.loadFromManifest(entry)
+            info = self.services.setdefault(guid, info)
+        return info
 
     def createService(self, client, guid):
         guid = guid.lower()
-        if guid in self.services:
-            info = self.services[guid]
-            return info.createInstance(client)
+        info = self.getServiceInfo(guid)
+        if info is not None:
+            # text services may be created from several threads by the async server
+            with self.__lock:
+                pool = self.warmPools.get(guid)
+                if pool:
+                    service = pool.pop()
+                    service.attachClient(client)
+                    perfStats.increment("warmServiceHits")
+                else:
+                    service = info.createInstance(client)
+            if guid in self.warmGuids:
+                self.startIdleWarmUp()
+            return service
         return None
 
+    # called by the server for each request, idle warm-ups wait until requests stop
+    def markActive(self):
+        self.lastActiveTime = time.monotonic()
+
+    # refill the warm pools once the server is idle
+    def startIdleWarmUp(self):
+        with self.__warmLock:
+            if self.idleWarmUpThread is not None:
+                return
+            self.idleWarmUpThread = threading.Thread(target=self.waitForIdle, daemon=True)
+            self.idleWarmUpThread.start()
+
+    def waitForIdle(self):
+        while True:
+            idleTime = time.monotonic() - self.lastActiveTime
+            if idleTime >= self.warmIdleDelay:
+                break
+            time.sleep(self.warmIdleDelay - idleTime)
+        with self.__warmLock:
+            self.idleWarmUpThread = None
+        self.startWarmUp()
+
+    # fill the warm pools of the guids in a background thread
+    def startWarmUp(self, guids=None):
+        with self.__warmLock:
+            guids = [guid for guid in (self.warmGuids if guids is None else guids)
+                     if guid in self.manifest and guid not in self.warmingGuids
+                     and len(self.warmPools.get(guid, ())) < self.warmPoolSize]
+            self.warmingGuids.update(guids)
+        if guids:
+            thread = threading.Thread(target=self.warmUp, args=(guids,), daemon=True)
+            thread.start()
+
+    def warmUp(self, guids):
+        for guid in guids:
+            try:
+                info = self.getServiceInfo(guid)
+                while len(self.warmPools.get(guid, ())) < self.warmPoolSize:
+                    # only adding the instance to the pool needs the lock, so a
+                    # foreground createService() is not blocked by the warm-up
+                    service = info.createInstance(DormantClient(guid))
+                    if service is None:
+                        break
+                    with self.__lock:
+                        self.warmPools.setdefault(guid, []).append(service)
+            except Exception as e:
+                print("ERROR: failed to create text service", guid, e)
+            finally:
+                with self.__warmLock:
+                    self.warmingGuids.discard(guid)
+
 
 textServiceMgr = TextServiceManager()
@@ -15,6 +15,8 @@
 # License along with this library; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 
+from platformShim import updateKeyStates
+
 # keyboard modifiers used by TSF (from msctf.h of Windows SDK)
 TF_MOD_ALT                       = 0x0001
 TF_MOD_CONTROL                   = 0x0002
@@ -33,20 +35,82 @@ COMMAND_LEFT_CLICK  = 0
 COMMAND_RIGHT_CLICK = 1
 COMMAND_MENU        = 2
 
+# modifier bitflags of KeyEvent.modifiers, also sent by the launcher in the
+# "modifiers" field instead of "keyStates" with the "modifierMask" protocol extension
+MODIFIER_SHIFT    = 0x0001
+MODIFIER_CONTROL  = 0x0002
+MODIFIER_ALT      = 0x0004
+MODIFIER_CAPSLOCK = 0x0008  # toggled
+MODIFIER_NUMLOCK  = 0x0010  # toggled
+MODIFIER_LSHIFT   = 0x0020
+MODIFIER_RSHIFT   = 0x0040
+
+# (virtual key code, bit of the key state, modifier bitflag)
+_MODIFIER_KEYS = (
+    (0x10, 0x80, MODIFIER_SHIFT),  # VK_SHIFT
+    (0x11, 0x80, MODIFIER_CONTROL),  # VK_CONTROL
+    (0x12, 0x80, MODIFIER_ALT),  # VK_MENU
+    (0x14, 0x01, MODIFIER_CAPSLOCK),  # VK_CAPITAL
+    (0x90, 0x01, MODIFIER_NUMLOCK),  # VK_NUMLOCK
+    (0xA0, 0x80, MODIFIER_LSHIFT),  # VK_LSHIFT
+    (0xA1, 0x80, MODIFIER_RSHIFT),  # VK_RSHIFT
+)
+
+
 class KeyEvent:
+    __slots__ = ("charCode", "keyCode", "repeatCount", "scanCode", "isExtended", "_modifiers", "_states", "_packed")
+
     def __init__(self, msg):
         self.charCode = msg["charCode"]
         self.keyCode = msg["keyCode"]
         self.repeatCount = msg["repeatCount"]
         self.scanCode = msg["scanCode"]
         self.isExtended = msg["isExtended"]
-        self.keyStates = msg["keyStates"]
+        self._packed = None
+        states = msg.get("keyStates")
+        if states is not None:
+            # the list decoded from JSON is used as is, it is only packed
+            # into bytes if someone needs the whole keyStates array.
+            self._states = states
+            self._modifiers = None  # computed on first use
+        else:
+            # only the modifier bitmask is sent, rebuild the key states from it
+            modifiers = msg.get("modifiers", 0)
+            self._modifiers = modifiers
+            states = bytearray(256)
+            for code, bit, flag in _MODIFIER_KEYS:
+                if modifiers & flag:
+                    states[code] |= bit
+            if msg.get("method") in ("filterKeyDown", "onKeyDown") and 0 < self.keyCode < 256:
+                states[self.keyCode] |= 0x80  # the key being pressed
+            self._states = states
+
+    # MODIFIER_XXX bitflags of the modifier keys
+    @property
+    def modifiers(self):
+        modifiers = self._modifiers
+        if modifiers is None:
+            states = self._states
+            modifiers = 0
+            for code, bit, flag in _MODIFIER_KEYS:
+                if states[code] & bit:
+                    modifiers |= flag
+            self._modifiers = modifiers
+        return modifiers
+
+    # key states of all virtual keys (the result of GetKeyboardState())
+    @property
+    def keyStates(self):
+        packed = self._packed
+        if packed is None:
+            packed = self._packed = bytes(self._states)
+        return packed
 
     def isKeyDown(self, code):
-        return (self.keyStates[code] & (1 << 7)) != 0
+        return (self._states[code] & 0x80) != 0
 
     def isKeyToggled(self, code):
-        return (self.keyStates[code] & 1) != 0
+        return (self._states[code] & 1) != 0
 
     def isChar(self):
         return (self.charCode != 0)
@@ -73,6 +137,16 @@ class TextService:
         self.compositionCursor = 0
         self.candidateCursor = 0
 
+        # composition and candidate state last sent to the client,
+        # used to encode delta replies (protocol extension "deltaReply")
+        self.lastReplyState = {}
+
+    # called when a text service created in advance is handed out to a client
+    # Derived classes applying settings which depend on the client (isUiLess, ...)
+    # in their constructor should apply them again here.
+    def attachClient(self, client):
+        self.client = client
+
     def updateStatus(self, msg):
         pass
 
@@ -80,56 +154,37 @@ class TextService:
     def checkConfigChange(self):
         pass
 
+    # Middlewares wrap the handling of every request of all text services.
+    # A middleware is called as middleware(service, method, msg, callNext)
+    # and should return callNext(service, method, msg), which returns a
+    # tuple (success, return value of the method).
+    middlewares = []
+    _pipeline = None
+
+    @staticmethod
+    def addMiddleware(middleware):
+        TextService.middlewares.append(middleware)
+        TextService._pipeline = None
+
+    @staticmethod
+    def removeMiddleware(middleware):
+        TextService.middlewares.remove(middleware)
+        TextService._pipeline = None
+
+    @staticmethod
+    def getPipeline():
+        pipeline = TextService._pipeline
+        if pipeline is None:
+            pipeline = TextService.dispatchMethod
+            for middleware in reversed(TextService.middlewares):
+                pipeline = _chainMiddleware(middleware, pipeline)
+            TextService._pipeline = pipeline
+        return pipeline
+
     def handleRequest(self, msg):  # msg is a json object
         method = msg.get("method", None)
         seqNum = msg.get("seqNum", 0)
-        success = True  # if the method is successfully handled
-        ret = None  # the return value of the method, if any
-
-        if self.isActivated:
-            self.checkConfigChange()  # check if configurations are changed
-
-        self.updateStatus(msg)
-        if method == "filterKeyDown":
-            keyEvent = KeyEvent(msg)
-            ret = self.filterKeyDown(keyEvent)
-        elif method == "onKeyDown":
-            keyEvent = KeyEvent(msg)
-            ret = self.onKeyDown(keyEvent)
-        elif method == "filterKeyUp":
-            keyEvent = KeyEvent(msg)
-            ret = self.filterKeyUp(keyEvent)
-        elif method == "onKeyUp":
-            keyEvent = KeyEvent(msg)
-            ret = self.onKeyUp(keyEvent)
-        elif method == "onPreservedKey":
-            guid = msg["guid"].lower()
-            ret = self.onPreservedKey(guid)
-        elif method == "onCommand":
-            commandId = msg["id"]
-            commandType = msg["type"]
-            self.onCommand(commandId, commandType)
-        elif method == "onMenu":
-            buttonId = msg["id"]
-            ret = self.onMenu(buttonId)
-        elif method == "onCompartmentChanged":
-            guid = msg["guid"].lower()
-            self.onCompartmentChanged(guid)
-        elif method == "onKeyboardStatusChanged":
-            opened = msg["opened"]
-            self.onKeyboardStatusChanged(opened)
-        elif method == "onCompositionTerminated":
-            forced = msg["forced"]
-            self.onCompositionTerminated(forced)
-        elif method == "onActivate":
-            self.isActivated = True
-            self.keyboardOpen = msg["isKeyboardOpen"]
-            self.onActivate()
-        elif method == "onDeactivate":
-            self.onDeactivate()
-            self.isActivated = False
-        else:
-            success = False
+        success, ret = self.getPipeline()(self, method, msg)
 
         # fetch the current reply of the method
         reply = self.currentReply
@@ -138,8 +193,50 @@ class TextService:
             reply["return"] = ret
         reply["success"] = success
         reply["seqNum"] = seqNum  # reply with sequence number added
+        if method in ("onActivate", "onDeactivate", "onCompositionTerminated"):
+            # the client resets its UI by itself in these cases
+            self.lastReplyState = {}
+        if "deltaReply" in getattr(self.client, "protocolExtensions", ()):
+            self.encodeReplyDelta(reply)
         return reply
 
+    # call the handler of the method in METHOD_HANDLERS
+    def dispatchMethod(self, method, msg):
+        self.updateStatus(msg)
+        entry = METHOD_HANDLERS.get(method)
+        if entry is None:
+            return False, None
+        return True, entry[0](self, msg)
+
+    # Remove the composition/candidate state which is unchanged since the last
+    # reply. The client keeps its current state for the fields not in a reply,
+    # so a reply is one of:
+    #  - unchanged: neither the candidate list nor the composition string is sent
+    #  - cursor-only: only candidateCursor/compositionCursor is sent
+    #  - replaced page: the new candidate list (and its cursor) is sent
+    def encodeReplyDelta(self, reply):
+        last = self.lastReplyState
+        if not reply["success"]:
+            # the state of the client is unknown, send everything next time
+            last.clear()
+            return
+        for key, cursorKey in (("compositionString", "compositionCursor"), ("candidateList", "candidateCursor")):
+            if key in reply:
+                value = reply[key]
+                if key in last and last[key] == value:
+                    del reply[key]
+                    if cursorKey in reply and last.get(cursorKey) == reply[cursorKey]:
+                        del reply[cursorKey]
+                else:
+                    # copy the list since it may be modified in place by the text service
+                    last[key] = list(value) if key == "candidateList" else value
+            if cursorKey in reply:
+                last[cursorKey] = reply[cursorKey]
+        if reply.get("showCandidates") is False:
+            # the candidate window is closed, resend the list when it is opened again
+            last.pop("candidateList", None)
+            last.pop("candidateCursor", None)
+
     # methods that should be implemented by derived classes
     def onActivate(self):
         pass
@@ -179,6 +276,25 @@ class TextService:
     def onKeyboardStatusChanged(self, opened):
         pass
 
+    # Return a small dict of the state needed to recreate this text service
+    # later with restoreSnapshot(). The server uses it to drop idle clients
+    # without losing their state. Derived classes can add more fields.
+    def getSnapshot(self):
+        return {
+            "isActivated": self.isActivated,
+            "keyboardOpen": self.keyboardOpen,
+            "compositionString": self.compositionString,
+            "compositionCursor": self.compositionCursor,
+        }
+
+    # Called on a newly created text service to restore the snapshot
+    # returned by getSnapshot().
+    def restoreSnapshot(self, snapshot):
+        self.isActivated = snapshot.get("isActivated", False)
+        self.keyboardOpen = snapshot.get("keyboardOpen", False)
+        self.compositionString = snapshot.get("compositionString", "")
+        self.compositionCursor = snapshot.get("compositionCursor", 0)
+
     # public methods that should not be touched
 
     # language bar buttons
@@ -280,3 +396,75 @@ class TextService:
 
     def hideMessage(self):
         self.currentReply["hideMessage"] = True
+
+
+def _chainMiddleware(middleware, callNext):
+    def call(service, method, msg):
+        return middleware(service, method, msg, callNext)
+    return call
+
+
+# handlers of the methods of the requests, the return value is sent in the reply
+def _handleKeyEvent(handlerName):
+    def handler(service, msg):
+        keyEvent = KeyEvent(msg)
+        updateKeyStates(keyEvent)
+        return getattr(service, handlerName)(keyEvent)
+    return handler
+
+def _handleOnPreservedKey(service, msg):
+    return service.onPreservedKey(msg["guid"].lower())
+
+def _handleOnCommand(service, msg):
+    service.onCommand(msg["id"], msg["type"])
+
+def _handleOnMenu(service, msg):
+    return service.onMenu(msg["id"])
+
+def _handleOnCompartmentChanged(service, msg):
+    service.onCompartmentChanged(msg["guid"].lower())
+
+def _handleOnKeyboardStatusChanged(service, msg):
+    service.onKeyboardStatusChanged(msg["opened"])
+
+def _handleOnCompositionTerminated(service, msg):
+    service.onCompositionTerminated(msg["forced"])
+
+def _handleOnActivate(service, msg):
+    service.isActivated = True
+    service.keyboardOpen = msg["isKeyboardOpen"]
+    service.onActivate()
+
+def _handleOnDeactivate(service, msg):
+    service.onDeactivate()
+    service.isActivated = False
+
+
+# method => (handler, if configurations should be checked before handling it)
+# The config check is skipped for the frequent key filtering and key up
+# events, the changes are applied by the following onKeyDown.
+METHOD_HANDLERS = {
+    "filterKeyDown": (_handleKeyEvent("filterKeyDown"), False),
+    "onKeyDown": (_handleKeyEvent("onKeyDown"), True),
+    "filterKeyUp": (_handleKeyEvent("filterKeyUp"), False),
+    "onKeyUp": (_handleKeyEvent("onKeyUp"), False),
+    "onPreservedKey": (_handleOnPreservedKey, True),
+    "onCommand": (_handleOnCommand, True),
+    "onMenu": (_handleOnMenu, True),
+    "onCompartmentChanged": (_handleOnCompartmentChanged, True),
+    "onKeyboardStatusChanged": (_handleOnKeyboardStatusChanged, True),
+    "onCompositionTerminated": (_handleOnCompositionTerminated, True),
+    "onActivate": (_handleOnActivate, True),
+    "onDeactivate": (_handleOnDeactivate, True),
+}
+
+
+# check if configurations are changed before handling the methods needing it
+def checkConfigMiddleware(service, method, msg, callNext):
+    if service.isActivated:
+        entry = METHOD_HANDLERS.get(method)
+        if entry is None or entry[1]:
+            service.checkConfigChange()
+    return callNext(service, method, msg)
+
+TextService.addMiddleware(checkConfigMiddleware)
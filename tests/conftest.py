@@ -0,0 +1,107 @@
+# Shared helpers of the tests of the python server
+#
+# Run from the top directory with: python -m pytest -q tests
+
+import io
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+# the config, count and cache files written by the tests are kept away from the user data
+os.environ.setdefault("PIME_DATA_ROOT", tempfile.mkdtemp(prefix="pime-test-"))
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "python")
+sys.path.insert(0, PYTHON_DIR)
+
+# chewing_test.py types into real windows on Windows, it is run by hand
+collect_ignore = ["chewing_test.py"]
+
+from textService import TextService  # noqa: E402
+
+
+FAKE_GUID = "{00000000-0000-0000-0000-00000000fa4e}"
+
+
+# A text service which, like chewing, only creates its input context in onActivate()
+class ContextService(TextService):
+    def __init__(self, client):
+        TextService.__init__(self, client)
+        self.context = None
+
+    def onActivate(self):
+        self.context = list(self.compositionString)
+        self.addButton("switch-lang", text="A")
+
+    def filterKeyDown(self, keyEvent):
+        return keyEvent.isPrintableChar()
+
+    def onKeyDown(self, keyEvent):
+        if keyEvent.charCode == ord("!"):
+            raise RuntimeError("broken key")
+        self.context.append(chr(keyEvent.charCode))
+        self.setCompositionString("".join(self.context))
+        return True
+
+
+def init_msg(seq_num=1, guid=FAKE_GUID, **kwargs):
+    msg = {"method": "init", "seqNum": seq_num, "id": guid, "isWindows8Above": True,
+           "isMetroApp": False, "isUiLess": False, "isConsole": False}
+    msg.update(kwargs)
+    return msg
+
+
+def key_msg(method, char, seq_num=1, modifiers=None):
+    msg = {"method": method, "seqNum": seq_num, "charCode": ord(char), "keyCode": ord(char.upper()),
+           "repeatCount": 1, "scanCode": 0, "isExtended": False}
+    if modifiers is None:
+        msg["keyStates"] = [0] * 256
+    else:
+        msg["modifiers"] = modifiers
+    return msg
+
+
+# Drives a Server in-process, one request line at a time
+class Session(object):
+    def __init__(self, server):
+        self.server = server
+        self.output = server.output
+
+    # send a request and return the replies written for it
+    def send_line(self, line):
+        start = self.output.tell()
+        self.server.handle_line(line)
+        self.output.seek(start)
+        data = self.output.read()
+        replies = []
+        for reply_line in data.splitlines():
+            prefix, client_id, reply = reply_line.split(b"|", 2)
+            assert prefix == b"PIME_MSG"
+            replies.append((client_id.decode("UTF-8"), json.loads(reply)))
+        return replies
+
+    def send(self, client_id, msg):
+        replies = self.send_line(("%s|%s" % (client_id, json.dumps(msg))).encode("UTF-8"))
+        return replies[-1][1] if replies else None
+
+
+@pytest.fixture
+def fake_services(monkeypatch):
+    # text services of FAKE_GUID are created from ContextService, the others as usual
+    from serviceManager import textServiceMgr
+    createService = textServiceMgr.createService
+
+    def create(client, guid):
+        if guid.lower() == FAKE_GUID:
+            return ContextService(client)
+        return createService(client, guid)
+    monkeypatch.setattr(textServiceMgr, "createService", create)
+    return ContextService
+
+
+@pytest.fixture
+def session(fake_services):
+    import server
+    return Session(server.Server(io.BytesIO(), io.BytesIO()))
@@ -0,0 +1,68 @@
+# The asyncio server: same protocol, requests dispatched on one thread
+
+import io
+import json
+import threading
+import time
+
+import server
+from conftest import ContextService, init_msg, key_msg
+
+
+def run_async(lines):
+    output = io.BytesIO()
+    srv = server.AsyncServer(io.BytesIO(b"".join(line + b"\n" for line in lines)), output)
+    srv.run()
+    replies = {}
+    for line in output.getvalue().splitlines():
+        prefix, client_id, reply = line.split(b"|", 2)
+        replies.setdefault(client_id.decode("UTF-8"), []).append(json.loads(reply))
+    return replies
+
+
+def request(client_id, msg):
+    return ("%s|%s" % (client_id, json.dumps(msg))).encode("UTF-8")
+
+
+def test_requests_are_dispatched_on_one_thread(fake_services, monkeypatch):
+    threads = set()
+    running = []
+    overlaps = []
+    onKeyDown = ContextService.onKeyDown
+
+    def slowKeyDown(service, keyEvent):
+        threads.add(threading.get_ident())
+        running.append(service)
+        if len(running) > 1:
+            overlaps.append(list(running))
+        time.sleep(0.005)
+        running.remove(service)
+        return onKeyDown(service, keyEvent)
+    monkeypatch.setattr(ContextService, "onKeyDown", slowKeyDown)
+
+    clients = ["c%d" % i for i in range(4)]
+    lines = []
+    for client_id in clients:
+        lines.append(request(client_id, init_msg()))
+        lines.append(request(client_id, {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True}))
+    for seq_num, char in enumerate("abcde", 3):
+        for client_id in clients:
+            lines.append(request(client_id, key_msg("onKeyDown", char, seq_num)))
+    replies = run_async(lines)
+
+    assert len(threads) == 1
+    assert threading.get_ident() not in threads
+    assert not overlaps
+    for client_id in clients:
+        # the requests of each client are answered in order
+        assert [reply["seqNum"] for reply in replies[client_id]] == [1, 2, 3, 4, 5, 6, 7]
+        assert replies[client_id][-1]["compositionString"] == "abcde"
+
+
+def test_invalid_requests_and_close(fake_services):
+    lines = [request("c1", init_msg()), b"c2|null", request("c1", {"method": "close"}),
+             request("c1", {"method": "stats", "seqNum": 9})]
+    replies = run_async(lines)
+    assert replies["c2"] == [{"success": False}]
+    assert replies["c1"][0]["success"]
+    assert replies["c1"][1]["stats"]["counters"] is not None
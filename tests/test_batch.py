@@ -0,0 +1,57 @@
+# The "batch" protocol extension: several messages of a client in one request line
+
+import json
+
+from conftest import init_msg, key_msg
+
+
+def send_batch(session, client_id, msgs):
+    replies = session.send_line(("%s|%s" % (client_id, json.dumps(msgs))).encode("UTF-8"))
+    assert len(replies) == 1  # all the replies are sent in one line
+    assert replies[0][0] == client_id
+    return replies[0][1]
+
+
+def test_batch_is_negotiated_during_init(session):
+    reply = session.send("c1", init_msg(protocolExtensions=["batch", "unknown"]))
+    assert reply["success"]
+    assert reply["protocolExtensions"] == ["batch"]
+
+    replies = send_batch(session, "c1", [
+        {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True},
+        key_msg("onKeyDown", "a", 3),
+        key_msg("onKeyDown", "b", 4),
+    ])
+    # the messages are handled in order and answered in order
+    assert [reply["seqNum"] for reply in replies] == [2, 3, 4]
+    assert all(reply["success"] for reply in replies)
+    assert replies[1]["compositionString"] == "a"
+    assert replies[2]["compositionString"] == "ab"
+
+
+def test_batch_without_negotiation(session):
+    reply = session.send("c1", init_msg())
+    assert "protocolExtensions" not in reply  # old launchers see the original reply
+    replies = send_batch(session, "c1", [key_msg("onKeyDown", "a", 2), key_msg("onKeyDown", "b", 3)])
+    assert replies == [{"seqNum": 2, "success": False}, {"seqNum": 3, "success": False}]
+
+
+def test_init_and_close_are_not_batched(session):
+    session.send("c1", init_msg(protocolExtensions=["batch"]))
+    replies = send_batch(session, "c1", [
+        {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True},
+        init_msg(3),
+        {"method": "close", "seqNum": 4},
+    ])
+    assert [reply["success"] for reply in replies] == [True, False, False]
+    assert "c1" in session.server.clients
+
+
+def test_error_in_batch(session):
+    session.send("c1", init_msg(protocolExtensions=["batch"]))
+    session.send("c1", {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True})
+    replies = send_batch(session, "c1", [key_msg("onKeyDown", "a", 3), key_msg("onKeyDown", "!", 4)])
+    # every message of the failed batch gets an error reply
+    assert [reply["seqNum"] for reply in replies] == [3, 4]
+    assert all(reply["success"] is False for reply in replies)
+    assert replies[1]["error"]["type"] == "RuntimeError"
@@ -0,0 +1,78 @@
+# The charset table classifies characters like the range checks it replaced
+
+import io
+import os
+
+from conftest import PYTHON_DIR
+from cinbase import charset
+from cinbase.cin import Cin
+
+JSON_DIR = os.path.join(PYTHON_DIR, "cinbase", "json")
+
+BOPOMOFO_TONES = [0x02D9, 0x02CA, 0x02C7, 0x02CB]
+CJK_CI_IBM = [0xFA0E, 0xFA0F, 0xFA11, 0xFA13, 0xFA14, 0xFA1F, 0xFA21, 0xFA23, 0xFA24, 0xFA27, 0xFA28, 0xFA29]
+CJK_CI = [0xFA10, 0xFA12, 0xFA15, 0xFA16, 0xFA17, 0xFA18, 0xFA19, 0xFA1A, 0xFA1B, 0xFA1C,
+          0xFA1D, 0xFA1E, 0xFA20, 0xFA22, 0xFA25, 0xFA26, 0xFA2A, 0xFA2B, 0xFA2C, 0xFA2D]
+
+
+# the previous implementation of Cin.getCharSet()
+def scan_char_set(char):
+    code = ord(char)
+    if code <= 0x9FEB:
+        if 0x3100 <= code < 0x3130 or code in BOPOMOFO_TONES:
+            return "bopomofo"
+        elif 0x4E00 <= code < 0x9FEB:
+            try:
+                big5code = int(char.encode("big5").hex(), 16)
+            except UnicodeEncodeError:
+                return "cjk"
+            if 0xA440 <= big5code < 0xC67F:
+                return "big5F"
+            elif 0xC940 <= big5code < 0xF9D6 or 0xA140 <= big5code < 0xA3C0:
+                return "big5LF"
+            return "big5Other"
+        elif 0x3400 <= code < 0x4DB6:
+            return "cjkExtA"
+    else:
+        for name, start, end in [("cjkExtB", 0x20000, 0x2A6D7), ("cjkExtC", 0x2A700, 0x2B735),
+                                 ("cjkExtD", 0x2B740, 0x2B81E), ("cjkExtE", 0x2B820, 0x2CEA2),
+                                 ("cjkExtF", 0x2CEB0, 0x2EBE1)]:
+            if start <= code < end:
+                return name
+        if code in CJK_CI_IBM:
+            return "cjkCIibm"
+        if (0xE000 <= code < 0xF900 or 0xF0000 <= code < 0xFFFFE or 0x100000 <= code < 0x10FFFE or
+                0xF900 <= code < 0xFA0E or code in CJK_CI or 0xFA2E <= code < 0xFB00 or 0x2F800 <= code < 0x2FA20):
+            return "pua"
+    return "cjkOther"
+
+
+def open_cin():
+    with io.open(os.path.join(JSON_DIR, "simplex.json"), encoding="utf-8") as fs:
+        return Cin(fs, "checj", False)
+
+
+def test_char_sets_match_scan():
+    cin = open_cin()
+    codes = list(range(charset.TABLE_SIZE)) + [0xF0000, 0xFFFFD, 0xFFFFE, 0x100000, 0x10FFFD, 0x10FFFE, 0x10FFFF]
+    for code in codes:
+        char = chr(code)
+        assert cin.getCharSet(char) == scan_char_set(char), hex(code)
+
+
+def test_big5_symbols_keep_their_name():
+    # 兙 is a Big5 symbol (0xA259), it is still reported as big5LF
+    assert charset.getCharSet("兙") == "big5S"
+    assert open_cin().getCharSet("兙") == "big5LF"
+
+
+def test_table_is_built_when_the_cin_table_is_loaded(monkeypatch):
+    monkeypatch.setattr(charset, "_table", None)
+    cin = open_cin()
+    assert len(charset._table) == charset.TABLE_SIZE
+
+    # the first wildcard query does not build it again
+    def buildTable():
+        raise AssertionError("built on a keystroke")
+    monkeypatch.setattr(charset, "buildTable", buildTable)
+    assert cin.getWildcardCharDefs("a?", "?", 10)
@@ -0,0 +1,118 @@
+# Compiled, memory-mapped cin tables (.cintable)
+
+import json
+import os
+
+import pytest
+
+from conftest import PYTHON_DIR
+from cinbase import cintable
+from cinbase.cintable import compileTable, loadTable, openTable, MappedCharDefs
+
+CHECJ_JSON = os.path.join(PYTHON_DIR, "cinbase", "json", "checj.json")
+
+
+def make_table():
+    # more keys than SPARSE_STEP, multi-byte keys and a key without candidates
+    chardefs = {"k%03d" % i: ["字%d" % i, "x"] for i in range(100)}
+    chardefs.update({"日": ["曰"], "a": ["日", "曰"], "é": [], "zz": ["𠀀"]})
+    return {"ename": "test", "cname": "測試", "keynames": {"a": "日"}, "chardefs": chardefs}
+
+
+def write_json(path, data, mtime=1000):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def compiled(tmpdir):
+    data = make_table()
+    source = write_json(str(tmpdir.join("test.json")), data)
+    path = str(tmpdir.join("test.cintable"))
+    compileTable(data, path, os.stat(source))
+    return data, openTable(path, os.stat(source))
+
+
+def test_round_trip(compiled):
+    data, mapped = compiled
+    chardefs = mapped["chardefs"]
+    assert isinstance(chardefs, MappedCharDefs)
+    assert {key: value for key, value in mapped.items() if key != "chardefs"} == \
+        {key: value for key, value in data.items() if key != "chardefs"}
+    assert len(chardefs) == len(data["chardefs"])
+    assert dict(chardefs.items()) == data["chardefs"]
+    assert sorted(chardefs) == sorted(data["chardefs"])
+    for key, values in data["chardefs"].items():
+        assert key in chardefs
+        assert chardefs[key] == values
+    assert "k100" not in chardefs and "" not in chardefs and "0" not in chardefs
+    assert chardefs.get("missing", []) == []
+    with pytest.raises(KeyError):
+        chardefs["missing"]
+
+
+def test_changes_stay_in_memory(compiled, tmpdir):
+    data, mapped = compiled
+    chardefs = mapped["chardefs"]
+    chardefs["a"] = ["曰"]
+    chardefs["new"] = ["新"]
+    assert chardefs["a"] == ["曰"] and chardefs["new"] == ["新"]
+    assert len(chardefs) == len(data["chardefs"]) + 1
+    assert list(chardefs)[-1] == "new"
+    assert dict(chardefs.items())["a"] == ["曰"]
+
+    # the table file is not modified
+    source = os.stat(str(tmpdir.join("test.json")))
+    reopened = openTable(str(tmpdir.join("test.cintable")), source)["chardefs"]
+    assert reopened["a"] == ["日", "曰"]
+    assert "new" not in reopened
+
+
+def test_table_is_compiled_once(tmpdir, monkeypatch):
+    data = make_table()
+    jsonPath = write_json(str(tmpdir.join("test.json")), data)
+    cacheDir = str(tmpdir.mkdir("cache"))
+    assert isinstance(loadTable(jsonPath, cacheDir)["chardefs"], MappedCharDefs)
+    assert os.listdir(cacheDir) == ["test.cintable"]
+
+    # the compiled table is used without parsing the JSON file
+    def failedLoad(fs):
+        raise AssertionError("the JSON table is parsed")
+    with monkeypatch.context() as m:
+        m.setattr(cintable.json, "load", failedLoad)
+        assert loadTable(jsonPath, cacheDir)["chardefs"]["a"] == ["日", "曰"]
+
+    # a changed JSON table is compiled again
+    data["chardefs"]["a"] = ["甲"]
+    write_json(jsonPath, data, mtime=2000)
+    assert loadTable(jsonPath, cacheDir)["chardefs"]["a"] == ["甲"]
+    assert openTable(os.path.join(cacheDir, "test.cintable"), os.stat(jsonPath)) is not None
+
+
+def test_bad_tables_fall_back_to_json(tmpdir):
+    data = make_table()
+    jsonPath = write_json(str(tmpdir.join("test.json")), data)
+    cacheDir = str(tmpdir.mkdir("cache"))
+    # a broken file next to the JSON table is ignored
+    tmpdir.join("test.cintable").write_binary(b"PIMECIN\0 broken")
+    assert openTable(str(tmpdir.join("test.cintable")), os.stat(jsonPath)) is None
+    assert isinstance(loadTable(jsonPath, cacheDir)["chardefs"], MappedCharDefs)
+
+    # a table that cannot be compiled is loaded from JSON
+    data["chardefs"]["bad"] = ["a\1b"]
+    jsonPath = write_json(str(tmpdir.join("bad.json")), data)
+    with pytest.raises(ValueError):
+        compileTable(data, str(tmpdir.join("bad.cintable")), os.stat(jsonPath))
+    assert loadTable(jsonPath, cacheDir)["chardefs"] == data["chardefs"]
+    assert sorted(os.listdir(cacheDir)) == ["test.cintable"]  # no temporary file is left
+
+
+def test_real_table(tmpdir):
+    with open(CHECJ_JSON, encoding="utf-8") as f:
+        data = json.load(f)
+    mapped = loadTable(CHECJ_JSON, str(tmpdir))
+    assert isinstance(mapped["chardefs"], MappedCharDefs)
+    assert mapped["keynames"] == data["keynames"]
+    assert dict(mapped["chardefs"].items()) == data["chardefs"]
@@ -0,0 +1,109 @@
+# Config changes are detected by a background watcher instead of polling on each request
+
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import configWatcher as configWatcherModule
+from configWatcher import ConfigWatcher
+from cinbase.config import SharedConfig
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def touch(path, content="{}", mtime=None):
+    with open(path, "w") as f:
+        f.write(content)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture(params=["inotify", "polling"])
+def watcher(request):
+    watcher = ConfigWatcher()
+    watcher.interval = 0.05
+    if request.param == "polling":
+        watcher.inotify = None
+    elif watcher.inotify is None:
+        pytest.skip("inotify is not available")
+    return watcher
+
+
+def test_changes_are_published(watcher, tmpdir):
+    path = str(tmpdir.join("config.json"))
+    other = str(tmpdir.join("other.json"))
+    touch(path, mtime=1000)
+    watcher.watch([path, str(tmpdir.join("missing.dat"))])
+    assert watcher.isWatching([path])
+    assert not watcher.isWatching([path, other])
+    generation, mtimes = watcher.getState()
+    assert mtimes == {path: 1000}
+
+    # unwatched files do not change the state
+    touch(other)
+    time.sleep(0.2)
+    assert watcher.getState()[0] == generation
+
+    touch(path, mtime=2000)
+    wait_for(lambda: watcher.getState()[0] > generation)
+    assert watcher.getState()[1] == {path: 2000}
+
+    # a deleted file is removed from the state, a created one is added
+    generation = watcher.getState()[0]
+    os.remove(path)
+    wait_for(lambda: watcher.getState()[0] > generation)
+    assert path not in watcher.getState()[1]
+    touch(str(tmpdir.join("missing.dat")), mtime=3000)
+    wait_for(lambda: str(tmpdir.join("missing.dat")) in watcher.getState()[1])
+
+
+def test_unchanged_files_keep_the_state(watcher, tmpdir):
+    path = str(tmpdir.join("config.json"))
+    touch(path, mtime=1000)
+    watcher.watch([path])
+    state = watcher.getState()
+    watcher.refresh()
+    watcher.watch([path])
+    assert watcher.getState() is state
+
+
+def test_config_reloaded_on_change(tmpdir, monkeypatch):
+    watcher = ConfigWatcher()
+    watcher.interval = 0.05
+    monkeypatch.setattr(configWatcherModule, "configWatcher", watcher)
+    monkeypatch.setattr("cinbase.config.configWatcher", watcher)
+    monkeypatch.setenv("PIME_DATA_ROOT", str(tmpdir))
+    sharedConfig = SharedConfig("checj", ["checj.json"])
+    cfg = sharedConfig.get()
+    configFile = cfg.getConfigFile()
+    touch(configFile, json.dumps(dict(cfg.toJson(), candPerRow=3)), mtime=1000)
+    watcher.refresh()
+    cfg = sharedConfig.get()
+    assert cfg.candPerRow == 3
+
+    # nothing changed: the same snapshot, the request thread does not check the files
+    stats = []
+    getmtime = os.path.getmtime
+    thread = threading.get_ident()
+
+    def countedGetmtime(path):
+        if threading.get_ident() == thread:
+            stats.append(path)
+        return getmtime(path)
+    monkeypatch.setattr(os.path, "getmtime", countedGetmtime)
+    for i in range(10):
+        assert sharedConfig.get() is cfg
+    assert not stats
+
+    touch(configFile, json.dumps(dict(cfg.toJson(), candPerRow=5)), mtime=2000)
+    wait_for(lambda: sharedConfig.get() is not cfg)
+    assert sharedConfig.get().candPerRow == 5
+    assert cfg.candPerRow == 3  # the old snapshot is not modified
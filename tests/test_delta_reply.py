@@ -0,0 +1,87 @@
+# The "deltaReply" protocol extension: unchanged composition and candidates are not resent
+
+from textService import TextService
+from conftest import key_msg
+
+
+class FakeClient(object):
+    def __init__(self, protocolExtensions):
+        self.protocolExtensions = set(protocolExtensions)
+
+
+# "a".."z" add to the composition and list its candidates, "+" moves the candidate cursor,
+# "#" hides the candidates and "." changes nothing
+class CandidateService(TextService):
+    def onKeyDown(self, keyEvent):
+        char = chr(keyEvent.charCode)
+        if char == "+":
+            self.setCandidateCursor(self.candidateCursor + 1)
+            self.setCandidateList(self.candidateList)
+            self.setCompositionString(self.compositionString)
+        elif char == "#":
+            self.setShowCandidates(False)
+        elif char != ".":
+            self.setCompositionString(self.compositionString + char)
+            self.setCompositionCursor(len(self.compositionString))
+            self.setCandidateList([self.compositionString + str(i) for i in range(3)])
+            self.setCandidateCursor(0)
+            self.setShowCandidates(True)
+        return True
+
+
+def press(service, char, seq_num=1):
+    return service.handleRequest(key_msg("onKeyDown", char, seq_num))
+
+
+def test_only_changed_state_is_sent():
+    service = CandidateService(FakeClient(["deltaReply"]))
+    reply = press(service, "a")
+    assert reply["compositionString"] == "a"
+    assert reply["candidateList"] == ["a0", "a1", "a2"]
+
+    # cursor-only reply
+    reply = press(service, "+")
+    assert reply["candidateCursor"] == 1
+    assert "candidateList" not in reply
+    assert "compositionString" not in reply
+    assert "compositionCursor" not in reply
+
+    # unchanged reply
+    reply = press(service, ".")
+    assert reply == {"return": True, "success": True, "seqNum": 1}
+
+    # replaced page
+    reply = press(service, "b")
+    assert reply["compositionString"] == "ab"
+    assert reply["candidateList"] == ["ab0", "ab1", "ab2"]
+    assert reply["candidateCursor"] == 0
+
+
+def test_full_replies_without_the_extension():
+    service = CandidateService(FakeClient(["batch"]))
+    press(service, "a")
+    reply = press(service, "+")
+    assert reply["candidateList"] == ["a0", "a1", "a2"]
+    assert reply["compositionString"] == "a"
+
+
+def test_state_is_resent_after_reset():
+    service = CandidateService(FakeClient(["deltaReply"]))
+    press(service, "a")
+    # the candidate window is closed, the same list is sent again when it is opened
+    press(service, "#")
+    service.compositionString = ""
+    reply = press(service, "a")
+    assert reply["candidateList"] == ["a0", "a1", "a2"]
+
+    # the client resets its UI when the composition is terminated
+    service.handleRequest({"method": "onCompositionTerminated", "seqNum": 2, "forced": True})
+    service.compositionString = ""
+    reply = press(service, "a")
+    assert reply["compositionString"] == "a"
+    assert reply["candidateList"] == ["a0", "a1", "a2"]
+
+    # the state of the client is unknown after a failed reply
+    service.lastReplyState["compositionString"] = "a"
+    assert service.handleRequest({"method": "unknown", "seqNum": 3})["success"] is False
+    assert service.lastReplyState == {}
@@ -0,0 +1,109 @@
+# Table-driven dispatch of TextService requests through middlewares
+
+import pytest
+
+from textService import TextService, METHOD_HANDLERS
+from conftest import key_msg
+
+
+class RecordingService(TextService):
+    def __init__(self):
+        TextService.__init__(self, None)
+        self.calls = []
+
+    def updateStatus(self, msg):
+        self.calls.append(("updateStatus", msg["method"]))
+
+    def checkConfigChange(self):
+        self.calls.append(("checkConfigChange",))
+
+    def filterKeyDown(self, keyEvent):
+        self.calls.append(("filterKeyDown", keyEvent.charCode))
+        return True
+
+    def onKeyDown(self, keyEvent):
+        self.calls.append(("onKeyDown", keyEvent.charCode))
+        return True
+
+    def onMenu(self, commandId):
+        return [{"text": "menu %d" % commandId}]
+
+
+@pytest.fixture
+def middleware():
+    added = []
+
+    def add(func):
+        TextService.addMiddleware(func)
+        added.append(func)
+    yield add
+    for func in added:
+        if func in TextService.middlewares:
+            TextService.removeMiddleware(func)
+
+
+def activate(service):
+    service.handleRequest({"method": "onActivate", "seqNum": 1, "isKeyboardOpen": True})
+    del service.calls[:]
+
+
+def test_methods_are_dispatched():
+    service = RecordingService()
+    activate(service)
+    assert service.isActivated
+    reply = service.handleRequest(key_msg("onKeyDown", "a", 2))
+    assert reply == {"return": True, "success": True, "seqNum": 2}
+    assert service.handleRequest({"method": "onMenu", "seqNum": 3, "id": 7})["return"] == [{"text": "menu 7"}]
+    # unknown methods fail without calling anything
+    assert service.handleRequest({"method": "unknown", "seqNum": 4}) == {"success": False, "seqNum": 4}
+    service.handleRequest({"method": "onDeactivate", "seqNum": 5})
+    assert not service.isActivated
+
+
+def test_config_is_checked_only_where_needed():
+    service = RecordingService()
+    # not activated yet
+    service.handleRequest(key_msg("onKeyDown", "a"))
+    assert ("checkConfigChange",) not in service.calls
+    activate(service)
+    for method in METHOD_HANDLERS:
+        if method.endswith(("KeyDown", "KeyUp")):
+            del service.calls[:]
+            service.handleRequest(key_msg(method, "a"))
+            assert (("checkConfigChange",) in service.calls) == METHOD_HANDLERS[method][1], method
+            assert ("updateStatus", method) in service.calls
+    # the key filters and key up events skip it, onKeyDown checks it before updateStatus()
+    del service.calls[:]
+    service.handleRequest(key_msg("onKeyDown", "b"))
+    assert service.calls == [("checkConfigChange",), ("updateStatus", "onKeyDown"), ("onKeyDown", ord("b"))]
+
+
+def test_middlewares_wrap_requests_in_order(middleware):
+    order = []
+
+    def outer(service, method, msg, callNext):
+        order.append("outer " + method)
+        success, ret = callNext(service, method, msg)
+        order.append("outer done")
+        return success, ret
+
+    def inner(service, method, msg, callNext):
+        order.append("inner " + method)
+        if method == "filterKeyDown":
+            return True, False  # swallow the request
+        return callNext(service, method, msg)
+    middleware(outer)
+    middleware(inner)
+
+    service = RecordingService()
+    activate(service)
+    order[:] = []
+    assert service.handleRequest(key_msg("filterKeyDown", "a"))["return"] is False
+    assert ("filterKeyDown", ord("a")) not in service.calls
+    assert order == ["outer filterKeyDown", "inner filterKeyDown", "outer done"]
+    assert service.handleRequest(key_msg("onKeyDown", "a"))["return"] is True
+
+    TextService.removeMiddleware(inner)
+    order[:] = []
+    assert service.handleRequest(key_msg("filterKeyDown", "a"))["return"] is True
+    assert order == ["outer filterKeyDown", "outer done"]
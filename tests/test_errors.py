@@ -0,0 +1,66 @@
+# Errors of a text service only reset the text service of the failing client
+
+import io
+import json
+
+import pytest
+
+import server
+from conftest import init_msg, key_msg
+
+
+def activate(session, client_id):
+    session.send(client_id, init_msg())
+    session.send(client_id, {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True})
+
+
+def test_failed_service_is_rebuilt_activated(session):
+    activate(session, "c1")
+    activate(session, "c2")
+    session.send("c1", key_msg("onKeyDown", "a", 3))
+    reply = session.send("c1", key_msg("onKeyDown", "!", 4))
+    assert reply["success"] is False
+    assert reply["error"]["type"] == "RuntimeError"
+    assert session.server.clients["c1"].service is None
+
+    # the next key gets a new text service with its input context set up
+    for seq_num, char in enumerate("bcdefgh", 5):
+        reply = session.send("c1", key_msg("onKeyDown", char, seq_num))
+        assert reply["success"], reply
+    assert reply["compositionString"] == "bcdefgh"
+    assert len(session.server.crash_times) == 1
+
+    # the other client is not affected
+    assert session.send("c2", key_msg("onKeyDown", "z", 3))["compositionString"] == "z"
+
+
+def test_crash_budget(session):
+    session.server.crash_budget = 2
+    activate(session, "c1")
+    for seq_num in (3, 4):
+        assert session.send("c1", key_msg("onKeyDown", "!", seq_num))["success"] is False
+    with pytest.raises(RuntimeError):
+        session.send("c1", key_msg("onKeyDown", "!", 5))
+
+
+def run_server(lines, crash_budget):
+    output = io.BytesIO()
+    srv = server.Server(io.BytesIO(b"".join(line + b"\n" for line in lines)), output)
+    srv.crash_budget = crash_budget
+    code = None
+    try:
+        srv.run()
+    except SystemExit as e:
+        code = e.code
+    return code, [json.loads(line.split(b"|", 2)[2]) for line in output.getvalue().splitlines()]
+
+
+def test_invalid_requests(fake_services):
+    lines = [b"1|null", b'2|"x"', b"3|[1,{}]", b"4|{", b"no separator"]
+    code, replies = run_server(lines, crash_budget=len(lines))
+    assert code is None
+    assert replies == [{"success": False}] * len(lines)
+
+    code, replies = run_server(lines, crash_budget=len(lines) - 1)
+    assert code == 1
+    assert len(replies) == len(lines)
@@ -0,0 +1,69 @@
+# Idle clients are evicted and their text services rebuilt from snapshots
+
+from conftest import init_msg, key_msg
+
+
+def activate(session, client_id):
+    assert session.send(client_id, init_msg())["success"]
+    reply = session.send(client_id, {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True})
+    assert reply["addButton"][0]["id"] == "switch-lang"
+
+
+def test_evicted_service_is_activated_again(session):
+    session.server.max_clients = 1
+    activate(session, "c1")
+    assert session.send("c1", key_msg("onKeyDown", "a", 3))["compositionString"] == "a"
+    activate(session, "c2")  # only one client is kept, c1 is evicted
+    assert "c1" in session.server.evicted_clients
+    assert session.server.evicted_clients["c1"].service is None
+
+    # the rebuilt text service has its input context again
+    assert session.send("c1", key_msg("filterKeyDown", "b", 4))["return"] is True
+    reply = session.send("c1", key_msg("onKeyDown", "b", 5))
+    assert reply["success"]
+    assert reply["compositionString"] == "ab"
+    # the client still has the buttons of the evicted text service
+    assert "addButton" not in reply
+    assert "c1" in session.server.clients
+
+
+def test_idle_service_is_evicted(session):
+    session.server.idle_timeout = 0
+    activate(session, "c1")
+    assert "c1" in session.server.evicted_clients
+    reply = session.send("c1", key_msg("onKeyDown", "a", 3))
+    assert reply["success"]
+    assert reply["compositionString"] == "a"
+
+
+def test_deactivated_service_is_not_activated(session):
+    session.server.max_clients = 1
+    activate(session, "c1")
+    session.send("c1", {"method": "onDeactivate", "seqNum": 3})
+    activate(session, "c2")
+    client = session.server.evicted_clients["c1"]
+    service = client.rebuildService()
+    assert not service.isActivated
+    assert service.context is None
+
+
+def test_trimmed_client_is_rebuilt(session):
+    session.server.max_clients = 1
+    session.server.max_evicted_clients = 1
+    for client_id in ("c1", "c2", "c3"):
+        activate(session, client_id)
+    assert list(session.server.evicted_clients) == ["c2"]
+    assert session.server.trimmed_clients["c1"].snapshot == {"isActivated": True, "keyboardOpen": True}
+
+    # only the composition of the snapshot is lost
+    reply = session.send("c1", key_msg("onKeyDown", "a", 3))
+    assert reply["success"]
+    assert reply["compositionString"] == "a"
+    assert "c1" not in session.server.trimmed_clients
+
+    session.send("c2", {"method": "close", "seqNum": 3})
+    session.send("c3", {"method": "close", "seqNum": 3})
+    session.send("c1", {"method": "close", "seqNum": 4})
+    assert not session.server.clients
+    assert not session.server.evicted_clients
+    assert not session.server.trimmed_clients
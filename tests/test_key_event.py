@@ -0,0 +1,81 @@
+# KeyEvent: key states decoded lazily, and rebuilt from the "modifierMask" bitmask
+
+import pytest
+
+import textService
+from textService import KeyEvent
+from conftest import init_msg, key_msg
+
+VK_SHIFT = 0x10
+VK_CONTROL = 0x11
+VK_MENU = 0x12
+VK_CAPITAL = 0x14
+VK_NUMLOCK = 0x90
+VK_LSHIFT = 0xA0
+VK_RSHIFT = 0xA1
+
+# (virtual key, key state, modifier flag)
+MODIFIERS = [
+    (VK_SHIFT, 0x80, textService.MODIFIER_SHIFT),
+    (VK_CONTROL, 0x80, textService.MODIFIER_CONTROL),
+    (VK_MENU, 0x80, textService.MODIFIER_ALT),
+    (VK_CAPITAL, 0x01, textService.MODIFIER_CAPSLOCK),
+    (VK_NUMLOCK, 0x01, textService.MODIFIER_NUMLOCK),
+    (VK_LSHIFT, 0x80, textService.MODIFIER_LSHIFT),
+    (VK_RSHIFT, 0x80, textService.MODIFIER_RSHIFT),
+]
+
+
+def states_msg(method, char, states):
+    msg = key_msg(method, char)
+    for code, state in states.items():
+        msg["keyStates"][code] = state
+    return msg
+
+
+@pytest.mark.parametrize("code, state, flag", MODIFIERS)
+def test_modifiers_from_key_states(code, state, flag):
+    keyEvent = KeyEvent(states_msg("onKeyUp", "a", {code: state}))
+    assert keyEvent.modifiers == flag
+    # toggle bits do not count as pressed, pressed bits do not count as toggled
+    assert KeyEvent(states_msg("onKeyUp", "a", {code: state ^ 0x81})).modifiers == 0
+
+
+@pytest.mark.parametrize("method", ["filterKeyDown", "onKeyDown", "filterKeyUp", "onKeyUp"])
+def test_modifier_mask_matches_key_states(method):
+    states = {code: state for code, state, flag in MODIFIERS}
+    if method in ("filterKeyDown", "onKeyDown"):
+        states[ord("A")] = 0x80  # the key being pressed
+    fromStates = KeyEvent(states_msg(method, "a", states))
+    mask = 0
+    for code, state, flag in MODIFIERS:
+        mask |= flag
+    fromMask = KeyEvent(key_msg(method, "a", modifiers=mask))
+
+    assert fromMask.modifiers == fromStates.modifiers == mask
+    assert fromMask.keyStates == fromStates.keyStates == bytes(fromStates.keyStates)
+    for code in range(256):
+        assert fromMask.isKeyDown(code) == fromStates.isKeyDown(code), code
+        assert fromMask.isKeyToggled(code) == fromStates.isKeyToggled(code), code
+
+
+def test_key_states_are_packed_once():
+    msg = states_msg("onKeyDown", "a", {VK_SHIFT: 0x80})
+    keyEvent = KeyEvent(msg)
+    assert keyEvent.isKeyDown(VK_SHIFT)
+    assert not keyEvent.isKeyDown(VK_CONTROL)
+    packed = keyEvent.keyStates
+    assert isinstance(packed, bytes)
+    assert packed == bytes(msg["keyStates"])
+    assert keyEvent.keyStates is packed
+    with pytest.raises(AttributeError):
+        keyEvent.other = 1  # __slots__
+
+
+def test_modifier_mask_request(session):
+    reply = session.send("c1", init_msg(protocolExtensions=["modifierMask"]))
+    assert reply["protocolExtensions"] == ["modifierMask"]
+    session.send("c1", {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True})
+    reply = session.send("c1", key_msg("onKeyDown", "a", 3, modifiers=textService.MODIFIER_SHIFT))
+    assert reply["success"]
+    assert reply["compositionString"] == "a"
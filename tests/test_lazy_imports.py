@@ -0,0 +1,46 @@
+# Heavy cinbase dependencies are loaded on first use, and imports can be profiled
+
+import json
+import os
+import subprocess
+import sys
+
+from conftest import PYTHON_DIR
+
+
+# run python code in a fresh interpreter and return the JSON it prints
+def run_python(code, **env):
+    environ = dict(os.environ, **env)
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=PYTHON_DIR, env=environ)
+    return json.loads(output.decode("UTF-8").splitlines()[-1])
+
+
+def test_cinbase_import_is_lazy():
+    result = run_python(
+        "import sys, json\n"
+        "import cinbase\n"
+        "base = cinbase.CinBase  # the shared instance\n"
+        "loaded = {'cpuinfo': 'cinbase.tools.cpuinfo' in sys.modules, 'winsound': 'winsound' in sys.modules,\n"
+        "          'emoji': base._emoji is not None, 'opencc': sys.modules['opencc']._libopencc is not None}\n"
+        "emojiMenu = len(base.emoji.emoticons)\n"
+        "print(json.dumps({'loaded': loaded, 'emojiMenu': emojiMenu, 'same': base.emoji is base.emoji}))\n")
+    assert result["loaded"] == {"cpuinfo": False, "winsound": False, "emoji": False, "opencc": False}
+    # the emoji data is loaded once on first use
+    assert result["emojiMenu"] > 0
+    assert result["same"]
+
+
+def test_import_profile():
+    code = ("import json\n"
+            "from perfStats import perfStats\n"
+            "import cinbase\n"
+            "print(json.dumps(perfStats.toJson().get('imports')))\n")
+    imports = run_python(code, PIME_IMPORT_PROFILE="1")
+    cinbase = imports["cinbase"]
+    assert cinbase["total_us"] >= cinbase["self_us"] >= 0
+    # nested imports are counted in the total time of the importing module only
+    nested = imports["cinbase.cin"]
+    assert nested["total_us"] <= cinbase["total_us"] - cinbase["self_us"]
+    assert "perfStats" not in imports
+
+    assert run_python(code, PIME_IMPORT_PROFILE="0") is None
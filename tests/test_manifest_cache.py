@@ -0,0 +1,92 @@
+# The manifest of the installed text services is cached between server starts
+
+import io
+import json
+import os
+from contextlib import redirect_stdout
+
+import pytest
+
+import serviceManager
+from serviceManager import TextServiceManager, TextServiceInfo
+from conftest import PYTHON_DIR
+
+CHECJ_GUID = "{F828D2DC-81BE-466E-9CFE-24BB03172693}".lower()
+INPUT_METHODS_DIR = os.path.join(PYTHON_DIR, "input_methods")
+
+
+@pytest.fixture
+def cache_file(tmpdir, monkeypatch):
+    path = str(tmpdir.join("services.json"))
+    monkeypatch.setenv("PIME_MANIFEST_CACHE", path)
+    monkeypatch.delenv("PIME_WARM_SERVICES", raising=False)
+    return path
+
+
+def ime_dirs():
+    return sorted(name for name in os.listdir(INPUT_METHODS_DIR)
+                  if os.path.exists(os.path.join(INPUT_METHODS_DIR, name, "ime.json")))
+
+
+def test_cold_start_writes_the_cache(cache_file):
+    output = io.StringIO()
+    with redirect_stdout(output):
+        manager = TextServiceManager()
+    assert output.getvalue() == ""  # nothing is printed to the reply channel
+    with open(cache_file, encoding="UTF-8") as f:
+        cache = json.load(f)
+    assert cache["version"] == serviceManager.MANIFEST_VERSION
+    assert [name for name, mtime in cache["signature"]["files"]] == ime_dirs()
+    assert cache["services"] == manager.manifest
+    assert manager.manifest[CHECJ_GUID]["moduleName"] == "input_methods.checj.checj_ime"
+
+
+def test_warm_start_reads_only_the_cache(cache_file, monkeypatch):
+    manifest = TextServiceManager().manifest
+
+    def loadFromJson(info, jsonFile):
+        raise AssertionError("parsed " + jsonFile)
+    monkeypatch.setattr(TextServiceInfo, "loadFromJson", loadFromJson)
+    manager = TextServiceManager()
+    assert manager.manifest == manifest
+    assert not manager.services  # created on demand
+    assert [entry["guid"] for entry in manager.listServices()] == sorted(manifest)
+
+    info = manager.getServiceInfo(CHECJ_GUID)
+    assert info.moduleName == "input_methods.checj.checj_ime"
+    assert info.serviceName == manifest[CHECJ_GUID]["serviceName"]
+    assert manager.getServiceInfo(CHECJ_GUID) is info
+    assert manager.getServiceInfo("{unknown}") is None
+
+
+@pytest.mark.parametrize("change", ["version", "mtime", "removed"])
+def test_outdated_cache_is_rebuilt(cache_file, change):
+    manifest = TextServiceManager().manifest
+    with open(cache_file, encoding="UTF-8") as f:
+        cache = json.load(f)
+    if change == "version":
+        cache["version"] -= 1
+    elif change == "mtime":
+        cache["signature"]["files"][0][1] -= 1  # an ime.json was edited
+    else:
+        del cache["signature"]["files"][0]  # an input method was added
+    cache["services"] = {}
+    with open(cache_file, "w", encoding="UTF-8") as f:
+        json.dump(cache, f)
+    assert TextServiceManager().manifest == manifest
+
+
+def test_broken_cache_is_rebuilt(cache_file):
+    with open(cache_file, "w", encoding="UTF-8") as f:
+        f.write("{")
+    manifest = TextServiceManager().manifest
+    assert CHECJ_GUID in manifest
+    with open(cache_file, encoding="UTF-8") as f:
+        assert json.load(f)["services"] == manifest
+
+
+def test_module_names_do_not_depend_on_the_working_directory(cache_file, tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    manager = TextServiceManager()
+    info = manager.getServiceInfo(CHECJ_GUID)
+    assert info.moduleName == "input_methods.checj.checj_ime"
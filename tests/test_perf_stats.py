@@ -0,0 +1,69 @@
+# Per-method latency histograms and the "stats" request
+
+import random
+
+from perfStats import LatencyHistogram, PerfStats, SUB_BUCKET_COUNT
+from conftest import FAKE_GUID, init_msg, key_msg
+
+
+def bucket_of(us):
+    hist = LatencyHistogram()
+    hist.record(us)
+    return next(iter(hist.counts))
+
+
+def test_buckets_keep_relative_error_small():
+    values = list(range(5000)) + [2 ** n + d for n in range(13, 40) for d in (-1, 0, 1)]
+    indexes = [bucket_of(us) for us in values]
+    # buckets are ordered like the values
+    assert indexes == sorted(indexes)
+    for us, index in zip(values, indexes):
+        low = LatencyHistogram.bucketValue(index)
+        assert low <= us
+        assert us - low <= low // SUB_BUCKET_COUNT, us
+
+
+def test_percentiles_match_sorted_values():
+    random.seed(1)
+    values = [int(random.lognormvariate(6, 1.5)) for i in range(10000)]
+    hist = LatencyHistogram()
+    for us in values:
+        hist.record(us)
+    values.sort()
+    data = hist.toJson()
+    assert data["count"] == len(values)
+    assert data["min_us"] == values[0]
+    assert data["max_us"] == values[-1]
+    for key, percent in (("p50_us", 50), ("p90_us", 90), ("p99_us", 99), ("p999_us", 99.9)):
+        exact = values[int(len(values) * percent / 100.0) - 1]
+        assert abs(data[key] - exact) <= exact / SUB_BUCKET_COUNT + 1, key
+
+
+def test_stats_per_method_and_service():
+    stats = PerfStats()
+    for us in (10, 20, 30):
+        stats.recordRequest("guid", "onKeyDown", us * 1000)
+    stats.recordRequest("other", "onKeyDown", 40000)
+    stats.increment("cinTableLoads")
+    data = stats.toJson()
+    assert data["methods"]["onKeyDown"]["count"] == 4
+    assert data["services"]["guid"]["onKeyDown"]["max_us"] == 30
+    assert data["services"]["other"]["onKeyDown"]["min_us"] == 40
+    assert data["counters"] == {"cinTableLoads": 1}
+    assert "imports" not in data
+
+
+def test_stats_request(session):
+    session.send("c1", init_msg())
+    session.send("c1", {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True})
+    before = session.send("c1", {"method": "stats", "seqNum": 3})["stats"]
+    count = before["services"].get(FAKE_GUID, {}).get("onKeyDown", {}).get("count", 0)
+    for seq_num in (4, 5):
+        session.send("c1", key_msg("onKeyDown", "a", seq_num))
+    reply = session.send("c1", {"method": "stats", "seqNum": 6})
+    assert reply["success"]
+    assert reply["seqNum"] == 6
+    assert reply["stats"]["services"][FAKE_GUID]["onKeyDown"]["count"] == count + 2
+    # the stats request is reserved by the server, the client is not created for it
+    assert session.send("c2", {"method": "stats", "seqNum": 1})["success"]
+    assert "c2" not in session.server.clients
@@ -0,0 +1,108 @@
+# Write-behind JSON persistence: coalesced, atomic and skipped when unchanged
+
+import json
+import os
+import time
+
+import pytest
+
+import persistence
+from persistence import JsonWriter
+from perfStats import PerfStats
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    # other writers may run in the background, count the events of these tests only
+    stats = PerfStats()
+    monkeypatch.setattr(persistence, "perfStats", stats)
+    return stats
+
+
+@pytest.fixture
+def writer(stats):
+    return JsonWriter(delay=0.05)
+
+
+def test_writes_are_coalesced_in_the_background(writer, stats, tmpdir):
+    path = str(tmpdir.join("config.json"))
+    for value in range(5):
+        writer.write(path, {"value": value})
+    assert not os.path.exists(path)  # the request thread does not wait for the disk
+    wait_for(lambda: stats.counters.get("persistenceWrites"))
+    assert read(path) == {"value": 4}
+    assert stats.counters == {"persistenceWrites": 1}
+    assert os.listdir(str(tmpdir)) == ["config.json"]  # no temporary file is left
+
+
+def test_unchanged_content_is_not_written(writer, stats, tmpdir):
+    path = str(tmpdir.join("config.json"))
+    writer.write(path, {"a": 1, "b": [1, 2]})
+    writer.flush()
+    mtime = os.stat(path).st_mtime_ns
+    stats.counters.clear()
+    writer.write(path, {"b": [1, 2], "a": 1})
+    writer.flush()
+    assert stats.counters == {"persistenceSkips": 1}
+    assert os.stat(path).st_mtime_ns == mtime
+
+    # the file changed by someone else is written again
+    with open(path, "w") as f:
+        f.write("{}")
+    writer.write(path, {"a": 1, "b": [1, 2]})
+    writer.flush()
+    assert read(path) == {"a": 1, "b": [1, 2]}
+
+
+def test_failed_write_keeps_the_old_file(writer, stats, tmpdir, monkeypatch):
+    path = str(tmpdir.join("config.json"))
+    writer.write(path, {"value": 1})
+    writer.flush()
+
+    def replace(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, "replace", replace)
+    stats.counters.clear()
+    writer.write(path, {"value": 2})
+    writer.flush()
+    assert stats.counters == {"persistenceErrors": 1}
+    assert read(path) == {"value": 1}
+    assert os.listdir(str(tmpdir)) == ["config.json"]
+
+
+def test_bad_file_does_not_stop_the_others(writer, stats, tmpdir):
+    bad = str(tmpdir.join("bad.json"))
+    good = str(tmpdir.join("good.json"))
+    missing = str(tmpdir.join("missing", "other.json"))
+    writer.write(bad, {"value": object()})  # not serializable
+    writer.write(missing, {"value": 1})  # the directory does not exist
+    writer.write(good, {"value": 1})
+    wait_for(lambda: stats.counters.get("persistenceWrites"))
+    assert stats.counters == {"persistenceErrors": 2, "persistenceWrites": 1}
+    assert not os.path.exists(bad)
+
+    # the writer thread is still alive
+    writer.write(good, {"value": 2})
+    wait_for(lambda: read(good) == {"value": 2})
+    assert writer.thread.is_alive()
+
+
+def test_flush_writes_now(stats, tmpdir):
+    path = str(tmpdir.join("config.json"))
+    writer = JsonWriter(delay=60)
+    writer.write(path, {"value": 1})
+    writer.flush()  # also called at exit
+    assert read(path) == {"value": 1}
+    assert not writer.pending
@@ -0,0 +1,63 @@
+# The headless platform shim: cinbase and the CIN IMEs run without Windows
+
+import os
+import sys
+import time
+
+import pytest
+
+import platformShim
+from conftest import init_msg, key_msg
+
+CHECJ_GUID = "{F828D2DC-81BE-466E-9CFE-24BB03172693}"
+VK_SHIFT = 0x10
+VK_CAPITAL = 0x14
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32" and not platformShim.HEADLESS, reason="uses the real Win32 key state")
+
+
+def test_key_states_come_from_key_events(session):
+    session.send("c1", init_msg())
+    session.send("c1", {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True})
+    msg = key_msg("onKeyDown", "a", 3)
+    msg["keyStates"][VK_SHIFT] = 0x80
+    msg["keyStates"][VK_CAPITAL] = 0x01
+    session.send("c1", msg)
+    assert platformShim.getKeyState(VK_SHIFT) < 0  # the high bit of the SHORT is set
+    assert platformShim.getKeyState(VK_CAPITAL) == 1
+    assert platformShim.isPressed(VK_SHIFT)
+    assert not platformShim.isPressed(VK_CAPITAL)
+
+    # the states of the latest key event replace the previous ones
+    session.send("c1", key_msg("onKeyUp", "a", 4))
+    assert platformShim.getKeyState(VK_SHIFT) == 0
+    assert not platformShim.isPressed(VK_SHIFT)
+
+
+def test_side_effects_are_disabled():
+    assert platformShim.shellExecute("notepad.exe", "", "") == 0
+    platformShim.playSound("SystemExclamation")
+    platformShim.startFile("does-not-exist.txt")
+
+
+def test_data_dir(tmpdir, monkeypatch):
+    monkeypatch.setenv("PIME_DATA_ROOT", str(tmpdir))
+    path = platformShim.getDataDir("checj")
+    assert path == os.path.join(str(tmpdir), "PIME", "checj")
+    assert os.path.isdir(path)
+
+
+def test_cin_ime_runs_headless(session):
+    assert session.send("c1", init_msg(guid=CHECJ_GUID))["success"]
+    session.send("c1", {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True})
+    # the table is loaded in the background, type "a" until it is ready
+    deadline = time.monotonic() + 30
+    while True:
+        reply = session.send("c1", key_msg("onKeyDown", "a", 3))
+        if reply.get("compositionString") or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert reply["compositionString"] == "日"
+    assert "日" in reply["candidateList"]
+    assert os.path.isdir(platformShim.getDataDir("checj"))
+    session.send("c1", {"method": "onDeactivate", "seqNum": 4})
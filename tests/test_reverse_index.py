@@ -0,0 +1,74 @@
+# The reverse index of Cin, RCin and HCin answers like a scan of chardefs
+
+import io
+import os
+import random
+
+import pytest
+
+from conftest import PYTHON_DIR
+from cinbase.cin import Cin
+from cinbase.rcin import RCin
+from cinbase.hcin import HCin
+
+JSON_DIR = os.path.join(PYTHON_DIR, "cinbase", "json")
+
+
+def open_table(cls, name):
+    with io.open(os.path.join(JSON_DIR, name), encoding="utf-8") as fs:
+        if cls is Cin:
+            return Cin(fs, "checj", False)
+        return cls(fs, "checj")
+
+
+def scan_keys(table, char):
+    return [key for key, chars in table.chardefs.items() for c in chars if c == char]
+
+
+def sample_chars(table, count=300):
+    chars = sorted({char for chars in table.chardefs.values() for char in chars})
+    random.seed(0)
+    return random.sample(chars, min(count, len(chars))) + ["not in the table"]
+
+
+@pytest.mark.parametrize("cls, name", [(Cin, "simplex.json"), (RCin, "array30.json"), (HCin, "bpmf.json")])
+def test_lookups_match_scan(cls, name):
+    table = open_table(cls, name)
+    for char in sample_chars(table):
+        keys = scan_keys(table, char)
+        assert table.isHaveKey(char) == bool(keys)
+        assert list(table.getCodes(char)) == keys
+        if keys:
+            assert table.getKey(char) == keys[0]
+        else:
+            with pytest.raises(IndexError):
+                table.getKey(char)
+
+
+def test_hcin_key_list_is_sorted():
+    table = open_table(HCin, "bpmf.json")
+    for char in sample_chars(table):
+        assert table.getKeyList(char) == [key for key, chars in sorted(table.chardefs.items()) if char in chars]
+
+
+def test_char_encode_lists_every_code():
+    table = open_table(RCin, "array30.json")
+    char = next(char for char in sample_chars(table) if len(scan_keys(table, char)) > 1)
+    encode = table.getCharEncode(char)
+    assert encode.startswith(char + ":")
+    assert encode.count("　") == len(scan_keys(table, char))
+    assert table.getCharEncode("not in the table") == ""
+
+
+class ExtendTable(object):
+    def __init__(self, chardefs):
+        self.chardefs = chardefs
+
+
+def test_index_follows_table_changes():
+    table = open_table(Cin, "simplex.json")
+    assert not table.isHaveKey("\U0010fffd")
+    table.updateCinTable(True, False, ExtendTable({"ZZZ": ["\U0010fffd"]}), False)
+    assert table.getCodes("\U0010fffd") == ("zzz",)
+    table.__del__()
+    assert not table.isHaveKey("\U0010fffd")
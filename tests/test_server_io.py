@@ -0,0 +1,65 @@
+# Binary stdin/stdout I/O: requests are read in chunks and replies flushed once per chunk
+
+import io
+import json
+
+import server
+from conftest import init_msg, key_msg
+
+
+# Returns the given chunks from read1(), like a pipe delivering partial writes
+class ChunkedInput(object):
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def read1(self, size):
+        return self.chunks.pop(0) if self.chunks else b""
+
+    read = read1
+
+
+# Records the data written between flushes
+class FlushRecorder(io.BytesIO):
+    def __init__(self):
+        io.BytesIO.__init__(self)
+        self.flushes = []
+        self.flushed = 0
+
+    def flush(self):
+        data = self.getvalue()
+        self.flushes.append(data[self.flushed:])
+        self.flushed = len(data)
+
+
+def request(client_id, msg):
+    return ("%s|%s\n" % (client_id, json.dumps(msg, ensure_ascii=False))).encode("UTF-8")
+
+
+def replies_of(data):
+    return [json.loads(line.split(b"|", 2)[2]) for line in data.splitlines()]
+
+
+def test_lines_split_across_chunks():
+    data = b"".join([b"a|1\n", "b|二\r\n".encode("UTF-8"), b"c|3\n", b"d|4"])
+    for size in range(1, len(data) + 1):
+        chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        srv = server.Server(ChunkedInput(chunks), io.BytesIO())
+        lines = [line for batch in srv.read_batches() for line in batch]
+        # the last line without a newline is still handled at EOF
+        assert lines == [b"a|1", "b|二\r".encode("UTF-8"), b"c|3", b"d|4"], size
+
+
+def test_replies_are_flushed_once_per_chunk(fake_services):
+    first = request("c1", init_msg()) + request("c2", init_msg())
+    key = request("c1", key_msg("onKeyDown", "a", 3))
+    text = request("c1", {"method": "x", "seqNum": 4, "text": "日"})
+    second = request("c1", {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True}) + key[:-3]
+    third = key[-3:] + text[:-5]
+    fourth = text[-5:]  # "日" is split in the middle of its UTF-8 encoding
+    output = FlushRecorder()
+    server.Server(ChunkedInput([first, second, third, fourth]), output).run()
+
+    assert [len(replies_of(data)) for data in output.flushes] == [2, 1, 1, 1]
+    replies = replies_of(output.getvalue())
+    assert [reply["seqNum"] for reply in replies] == [1, 1, 2, 3, 4]
+    assert replies[3]["compositionString"] == "a"
@@ -0,0 +1,98 @@
+# CIN text services share copy-on-write config snapshots and only apply changed settings
+
+import pytest
+
+from serviceManager import textServiceMgr
+from cinbase.config import SharedConfig
+from persistence import jsonWriter
+
+CHECJ_GUID = "{F828D2DC-81BE-466E-9CFE-24BB03172693}"
+
+
+class Client(object):
+    isWindows8Above = True
+    isMetroApp = False
+    isConsole = False
+    protocolExtensions = set()
+
+    def __init__(self, isUiLess=False):
+        self.isUiLess = isUiLess
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = textServiceMgr.createService(Client(), CHECJ_GUID)
+    calls = service.calls = []
+    monkeypatch.setattr(service, "customizeUI", lambda **kwargs: calls.append(("customizeUI", kwargs)))
+    monkeypatch.setattr(service.cinbase, "setOutputSimplifiedChinese",
+                        lambda cbTS, value: calls.append(("setOutputSimplifiedChinese", value)))
+    return service
+
+
+def apply(service, cfg):
+    del service.calls[:]
+    service.cfg = cfg
+    service.cinbase.applyConfig(service)
+    return service.calls
+
+
+def test_services_share_the_snapshot():
+    first = textServiceMgr.createService(Client(), CHECJ_GUID)
+    second = textServiceMgr.createService(Client(), CHECJ_GUID)
+    assert first.sharedConfig is second.sharedConfig
+    assert first.cfg is second.cfg
+
+
+def test_modify_publishes_a_copy(tmpdir, monkeypatch):
+    monkeypatch.setenv("PIME_DATA_ROOT", str(tmpdir))
+    sharedConfig = SharedConfig("checj", ["checj.json"])
+    cfg = sharedConfig.get()
+    written = []
+    monkeypatch.setattr(jsonWriter, "write", lambda path, data: written.append((path, data)))
+
+    modified = sharedConfig.modify(selCinType=1)
+    assert modified is not cfg
+    assert modified.selCinType == 1
+    assert cfg.selCinType == 0
+    assert sharedConfig.get() is modified
+    assert not written
+
+    saved = sharedConfig.modify(save=True, reLoadTable=False)
+    assert [path for path, data in written] == [cfg.getConfigFile()]
+    assert written[0][1]["selCinType"] == 1
+    assert sharedConfig.get() is saved
+
+
+def test_only_changed_settings_are_applied(service):
+    cfg = service.cfg
+    assert service.appliedConfig is cfg
+
+    # the same snapshot is not applied again
+    service.candMaxItems = -1
+    assert apply(service, cfg) == []
+    assert service.candMaxItems == -1
+
+    # plain fields are copied, the UI is not customized again
+    assert apply(service, cfg.replace(candMaxItems=5)) == []
+    assert service.candMaxItems == 5
+    assert service.appliedConfig is service.cfg
+
+    calls = apply(service, service.cfg.replace(fontSize=cfg.fontSize + 4))
+    assert calls == [("customizeUI", {"candFontSize": cfg.fontSize + 4, "candFontName": "MingLiu",
+                                      "candPerRow": cfg.candPerRow, "candUseCursor": cfg.cursorCandList})]
+
+    calls = apply(service, service.cfg.replace(outputSimpChinese=not cfg.outputSimpChinese))
+    assert calls == [("setOutputSimplifiedChinese", not cfg.outputSimpChinese)]
+
+    wildcard = service.cfg.replace(selWildcardType=1 - cfg.selWildcardType)
+    apply(service, wildcard)
+    assert service.selWildcardChar == ("*" if wildcard.selWildcardType == 1 else "z")
+
+
+def test_client_settings_override_the_config(service):
+    service.client = Client(isUiLess=True)
+    apply(service, service.cfg.replace(candPerRow=service.cfg.candPerRow + 1))
+    assert service.candPerRow == 1
+    # the override stays when other settings change
+    apply(service, service.cfg.replace(candMaxItems=7))
+    assert service.candPerRow == 1
@@ -0,0 +1,145 @@
+# Supervisor mode: clients are routed to worker processes by GUID
+
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+import server
+from conftest import PYTHON_DIR, init_msg, key_msg
+
+CHECJ_GUID = "{F828D2DC-81BE-466E-9CFE-24BB03172693}"
+
+
+class FakeProcess(object):
+    pid = 0
+    returncode = 0
+
+    def __init__(self):
+        self.stdin = io.BytesIO()
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    started = []
+
+    # record the replayed requests instead of starting a worker process
+    def start(worker, replay_lines):
+        started.append(replay_lines)
+        worker.process = FakeProcess()
+        worker.reader = True
+    monkeypatch.setattr(server.Worker, "start", start)
+    supervisor = server.SupervisorServer(io.BytesIO(), io.BytesIO())
+    supervisor.started = started
+    return supervisor
+
+
+def send(supervisor, client_id, msg):
+    line = ("%s|%s" % (client_id, json.dumps(msg))).encode("UTF-8")
+    supervisor.handle_line(line)
+    return line
+
+
+def kill(worker):
+    worker.supervisor.worker_exited(worker, worker.process)
+
+
+def test_restart_replays_activation(supervisor):
+    init = send(supervisor, "c1", init_msg(guid=CHECJ_GUID))
+    activate = send(supervisor, "c1", {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True})
+    keyboard = send(supervisor, "c1", {"method": "onKeyboardStatusChanged", "seqNum": 3, "opened": False})
+    send(supervisor, "c1", key_msg("onKeyDown", "a", 4))
+    other = send(supervisor, "c2", init_msg(guid=CHECJ_GUID))
+    worker = supervisor.workers[CHECJ_GUID.lower()]
+    assert supervisor.started == [[]]
+
+    kill(worker)
+    # the pending requests of the dead worker get {success: false}
+    replies = supervisor.output.getvalue().splitlines()
+    assert len(replies) == 5
+    assert all(reply.endswith(b'|{"success":false}') for reply in replies)
+
+    key = send(supervisor, "c1", key_msg("onKeyDown", "b", 5))
+    assert worker.restarts == 1
+    replay = sorted(supervisor.started[1])
+    assert replay == [("c1", init), ("c1", activate), ("c1", keyboard), ("c2", other)]
+    assert worker.process.stdin.getvalue().endswith(key + b"\n")
+
+
+def test_restart_after_deactivation(supervisor):
+    init = send(supervisor, "c1", init_msg(guid=CHECJ_GUID))
+    send(supervisor, "c1", {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True})
+    send(supervisor, "c1", {"method": "onDeactivate", "seqNum": 3})
+    kill(supervisor.workers[CHECJ_GUID.lower()])
+    send(supervisor, "c1", {"method": "onCompartmentChanged", "seqNum": 4, "guid": CHECJ_GUID})
+    assert supervisor.started[1] == [("c1", init)]
+
+
+def test_restart_replays_batched_activation(supervisor):
+    init = send(supervisor, "c1", init_msg(guid=CHECJ_GUID))
+    activate = {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True}
+    send(supervisor, "c1", [activate, key_msg("onKeyDown", "a", 3)])
+    kill(supervisor.workers[CHECJ_GUID.lower()])
+    send(supervisor, "c1", key_msg("onKeyDown", "b", 4))
+    assert supervisor.started[1] == [("c1", init), ("c1", ("c1|" + json.dumps(activate)).encode("UTF-8"))]
+
+
+def test_close_forgets_client(supervisor):
+    send(supervisor, "c1", init_msg(guid=CHECJ_GUID))
+    send(supervisor, "c1", {"method": "close"})
+    assert "c1" not in supervisor.replay_lines
+    assert "c1" not in supervisor.client_workers
+
+
+# Runs "server.py --supervisor" with the real checj text service and kills its worker
+class SupervisorProcess(object):
+    def __init__(self):
+        self.process = subprocess.Popen([sys.executable, "server.py", "--supervisor"], cwd=PYTHON_DIR,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=dict(os.environ))
+
+    def send(self, client_id, msg):
+        self.process.stdin.write(("%s|%s\n" % (client_id, json.dumps(msg))).encode("UTF-8"))
+        self.process.stdin.flush()
+        while True:
+            line = self.process.stdout.readline()
+            assert line, "the supervisor exited"
+            if line.startswith(b"PIME_MSG|"):
+                return json.loads(line.split(b"|", 2)[2])
+
+    # type "a" until the table is loaded
+    def type_key(self, client_id, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            reply = self.send(client_id, key_msg("onKeyDown", "a"))
+            if reply.get("compositionString"):
+                return reply
+            time.sleep(0.1)
+        raise AssertionError("the table is not loaded")
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait(timeout=30)
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="needs SIGKILL")
+def test_killed_worker_is_restarted():
+    supervisor = SupervisorProcess()
+    try:
+        assert supervisor.send("c1", init_msg(guid=CHECJ_GUID))["success"]
+        supervisor.send("c1", {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True})
+        assert supervisor.type_key("c1")["compositionString"] == "日"
+        workers = supervisor.send("c1", {"method": "stats", "seqNum": 3})["stats"]["workers"]
+        os.kill(workers[CHECJ_GUID.lower()]["pid"], signal.SIGKILL)
+        time.sleep(0.5)
+
+        # the composition of the dead worker is lost, the new one starts over
+        assert supervisor.type_key("c1")["compositionString"] == "日"
+        workers = supervisor.send("c1", {"method": "stats", "seqNum": 4})["stats"]["workers"]
+        assert workers[CHECJ_GUID.lower()]["restarts"] == 1
+    finally:
+        supervisor.close()
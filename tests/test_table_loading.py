@@ -0,0 +1,104 @@
+# Loading the shared cin tables in background threads
+
+import threading
+
+import cinbase
+from cinbase import LoadTableThread
+
+
+class Table(object):
+    loading = False
+    future = None
+    failedCinType = None
+
+    def __init__(self):
+        self.cin = None
+        self.curCinType = None
+
+
+class BlockedLoad(LoadTableThread):
+    def __init__(self, table, release, result="table"):
+        LoadTableThread.__init__(self, None, table)
+        self.release = release
+        self.result = result
+
+    def getCinType(self):
+        return 0
+
+    def load(self):
+        self.release.wait(5)
+        if isinstance(self.result, Exception):
+            raise self.result
+        self.table.cin = self.result
+        self.table.curCinType = 0
+
+
+def test_only_one_loader_starts():
+    table = Table()
+    release = threading.Event()
+    barrier = threading.Barrier(8)
+    started = []
+
+    def start():
+        barrier.wait()
+        started.append(BlockedLoad(table, release).start())
+    threads = [threading.Thread(target=start) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(started) == [False] * 7 + [True]
+    assert table.loading
+    release.set()
+    assert table.future.result(5) == "table"
+
+
+class Service(object):
+    cin = None
+
+
+def load(table, result="table", services=()):
+    release = threading.Event()
+    loader = BlockedLoad(table, release, result)
+    assert loader.start()
+    for service in services:
+        cinbase.CinBase.attachCinTable(service, table)
+    # the services wait for the table instead of starting another load
+    assert [service.cin for service in services] == [None] * len(services)
+    assert len(table.callbacks) == len(services)
+    release.set()
+    loader.join(5)
+    return loader
+
+
+def test_waiting_services_get_the_table():
+    table = Table()
+    services = [Service() for i in range(3)]
+    load(table, services=services)
+    assert [service.cin for service in services] == ["table"] * 3
+    assert table.callbacks == []  # the callbacks run once and are not kept
+    assert not table.loading
+    assert cinbase.CinBase.getCinTableError(table) is None
+
+    # a service attached after the load gets the table at once
+    service = Service()
+    cinbase.CinBase.attachCinTable(service, table)
+    assert service.cin == "table"
+
+
+def test_failed_load_is_recorded():
+    table = Table()
+    services = [Service()]
+    error = IOError("broken table")
+    load(table, error, services)
+    assert table.failedCinType == 0
+    assert not table.loading
+    assert table.callbacks == []
+    assert table.future.exception() is error
+    assert cinbase.CinBase.getCinTableError(table) is error
+    assert services[0].cin is None
+
+    # a later successful load clears the failure
+    load(table)
+    assert table.failedCinType is None
+    assert cinbase.CinBase.getCinTableError(table) is None
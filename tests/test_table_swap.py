@@ -0,0 +1,69 @@
+# A reloaded cin table is built in the background and swapped in, typing continues on the old table
+
+import sys
+import threading
+
+import pytest
+
+import cinbase
+from serviceManager import textServiceMgr
+from conftest import key_msg
+
+CHECJ_GUID = "{F828D2DC-81BE-466E-9CFE-24BB03172693}"
+
+
+class Client(object):
+    isWindows8Above = True
+    isMetroApp = False
+    isConsole = False
+    isUiLess = False
+    protocolExtensions = set()
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = textServiceMgr.createService(Client(), CHECJ_GUID)
+    CinTable = sys.modules[type(service).__module__].CinTable
+    CinTable.future.result(30)  # the first table has been loaded
+    service.handleRequest({"method": "onActivate", "seqNum": 1, "isKeyboardOpen": True})
+    # restore the shared table for the other tests
+    for name in ("cin", "curCinType", "future", "failedCinType"):
+        monkeypatch.setattr(CinTable, name, getattr(CinTable, name))
+    service.CinTable = CinTable
+    selCinType = service.cfg.selCinType
+    yield service
+    service.sharedConfig.modify(selCinType=selCinType)
+
+
+def test_typing_continues_while_the_table_reloads(service, monkeypatch):
+    CinTable = service.CinTable
+    old = CinTable.cin
+    assert service.cin is old
+    chardefs = len(old.chardefs)
+
+    release = threading.Event()
+    loadTable = cinbase.loadTable
+
+    def blockedLoadTable(*args):
+        release.wait(5)
+        return loadTable(*args)
+    monkeypatch.setattr(cinbase, "loadTable", blockedLoadTable)
+
+    service.cfg = service.sharedConfig.modify(selCinType=1)
+    loader = cinbase.LoadCinTable(service, CinTable)
+    assert loader.start()
+    try:
+        # the old table is still used while the new one is built
+        assert CinTable.cin is old and service.cin is old
+        service.handleRequest(key_msg("onKeyDown", "a", 2))
+        assert service.compositionString == "日"
+        assert service.candidateList[:len(old.getCharDef("a"))] == old.getCharDef("a")
+    finally:
+        release.set()
+        loader.join(30)
+
+    assert CinTable.future.exception() is None
+    assert CinTable.cin is not old and service.cin is CinTable.cin
+    assert CinTable.curCinType == 1
+    # the old table is not modified by the reload
+    assert len(old.chardefs) == chardefs
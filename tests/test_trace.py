@@ -0,0 +1,64 @@
+# Recording the stdin protocol with PIME_TRACE_FILE and replaying it with benchmarks/replay_trace.py
+
+import io
+import json
+import os
+import sys
+
+import server
+from conftest import PYTHON_DIR, init_msg, key_msg
+
+sys.path.insert(0, os.path.join(PYTHON_DIR, "benchmarks"))
+import replay_trace  # noqa: E402
+
+
+def request(client_id, msg):
+    return ("%s|%s\n" % (client_id, json.dumps(msg))).encode("UTF-8")
+
+
+def record(tmpdir, monkeypatch, lines):
+    trace_file = str(tmpdir.join("trace.log"))
+    monkeypatch.setenv("PIME_TRACE_FILE", trace_file)
+    output = io.BytesIO()
+    srv = server.Server(io.BytesIO(b"".join(lines)), output)
+    srv.run()
+    srv.trace.close()
+    return trace_file, output.getvalue()
+
+
+def test_trace_records_requests_and_replies(fake_services, tmpdir, monkeypatch):
+    lines = [request("c1", init_msg()), b"c2|null\n", request("c1", key_msg("onKeyDown", "a", 2))]
+    trace_file, output = record(tmpdir, monkeypatch, lines)
+    with open(trace_file, "rb") as f:
+        records = [record.rstrip(b"\n").split(b" ", 2) for record in f]
+    assert [kind for kind, timestamp, line in records] == [b"Q", b"R", b"Q", b"R", b"Q", b"R"]
+    timestamps = [int(timestamp) for kind, timestamp, line in records]
+    assert timestamps == sorted(timestamps)
+    assert [line for kind, timestamp, line in records if kind == b"Q"] == [line.rstrip(b"\n") for line in lines]
+    # the replies are recorded as sent, without the "PIME_MSG|" prefix
+    assert [b"PIME_MSG|" + line for kind, timestamp, line in records if kind == b"R"] == output.splitlines()
+
+
+def test_replay_gives_the_recorded_replies(fake_services, tmpdir, monkeypatch):
+    lines = [request("c1", init_msg()), request("c2", init_msg())]
+    lines.append(request("c1", {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True}))
+    lines.append(request("c2", {"method": "onActivate", "seqNum": 2, "isKeyboardOpen": True}))
+    for seq_num, char in enumerate("abc", 3):
+        lines.append(request("c1", key_msg("onKeyDown", char, seq_num)))
+        lines.append(request("c2", key_msg("onKeyDown", char.upper(), seq_num)))
+    lines.append(request("c1", {"method": "stats", "seqNum": 9}))
+    trace_file, output = record(tmpdir, monkeypatch, lines)
+
+    requests, expected = replay_trace.load_trace(trace_file)
+    assert len(requests) == len(lines)
+    assert sorted(expected) == ["c1", "c2"]
+    total, histograms, data = replay_trace.replay(requests, realtime=False)
+    assert histograms["*"].count == len(lines)
+    assert histograms["onKeyDown"].count == 6
+    compared, mismatched = replay_trace.compare_replies(data, expected, 0)
+    assert compared == len(lines) - 1  # the stats reply is not compared
+    assert mismatched == 0
+
+    # a changed reply is reported
+    expected["c1"][-2] = expected["c1"][-2].replace(b'"abc"', b'"abd"')
+    assert replay_trace.compare_replies(data, expected, 0) == (compared, 1)
@@ -0,0 +1,90 @@
+# Text services created in advance by the warm pool of TextServiceManager
+
+import time
+
+import pytest
+
+from serviceManager import TextServiceManager
+from perfStats import perfStats
+from conftest import init_msg
+
+CHECJ_GUID = "{F828D2DC-81BE-466E-9CFE-24BB03172693}"
+
+
+class Client(object):
+    def __init__(self, isUiLess):
+        self.isWindows8Above = True
+        self.isMetroApp = False
+        self.isUiLess = isUiLess
+        self.isConsole = False
+        self.protocolExtensions = set()
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def manager(tmpdir, monkeypatch):
+    monkeypatch.setenv("PIME_MANIFEST_CACHE", str(tmpdir.join("services.json")))
+    monkeypatch.setenv("PIME_WARM_SERVICES", CHECJ_GUID)
+    monkeypatch.setenv("PIME_WARM_IDLE_DELAY", "0.2")
+    return TextServiceManager()
+
+
+def pool_size(manager):
+    return len(manager.warmPools.get(CHECJ_GUID.lower(), ()))
+
+
+def test_warm_service_is_handed_out(manager):
+    assert manager.warmGuids == [CHECJ_GUID.lower()]
+    manager.startWarmUp()
+    wait_for(lambda: pool_size(manager) == 1 and not manager.warmingGuids)
+    warm = manager.warmPools[CHECJ_GUID.lower()][0]
+
+    hits = perfStats.counters.get("warmServiceHits", 0)
+    client = Client(isUiLess=True)
+    service = manager.createService(client, CHECJ_GUID)
+    assert service is warm
+    assert service.client is client
+    assert perfStats.counters["warmServiceHits"] == hits + 1
+    # the settings depending on the client are applied again for the real client
+    assert service.candPerRow == 1
+
+    # the pool is refilled once no request comes for PIME_WARM_IDLE_DELAY seconds
+    assert pool_size(manager) == 0
+    wait_for(lambda: pool_size(manager) == 1)
+    assert manager.warmPools[CHECJ_GUID.lower()][0] is not service
+
+
+def test_refill_waits_for_idle(manager):
+    manager.createService(Client(isUiLess=False), CHECJ_GUID)  # no warm instance yet
+    assert manager.idleWarmUpThread is not None
+    # requests keep coming, the pool is not refilled
+    deadline = time.monotonic() + 0.5
+    while time.monotonic() < deadline:
+        manager.markActive()
+        assert pool_size(manager) == 0 and not manager.warmingGuids
+        time.sleep(0.02)
+    wait_for(lambda: pool_size(manager) == 1)
+
+
+def test_cold_services_are_not_warmed(manager):
+    manager.warmGuids = []
+    service = manager.createService(Client(isUiLess=False), CHECJ_GUID)
+    assert service.candPerRow != 1
+    assert manager.idleWarmUpThread is None
+    assert not manager.warmPools
+
+
+def test_init_gets_the_warm_service(manager, session, monkeypatch):
+    import server
+    monkeypatch.setattr(server, "textServiceMgr", manager)
+    manager.startWarmUp()
+    wait_for(lambda: pool_size(manager) == 1 and not manager.warmingGuids)
+    warm = manager.warmPools[CHECJ_GUID.lower()][0]
+    assert session.send("c1", init_msg(guid=CHECJ_GUID, isUiLess=True))["success"]
+    assert session.server.clients["c1"].service is warm
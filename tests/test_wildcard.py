@@ -0,0 +1,106 @@
+# Wildcard queries are answered from a per-length key index instead of scanning the table
+
+import io
+import os
+import random
+import re
+
+import pytest
+
+from conftest import PYTHON_DIR
+from cinbase.cin import Cin
+from cinbase.cintable import loadTable
+from cinbase.extendtable import extendtable
+from cinbase.wildcard import WildcardIndex
+
+JSON_DIR = os.path.join(PYTHON_DIR, "cinbase", "json")
+KEYS = ["a", "ab", "abc", "abd", "acd", "b.c", "bac", "bbc", "abcd", "axcd", "bcda", "a.cd", "abcde", "dcba"]
+
+
+# a copy of the previous implementation of Cin.getWildcardCharDefs(), sorting and matching all the keys
+def scan_wildcard(cin, CompositionChar, WildcardChar, candMaxItems):
+    wildcardchardefs = []
+    lowFrequencyChardefs = {}
+    highFrequencyCharSetList = ["bopomofo", "bopomofoTone", "cjk", "big5F", "big5LF", "big5S"]
+    lowFrequencyCharSetList = ["cjkExtA", "cjkExtB", "cjkExtC", "cjkExtD", "cjkExtE", "cjkExtF", "cjkCIibm", "pua", "cjkOther"]
+    for i in range(len(lowFrequencyCharSetList)):
+        lowFrequencyChardefs[i] = []
+
+    matchstring = CompositionChar
+    for char in ['\\', '.', '*', '?', '+', '[', '{', '|', '(', ')', '^', '$']:
+        if char in matchstring and not char == WildcardChar:
+            matchstring = matchstring.replace(char, '\\' + char)
+    matchstring = matchstring.replace(WildcardChar, '(.)')
+    sortedchardefs = sorted(cin.chardefs.keys())
+    matchchardefs = [cin.chardefs[key] for key in sortedchardefs
+                     if re.match('^' + matchstring + '$', key) and len(key) == len(CompositionChar)]
+
+    for chardef in matchchardefs:
+        for matchstr in chardef:
+            charSet = cin.getCharSet(matchstr[0])
+            if charSet in highFrequencyCharSetList:
+                wildcardchardefs.append(matchstr)
+                if len(wildcardchardefs) >= candMaxItems:
+                    return wildcardchardefs
+            else:
+                i = lowFrequencyCharSetList.index(charSet)
+                if not matchstr in lowFrequencyChardefs[i]:
+                    lowFrequencyChardefs[i].append(matchstr)
+    for key in lowFrequencyChardefs:
+        for char in lowFrequencyChardefs[key]:
+            if not char in wildcardchardefs:
+                wildcardchardefs.append(char)
+            if len(wildcardchardefs) >= candMaxItems:
+                return wildcardchardefs
+    return wildcardchardefs
+
+
+def scan_keys(pattern, wildcardChar, multiWildcardChar=None):
+    regex = "".join("." if char == wildcardChar else ".*" if char == multiWildcardChar else re.escape(char)
+                    for char in pattern)
+    return sorted(key for key in KEYS if re.match(regex + r"\Z", key))
+
+
+@pytest.mark.parametrize("pattern", ["*", "a*", "*c", "a*c", "**", "***", "a**d", "*.*d", "b.c", "zz", "*****", "******"])
+def test_single_wildcard(pattern):
+    index = WildcardIndex(KEYS)
+    assert list(index.match(pattern, "*")) == scan_keys(pattern, "*")
+
+
+@pytest.mark.parametrize("pattern", ["?", "a?", "?d", "a?d", "?c?", "a*?", "?*d", "a?c?", "*?.*", "b.c?", "??", "z?"])
+def test_multi_wildcard(pattern):
+    index = WildcardIndex(KEYS)
+    # the matching keys of all lengths are returned in key order
+    assert list(index.match(pattern, "*", "?")) == scan_keys(pattern, "*", "?")
+
+
+@pytest.fixture(scope="module")
+def cin(tmp_path_factory):
+    return Cin(loadTable(os.path.join(JSON_DIR, "checj.json"), str(tmp_path_factory.mktemp("cache"))), "checj", True)
+
+
+def test_same_candidates_as_the_scan(cin):
+    random.seed(0)
+    keys = sorted(key for key in cin.chardefs if not "*" in key)
+    patterns = ["*", "**", "a*", "*a", "o*d"]
+    for key in random.sample(keys, 12):
+        chars = list(key)
+        for pos in random.sample(range(len(chars)), random.randint(1, len(chars))):
+            chars[pos] = "*"
+        patterns.append("".join(chars))
+    for pattern in patterns:
+        expected = scan_wildcard(cin, pattern, "*", 100)
+        assert cin.getWildcardCharDefs(pattern, "*", 100) == expected, pattern
+        # fewer candidates are the first ones of the list
+        assert cin.getWildcardCharDefs(pattern, "*", 10) == expected[:10], pattern
+
+
+def test_index_is_rebuilt_with_the_extend_table(tmpdir):
+    cin = Cin(loadTable(os.path.join(JSON_DIR, "checj.json"), str(tmpdir)), "checj", True)
+    index = cin.getWildcardIndex()
+    assert cin.getWildcardIndex() is index  # built once
+    assert cin.getWildcardCharDefs("zzx*", "*", 10) == []
+
+    cin.updateCinTable(True, False, extendtable(io.StringIO("zzxy 測\n")), True)
+    assert cin.getWildcardIndex() is not index
+    assert cin.getWildcardCharDefs("zzx*", "*", 10) == ["測"]